@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Umkreis-Query (AROUND_FILTER) gegen Streifen-Query in scraper_germany.py.
+
+Grundwahrheit sind die zwischengespeicherten Streifen (.cache_overpass)
+bzw. der Elementbestand: daraus entsteht data.json wie in main(). Fuer
+jeden Streifen wird nachgebildet, was Overpass im Umkreis-Modus liefern
+wuerde - Ladepunkte mit einem Lokal im Umkreis von SEARCH_RADIUS_METERS +
+AROUND_MARGIN_METERS, dazu genau diese Lokale - und die Auswertung darauf
+wiederholt. Verglichen werden:
+  Payload      Elemente und Bytes (in der gekuerzten Form aus QUERY_TAGS)
+  Auswertung   Laufzeit von classify bis match_pairs
+  Ergebnis     Treffer in data.json, fehlende und zusaetzliche
+
+Die Nachbildung misst zwischen Mittelpunkten, Overpass zwischen
+Geometrien - genau dafuer ist AROUND_MARGIN_METERS da; --margin zeigt,
+wie viel Zuschlag noetig ist. Im Cache stehen nur relevante Elemente, der
+echte Streifen-Payload ist also noch groesser als hier ausgewiesen.
+
+Mit --live ENDPOINT werden beide Queries je Streifen zusaetzlich wirklich
+gestellt (Serverlaufzeit, Bytes, Elemente). Das kostet Slots - fuer den
+oeffentlichen Server besser nur einzelne Streifen (--strips 3,7).
+
+Aufruf:
+    python3 bench-around.py                         # -> bench_around.json
+    python3 bench-around.py --margin 0,50,100
+    python3 bench-around.py --live https://overpass-api.de/api/interpreter --strips 7
+"""
+
+import os
+import json
+import time
+import argparse
+import datetime
+
+import requests
+
+import scraper_germany as sg
+from spatial_index import SpatialIndex
+
+REPORT_FILE = "bench_around.json"
+REPORT_FORMAT = 1
+
+
+# ============================================================
+# DATENBASIS
+# ============================================================
+
+def load_elements(paths):
+    """Elemente aus Store-/Cache-Dateien, nach (type, id) entdoppelt."""
+    seen = {}
+    for path in paths:
+        try:
+            for el in sg.cache_elements(path):
+                seen[(el.get("type"), el.get("id"))] = el
+        except (OSError, ValueError, EOFError) as exc:
+            print(f"  {path} uebersprungen ({type(exc).__name__})")
+    return list(seen.values())
+
+
+def by_strip(elements, strips):
+    """Elemente je Streifen nach Mittelpunkt, in Eingabereihenfolge."""
+    found = [[] for _ in strips]
+    for el in elements:
+        lat, lon = sg.get_coords(el)
+        if lat is None:
+            continue
+        for i, (south, west, north, east) in enumerate(strips):
+            if south <= lat < north and west <= lon <= east:
+                found[i].append(el)
+                break
+    return found
+
+
+def around_subset(strip_elements, foods, index, radius):
+    """
+    Was Overpass im Umkreis-Modus fuer einen Streifen liefert: die
+    Ladepunkte mit einem Lokal im Umkreis, dann alle Lokale in deren
+    Umkreis - auch jenseits des Streifens.
+    """
+    kept, near = [], {}
+    for el in strip_elements:
+        if sg.classify_element(el) != "charger":
+            continue
+        lat, lon = sg.get_coords(el)
+        hits = index.within(lat, lon, radius)
+        if hits:
+            kept.append(el)
+            for _, food in hits:
+                near[id(food)] = food
+    return kept + [food for food in foods if id(food) in near]
+
+
+# ============================================================
+# MESSUNG
+# ============================================================
+
+def trimmed_size(elements):
+    """Bytes der Elemente in der Form, die die gekuerzte Query liefert."""
+    total = 0
+    for el in elements:
+        tags = {k: v for k, v in el.get("tags", {}).items() if k in sg.QUERY_TAGS}
+        total += len(json.dumps(dict(el, tags=tags), ensure_ascii=False)) + 1
+    return total
+
+
+def evaluate(strip_lists):
+    """Auswertung wie in main(); Rueckgabe (Treffer als Menge, Sekunden)."""
+    start = time.perf_counter()
+    chargers, restaurants = [], []
+    for elements in strip_lists:
+        sg.classify(elements, chargers, restaurants)
+    unique = {}
+    for c in chargers:
+        unique[(c.type, c.id)] = c
+    matches, seen_ids = [], set()
+    for m in sg.match_pairs(sg.deduplicate(list(unique.values())), restaurants):
+        uid = m.pop("unique_id")
+        if uid not in seen_ids:
+            seen_ids.add(uid)
+            matches.append(m)
+    elapsed = time.perf_counter() - start
+    return {json.dumps(m, sort_keys=True, ensure_ascii=False) for m in matches}, elapsed
+
+
+def compare_offline(elements, strips, margin):
+    strip_lists = by_strip(elements, strips)
+    foods = [el for el in elements if sg.classify_element(el) == "food"]
+    lats, lons = zip(*(sg.get_coords(f) for f in foods)) if foods else ((), ())
+    radius = sg.SEARCH_RADIUS_METERS + margin
+    index = SpatialIndex.build(lats, lons, foods, radius)
+    around_lists = [around_subset(s, foods, index, radius) for s in strip_lists]
+
+    # Bestes von drei, damit der erste Durchlauf nicht das Aufwaermen zahlt.
+    truth, t_strips = min((evaluate(strip_lists) for _ in range(3)), key=lambda r: r[1])
+    result, t_around = min((evaluate(around_lists) for _ in range(3)), key=lambda r: r[1])
+    rows = []
+    for i, (a, b) in enumerate(zip(strip_lists, around_lists), 1):
+        rows.append({"strip": i, "elements": len(a), "around": len(b),
+                     "bytes": trimmed_size(a), "around_bytes": trimmed_size(b)})
+    return {
+        "margin": margin,
+        "elements": sum(r["elements"] for r in rows),
+        "around_elements": sum(r["around"] for r in rows),
+        "bytes": sum(r["bytes"] for r in rows),
+        "around_bytes": sum(r["around_bytes"] for r in rows),
+        "evaluate_s": round(t_strips, 3),
+        "around_evaluate_s": round(t_around, 3),
+        "matches": len(truth),
+        "missing": len(truth - result),
+        "extra": len(result - truth),
+        "missing_titles": sorted(json.loads(m)["title"] for m in truth - result)[:10],
+        "strips": rows,
+    }
+
+
+def live(endpoint, strips, chosen):
+    """Beide Queries je Streifen gegen einen echten Server."""
+    rows = []
+    for i in chosen:
+        south, west, north, east = strips[i - 1]
+        bbox = f"{south},{west},{north},{east}"
+        for mode in ("strips", "around"):
+            query = sg.build_query(bbox, around=mode == "around")
+            sg.wait_for_slot(endpoint)
+            t0 = time.time()
+            row = {"strip": i, "mode": mode}
+            try:
+                r = sg.session_for(endpoint).post(
+                    endpoint, data={"data": query}, timeout=sg.HTTP_TIMEOUT)
+                row.update(status=r.status_code, seconds=round(time.time() - t0, 1),
+                           bytes=len(r.content))
+                if r.status_code == 200:
+                    payload = r.json()
+                    row["elements"] = len(payload.get("elements", []))
+                    row["remark"] = payload.get("remark", "")
+            except (requests.RequestException, ValueError) as exc:
+                row.update(error=type(exc).__name__, seconds=round(time.time() - t0, 1))
+            print(f"  [{i}] {mode:<6} {row.get('status', row.get('error'))} "
+                  f"{row['seconds']:>6.1f}s {row.get('bytes', 0) / 1024:>8.0f} KB "
+                  f"{row.get('elements', '-'):>6} Elemente")
+            rows.append(row)
+    return rows
+
+
+# ============================================================
+# BERICHT
+# ============================================================
+
+def print_offline(run):
+    def share(a, b):
+        return f"{b / a:.0%}" if a else "-"
+    print(f"\n  Zuschlag {run['margin']} m "
+          f"(Umkreis {sg.SEARCH_RADIUS_METERS + run['margin']} m):")
+    print(f"    Elemente   {run['elements']:>9} -> {run['around_elements']:>9} "
+          f"({share(run['elements'], run['around_elements'])})")
+    print(f"    Payload    {run['bytes'] / 1024:>7.0f}KB -> {run['around_bytes'] / 1024:>7.0f}KB "
+          f"({share(run['bytes'], run['around_bytes'])})")
+    print(f"    Auswertung {run['evaluate_s']:>8.3f}s -> {run['around_evaluate_s']:>8.3f}s")
+    print(f"    Treffer    {run['matches']:>9}, fehlend {run['missing']}, "
+          f"zusaetzlich {run['extra']}")
+    for title in run["missing_titles"]:
+        print(f"      fehlt: {title}")
+    sparse = sorted(run["strips"], key=lambda r: r["around"] / max(r["elements"], 1))[:3]
+    print("    duennste Streifen: " + ", ".join(
+        f"{r['strip']} ({share(r['elements'], r['around'])})" for r in sparse))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Umkreis-Query gegen Streifen-Query, Cache als Grundwahrheit.")
+    parser.add_argument("--seed", nargs="+", metavar="DATEI",
+                        help="Store-/Cache-Dateien (Standard: Cache, sonst Store)")
+    parser.add_argument("--margin", default=str(sg.AROUND_MARGIN_METERS),
+                        help="Zuschlaege in Metern, kommagetrennt")
+    parser.add_argument("--live", metavar="ENDPOINT",
+                        help="beide Queries zusaetzlich gegen diesen Server")
+    parser.add_argument("--strips", help="nur diese Streifen live, z.B. 3,7")
+    parser.add_argument("--output", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    if args.seed:
+        paths, source = args.seed, "dateien"
+    else:
+        paths, source = [p for p in sg.cache_entries() if sg.cache_readable(p)], "cache"
+        if not paths and os.path.exists(sg.STORE_FILE):
+            paths, source = [sg.STORE_FILE], "store"
+    elements = load_elements(paths)
+    if not elements:
+        print("Keine Datenbasis - erst einen Lauf mit Cache machen oder --seed angeben.")
+        return 1
+    strips = sg.build_strips()
+    print(f"Datenbasis: {source}, {len(elements)} Elemente, {len(strips)} Streifen")
+
+    report = {
+        "format": REPORT_FORMAT,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "seed": {"source": source, "elements": len(elements),
+                 "files": [os.path.basename(p) for p in paths]},
+        "search_radius": sg.SEARCH_RADIUS_METERS,
+        "offline": [],
+    }
+    for margin in [int(m) for m in args.margin.split(",") if m.strip()]:
+        run = compare_offline(elements, strips, margin)
+        report["offline"].append(run)
+        print_offline(run)
+
+    if args.live:
+        chosen = ([int(s) for s in args.strips.split(",")] if args.strips
+                  else range(1, len(strips) + 1))
+        print(f"\nLive gegen {args.live}:")
+        report["live"] = live(args.live, strips, chosen)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nBericht: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
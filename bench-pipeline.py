@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline-Benchmark fuer die Auswertung in scraper_germany.py.
+
+Misst die Stufen, die nach dem Download laufen - ohne Overpass:
+  parse        Overpass-Antwort streamen (iter_elements)
+  classify     Elemente einordnen (classify)
+  deduplicate  nach OSM-ID, dann raeumlich entdoppeln
+  match        Ladepunkte mit Lokalen paaren (match_pairs)
+  write        data.json serialisieren (im OUTPUT_FORMAT)
+
+Datenbasis (in dieser Reihenfolge, oder per --seed):
+  1. element_store.jsonl.gz  - Bestand des letzten vollstaendigen Laufs
+  2. .cache_overpass/*       - zwischengespeicherte Streifen
+  3. synthetisch             - Rastanlagen an den Orten aus data.json plus
+                               Grundrauschen, etwa in deutscher Groessenordnung
+
+Dichte 10x/100x: die Datenbasis wird auf das mittlere 1/k der Breiten
+beschnitten und k-mal mit versetzten Kopien aufgefuellt. So bleibt die
+Elementzahl gleich, aber jeder Punkt hat k-mal so viele Nachbarn - genau
+das, was deduplicate/match teuer macht. Mit --full wird ohne Beschneiden
+vervielfacht (Vorsicht: 100x braucht viele GB).
+
+Mit --check wird statt gemessen verglichen, je Dichte auf derselben
+Datenbasis:
+  engines      pairs_within() (NumPy) gegen within() je Punkt, und
+               deduplicate/match_pairs mit und ohne NumPy
+  nearest      SpatialIndex.nearest() gegen Sortieren aller Abstaende,
+               mit und ohne max_radius
+  pool         classify_pool() gegen die Einordnung im Hauptprozess,
+               bis auf den Text von data.json
+  db           ELEMENT_DB inkrementell gegen volle Neuberechnung, ueber
+               mehrere Runden zufaelliger Aenderungen
+Bei einer Abweichung endet das Programm mit Status 1.
+
+Aufruf:
+    python3 bench-pipeline.py                       # 1x,10x,100x -> bench_report.json
+    python3 bench-pipeline.py --scales 1 --engine both
+    python3 bench-pipeline.py --compare alt.json    # Vergleich mit frueherem Lauf
+    python3 bench-pipeline.py --check --scales 1,10
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import element_db
+import scraper_germany as sg
+from spatial_index import haversine
+
+REPORT_FILE = "bench_report.json"
+REPORT_FORMAT = 1
+CHECK_ROUNDS = 6            # Aenderungsrunden fuer den Datenbank-Vergleich
+CHECK_NEAREST = 200         # Abfragepunkte fuer den nearest()-Vergleich
+STAGES = ["parse", "classify", "deduplicate", "match", "write"]
+
+# Synthetische Datenbasis (1x) wie aus der allgemeinen Query (ohne
+# SERVER_FILTER): alle Ladepunkte, aber nur Lokale, deren Name auf
+# FOOD_REGEX passt.
+SYNTH_SEED = 1
+SYNTH_CHARGERS = 60000
+SYNTH_FOOD = 15000
+SYNTH_SITES = 1500          # ohne data.json: so viele Rastanlagen zufaellig
+
+# Versatz der Kopien beim Verdichten: Zellen dieser Groesse (Grad) werden
+# als Ganzes verschoben, damit Rastanlagen zusammenbleiben.
+JITTER_CELL = 0.02
+JITTER_SPREAD = 0.05
+
+CHARGER_OPERATORS = [
+    "IONITY", "EnBW", "Tesla", "Fastned", "Allego", "Aral pulse",
+    "Stadtwerke", "EWE Go", "E.ON", "Vattenfall", "Mer", "Lidl", "",
+]
+FOOD_NAMES = [
+    "McDonald's", "Burger King", "KFC", "Subway", "Nordsee", "Rewe To Go",
+    "Porsche Lounge", "Tegut teo", "Audi charging hub", "Rewe Markt",
+    "World of Pizza", "Hub Café", "Seed & Greet",
+]
+
+
+# ============================================================
+# DATENBASIS
+# ============================================================
+
+def load_seed(paths):
+    """Elemente aus den angegebenen Dateien, nach (type, id) entdoppelt."""
+    seen = {}
+    for path in paths:
+        try:
+            for el in sg.cache_elements(path):
+                seen[(el.get("type"), el.get("id"))] = el
+        except (OSError, ValueError, EOFError) as exc:
+            print(f"  {path} uebersprungen ({type(exc).__name__})")
+    return list(seen.values())
+
+
+def synthetic_seed(rnd):
+    """
+    Rastanlagen (Ladepunkte + Lokale dicht beieinander) an den Orten aus
+    data.json, dazu Ladepunkte und Lokale verstreut ueber ganz Deutschland.
+    """
+    sites = []
+    try:
+        sites = [(m["lat"], m["lon"]) for m in sg.load_output()]
+    except (OSError, ValueError, KeyError):
+        pass
+    if not sites:
+        sites = [(rnd.uniform(sg.LAT_START, sg.LAT_END),
+                  rnd.uniform(sg.LON_START, sg.LON_END))
+                 for _ in range(SYNTH_SITES)]
+
+    elements, nid = [], 1
+
+    def add(kind, lat, lon, tags):
+        nonlocal nid
+        el = {"type": kind, "id": nid, "tags": tags}
+        if kind == "node":
+            el.update(lat=lat, lon=lon)
+        else:
+            el["center"] = {"lat": lat, "lon": lon}
+        elements.append(el)
+        nid += 1
+
+    def charger(lat, lon):
+        op = rnd.choice(CHARGER_OPERATORS)
+        tags = {"amenity": "charging_station"}
+        if op:
+            tags["operator"] = op
+        if op == "Tesla" and rnd.random() < 0.5:
+            tags["name"] = "Supercharger"
+        if rnd.random() < 0.3:
+            tags["addr:city"] = "Musterstadt"
+        add("node", lat, lon, tags)
+
+    def food(lat, lon):
+        tags = {"amenity": rnd.choice(["fast_food", "restaurant", "cafe"]),
+                "name": rnd.choice(FOOD_NAMES)}
+        add(rnd.choice(["node", "way"]), lat, lon, tags)
+
+    n_site_chargers = min(SYNTH_CHARGERS // 4, len(sites) * 4)
+    n_site_food = min(SYNTH_FOOD // 3, len(sites) * 2)
+    for i in range(n_site_chargers):
+        lat, lon = sites[i % len(sites)]
+        charger(lat + rnd.gauss(0, 0.0002), lon + rnd.gauss(0, 0.0003))
+    for i in range(n_site_food):
+        lat, lon = sites[i % len(sites)]
+        food(lat + rnd.gauss(0, 0.002), lon + rnd.gauss(0, 0.003))
+
+    # Grundrauschen in Ballungen, nicht gleichverteilt
+    towns = [(rnd.uniform(sg.LAT_START, sg.LAT_END),
+              rnd.uniform(sg.LON_START, sg.LON_END)) for _ in range(2000)]
+    for _ in range(SYNTH_CHARGERS - n_site_chargers):
+        lat, lon = rnd.choice(towns)
+        charger(lat + rnd.gauss(0, 0.03), lon + rnd.gauss(0, 0.045))
+    for _ in range(SYNTH_FOOD - n_site_food):
+        lat, lon = rnd.choice(towns)
+        food(lat + rnd.gauss(0, 0.03), lon + rnd.gauss(0, 0.045))
+    return elements
+
+
+def densify(seed, scale, rnd, full=False):
+    """
+    k-fache Dichte: mittleres 1/k der Breiten behalten (ausser full) und
+    k-mal kopieren, jede Kopie zellweise leicht versetzt.
+    """
+    if scale <= 1:
+        return list(seed)
+    located = [el for el in seed if sg.get_coords(el)[0] is not None]
+    if not full:
+        located.sort(key=lambda el: sg.get_coords(el)[0])
+        keep = max(1, len(located) // scale)
+        start = (len(located) - keep) // 2
+        located = located[start:start + keep]
+
+    max_id = max((el.get("id", 0) for el in seed), default=0) + 1
+    out = list(located)
+    for copy in range(1, scale):
+        shifts = {}
+        for el in located:
+            lat, lon = sg.get_coords(el)
+            cell = (int(lat // JITTER_CELL), int(lon // JITTER_CELL))
+            if cell not in shifts:
+                shifts[cell] = (rnd.uniform(-JITTER_SPREAD, JITTER_SPREAD),
+                                rnd.uniform(-JITTER_SPREAD, JITTER_SPREAD) * 1.5)
+            dlat, dlon = shifts[cell]
+            clone = dict(el, id=el.get("id", 0) + copy * max_id)
+            if "center" in el:
+                clone["center"] = {"lat": lat + dlat, "lon": lon + dlon}
+            else:
+                clone["lat"], clone["lon"] = lat + dlat, lon + dlon
+            out.append(clone)
+    return out
+
+
+def as_response(elements):
+    """Elemente als Overpass-Antwort in Bloecken, wie sie vom Server kommen."""
+    body = json.dumps({
+        "version": 0.6,
+        "generator": "bench-pipeline",
+        "osm3s": {"timestamp_osm_base": "2026-01-01T00:00:00Z"},
+        "elements": elements,
+    }, ensure_ascii=False).encode("utf-8")
+    size = sg.STREAM_CHUNK_SIZE
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+# ============================================================
+# MESSUNG
+# ============================================================
+
+def run_pipeline(chunks, probe):
+    """
+    Einmal alle Stufen wie in main(). probe(stage) liefert einen
+    Kontextmanager, der die Stufe misst.
+    """
+    counts = {}
+    with probe("parse"):
+        elements = list(sg.iter_elements(chunks))
+    counts["elements"] = len(elements)
+
+    chargers, restaurants = [], []
+    with probe("classify"):
+        sg.classify(elements, chargers, restaurants)
+    counts["chargers"], counts["restaurants"] = len(chargers), len(restaurants)
+    del elements
+
+    with probe("deduplicate"):
+        unique = {}
+        for c in chargers:
+            unique[(c.type, c.id)] = c
+        chargers = sg.deduplicate(list(unique.values()))
+    counts["unique"] = len(chargers)
+
+    with probe("match"):
+        matches, seen_ids = [], set()
+        for m in sg.match_pairs(chargers, restaurants):
+            uid = m.pop("unique_id")
+            if uid not in seen_ids:
+                seen_ids.add(uid)
+                matches.append(m)
+    counts["matches"] = len(matches)
+
+    with probe("write"):
+        text = sg.output_text(matches)
+    counts["output_kb"] = len(text.encode("utf-8")) // 1024
+    return counts
+
+
+class Timer:
+    def __init__(self):
+        self.times = {}
+
+    def __call__(self, stage):
+        timer = self
+
+        class _Probe:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                timer.times[stage] = time.perf_counter() - self.start
+        return _Probe()
+
+
+class MemoryProbe:
+    """Spitzenverbrauch je Stufe ueber dem Stand beim Betreten (tracemalloc)."""
+
+    def __init__(self):
+        self.peaks = {}
+
+    def __call__(self, stage):
+        probe = self
+
+        class _Probe:
+            def __enter__(self):
+                self.base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+
+            def __exit__(self, *exc):
+                peak = tracemalloc.get_traced_memory()[1]
+                probe.peaks[stage] = max(0, peak - self.base)
+        return _Probe()
+
+
+def bench(elements, repeat, memory=True):
+    chunks = as_response(elements)
+    runs = []
+    for _ in range(repeat):
+        timer = Timer()
+        counts = run_pipeline(chunks, timer)
+        runs.append(timer.times)
+
+    stages = {}
+    for stage in STAGES:
+        values = [r[stage] for r in runs]
+        stages[stage] = {"best": round(min(values), 4),
+                         "median": round(statistics.median(values), 4)}
+
+    if memory:
+        # Eigener Durchlauf - tracemalloc bremst zu sehr fuer die Zeitmessung.
+        tracemalloc.start()
+        mem = MemoryProbe()
+        run_pipeline(chunks, mem)
+        tracemalloc.stop()
+        for stage in STAGES:
+            stages[stage]["peak_mb"] = round(mem.peaks[stage] / 2**20, 1)
+
+    counts["total_best"] = round(sum(s["best"] for s in stages.values()), 4)
+    return counts, stages
+
+
+# ============================================================
+# PRUEFUNG
+# ============================================================
+
+def classified(elements):
+    """Ladepunkte und Lokale wie in main(), ohne die Eingabe zu veraendern."""
+    return sg.classify_batch(copy.deepcopy(elements))
+
+
+def matches_of(chargers, restaurants):
+    """Treffer wie in main(): nach OSM-ID, dann raeumlich entdoppelt."""
+    unique = {}
+    for c in chargers:
+        unique[(c.type, c.id)] = c
+    matches, seen_ids = [], set()
+    for m in sg.match_pairs(sg.deduplicate(list(unique.values())), restaurants):
+        uid = m.pop("unique_id")
+        if uid not in seen_ids:
+            seen_ids.add(uid)
+            matches.append(m)
+    return matches
+
+
+def place_rows(places):
+    return [tuple(getattr(p, slot) for slot in sg.Place.__slots__) for p in places]
+
+
+def check_engines(elements):
+    """NumPy- und Python-Pfad muessen dieselben Paare und Treffer liefern."""
+    if sg.numpy is None:
+        return None, "NumPy fehlt"
+    chargers, restaurants = classified(elements)
+    index = sg.SpatialIndex.build([f.lat for f in restaurants], [f.lon for f in restaurants],
+                                  range(len(restaurants)), sg.SEARCH_RADIUS_METERS)
+    q, t, dist = index.pairs_within([c.lat for c in chargers], [c.lon for c in chargers],
+                                    sg.SEARCH_RADIUS_METERS)
+    bulk = list(zip(q.tolist(), t.tolist()))
+    single = [(i, idx) for i, c in enumerate(chargers)
+              for _, idx in index.within(c.lat, c.lon, sg.SEARCH_RADIUS_METERS)]
+    if bulk != single:
+        return False, f"pairs_within {len(bulk)} Paare, within {len(single)}"
+
+    use_numpy = sg.USE_NUMPY
+    try:
+        results = []
+        for flag in (False, True):
+            sg.USE_NUMPY = flag
+            results.append(sg.output_text(matches_of(*classified(elements))))
+    finally:
+        sg.USE_NUMPY = use_numpy
+    if results[0] != results[1]:
+        return False, "Treffer unterscheiden sich"
+    data = json.loads(results[0])
+    count = len(data) if isinstance(data, list) else len(data["lat"])
+    return True, f"{len(bulk)} Paare, {count} Treffer"
+
+
+def check_nearest(elements, rnd):
+    """nearest() muss genau die k naechsten liefern, auch bei wenig Treffern."""
+    chargers, restaurants = classified(elements)
+    if not chargers or not restaurants:
+        return None, "keine Ladepunkte oder Lokale"
+    index = sg.SpatialIndex.build([f.lat for f in restaurants], [f.lon for f in restaurants],
+                                  range(len(restaurants)), sg.SEARCH_RADIUS_METERS)
+    queries = [(c.lat, c.lon) for c in rnd.sample(chargers, min(CHECK_NEAREST, len(chargers)))]
+    # Auch Punkte abseits der Daten, wo die Suche viele Ringe braucht.
+    queries += [(lat + rnd.uniform(-1, 1), lon + rnd.uniform(-1, 1)) for lat, lon in queries[:20]]
+    for lat, lon in queries:
+        every = sorted((haversine(lat, lon, f.lat, f.lon), idx)
+                       for idx, f in enumerate(restaurants))
+        for k in (1, 5, 50):
+            for max_radius in (None, sg.SEARCH_RADIUS_METERS):
+                want = [hit for hit in every
+                        if max_radius is None or hit[0] <= max_radius][:k]
+                if index.nearest(lat, lon, k, max_radius) != want:
+                    return False, f"k={k}, max_radius={max_radius} bei {lat},{lon}"
+    return True, f"{len(queries)} Punkte, k=1/5/50"
+
+
+def check_pool(elements):
+    """Einordnung im Prozesspool wie im Hauptprozess, bis auf den Ausgabetext."""
+    serial = classified(elements)
+    processes = sg.CLASSIFY_PROCESSES
+    sg.CLASSIFY_PROCESSES = 2
+    try:
+        # Mindestens vier Bloecke, damit auch die Reihenfolge beim
+        # Zusammenfuehren geprueft wird.
+        size = min(sg.CLASSIFY_BATCH, max(1, len(elements) // 4))
+        pool = sg.classify_pool()
+        batches = [pool.submit(sg.classify_batch, elements[i:i + size])
+                   for i in range(0, len(elements), size)]
+        pooled = [], []
+        for future in batches:
+            chargers, restaurants = future.result()
+            pooled[0].extend(chargers)
+            pooled[1].extend(restaurants)
+        pool.shutdown()
+    finally:
+        sg.CLASSIFY_PROCESSES = processes
+    if place_rows(serial[0]) != place_rows(pooled[0]) or \
+            place_rows(serial[1]) != place_rows(pooled[1]):
+        return False, "Place-Datensaetze unterscheiden sich"
+    if sg.output_text(matches_of(*serial)) != sg.output_text(matches_of(*pooled)):
+        return False, "data.json unterscheidet sich"
+    return True, f"{len(batches)} Bloecke, {len(serial[0])} Ladepunkte"
+
+
+def edit_round(elements, rnd):
+    """Eine Runde zufaelliger Aenderungen: loeschen, verschieben, umbenennen, neu."""
+    elements = copy.deepcopy(elements)
+    max_id = max((el.get("id", 0) for el in elements), default=0)
+    for _ in range(rnd.choice([3, 20, 60])):
+        op, el = rnd.random(), rnd.choice(elements)
+        if op < 0.25:
+            elements.remove(el)
+            continue
+        if op < 0.7:
+            target = el
+        else:
+            max_id += 1
+            target = dict(copy.deepcopy(el), id=max_id)
+            elements.append(target)
+        if op < 0.5 or op >= 0.7:
+            d = rnd.choice([0.00005, 0.0002, 0.002])
+            coords = target["center"] if "center" in target else target
+            coords["lat"] += rnd.uniform(-d, d)
+            coords["lon"] += rnd.uniform(-d, d)
+        else:
+            target.setdefault("tags", {})["name"] = rnd.choice(
+                ["McDonald's", "Burger King", "Tesla Supercharger", "xyz", "Starbucks"])
+    return elements
+
+
+def check_db(elements, rounds, rnd):
+    """ELEMENT_DB nach jeder Runde gegen die volle Neuberechnung im Speicher."""
+    if not element_db.available():
+        return None, "SQLite ohne R-Tree"
+    folder = tempfile.mkdtemp(prefix="bench-db-")
+    db_file, use_db = sg.ELEMENT_DB, sg.USE_ELEMENT_DB
+    sg.ELEMENT_DB = os.path.join(folder, "elements.sqlite")
+    sg.USE_ELEMENT_DB = True
+    try:
+        current = sorted(elements, key=lambda el: (el["type"], el["id"]))
+        for step in range(rounds + 1):
+            if step:
+                current = sorted(edit_round(current, rnd), key=lambda el: (el["type"], el["id"]))
+            chargers, restaurants = classified(current)
+            _, matches = sg.db_update(chargers, restaurants, f"2026-01-01T00:00:{step:02d}Z",
+                                      True, "bench")
+            truth = matches_of(*classified(current))
+            if sorted(json.dumps(m, sort_keys=True) for m in matches) != \
+                    sorted(json.dumps(m, sort_keys=True) for m in truth):
+                return False, f"Runde {step}: {len(matches)} statt {len(truth)} Treffer"
+    finally:
+        sg.ELEMENT_DB, sg.USE_ELEMENT_DB = db_file, use_db
+        shutil.rmtree(folder, ignore_errors=True)
+    return True, f"{rounds} Runden, {len(truth)} Treffer"
+
+
+def run_checks(seed, scales, rounds):
+    """Alle Vergleiche je Dichte; True, wenn nichts abweicht."""
+    ok = True
+    for scale in scales:
+        elements = densify(seed, scale, random.Random(scale))
+        print(f"  {scale:>3}x  {len(elements)} Elemente")
+        for name, check in (("engines", lambda: check_engines(elements)),
+                            ("nearest", lambda: check_nearest(elements, random.Random(scale))),
+                            ("pool", lambda: check_pool(elements)),
+                            ("db", lambda: check_db(elements, rounds, random.Random(scale)))):
+            t0 = time.perf_counter()
+            result, detail = check()
+            status = {True: "ok", False: "FEHLER", None: "uebersprungen"}[result]
+            print(f"        {name:<12} {status:<13} {time.perf_counter() - t0:6.1f}s  {detail}")
+            ok = ok and result is not False
+    return ok
+
+
+# ============================================================
+# BERICHT
+# ============================================================
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux meldet KiB, macOS Bytes
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def print_run(run):
+    print(f"  {run['scale']:>3}x {run['engine']:<6} "
+          f"{run['elements']:>8} Elemente, {run['unique']:>6} Ladepunkte, "
+          f"{run['matches']:>6} Treffer")
+    for stage in STAGES:
+        s = run["stages"][stage]
+        mem = f"{s['peak_mb']:>8.1f} MB" if "peak_mb" in s else ""
+        print(f"        {stage:<12} {s['best']:>8.3f}s  (Median {s['median']:.3f}s){mem}")
+    print(f"        {'gesamt':<12} {run['total_best']:>8.3f}s")
+
+
+def compare(report, old_path):
+    """Gegenueberstellung mit einem frueheren Bericht (gleiche scale/engine)."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    before = {(r["scale"], r["engine"]): r for r in old.get("runs", [])}
+    print(f"\nVergleich mit {old_path} ({old.get('commit') or '?'} -> "
+          f"{report.get('commit') or '?'}):")
+    if old.get("seed") != report.get("seed"):
+        print("  ACHTUNG: andere Datenbasis, Zahlen nur bedingt vergleichbar")
+    for run in report["runs"]:
+        prev = before.get((run["scale"], run["engine"]))
+        if not prev:
+            continue
+        print(f"  {run['scale']:>3}x {run['engine']}")
+        for stage in STAGES + ["total"]:
+            if stage == "total":
+                a, b = prev["total_best"], run["total_best"]
+            else:
+                a = prev["stages"].get(stage, {}).get("best")
+                b = run["stages"][stage]["best"]
+            if not a or b is None:
+                continue
+            print(f"        {stage:<12} {a:>8.3f}s -> {b:>8.3f}s  ({b / a:5.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline-Benchmark der Auswertung (ohne Overpass).")
+    parser.add_argument("--seed", nargs="+", metavar="DATEI",
+                        help="Store-/Cache-Dateien als Datenbasis")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="immer synthetische Datenbasis verwenden")
+    parser.add_argument("--scales", default="1,10,100",
+                        help="Dichtefaktoren, kommagetrennt (Standard 1,10,100)")
+    parser.add_argument("--full", action="store_true",
+                        help="ohne Beschneiden vervielfachen (sehr speicherhungrig)")
+    parser.add_argument("--engine", choices=["auto", "python", "numpy", "both"],
+                        default="auto", help="Pfad fuer deduplicate/match")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Speichermessung auslassen")
+    parser.add_argument("--output", default=REPORT_FILE)
+    parser.add_argument("--compare", metavar="BERICHT",
+                        help="frueheren Bericht gegenueberstellen")
+    parser.add_argument("--check", action="store_true",
+                        help="NumPy/Python, Prozesspool und Datenbank gegen "
+                             "die einfache Rechnung pruefen statt messen")
+    parser.add_argument("--rounds", type=int, default=CHECK_ROUNDS,
+                        help="Aenderungsrunden fuer die Datenbank-Pruefung")
+    args = parser.parse_args()
+
+    rnd = random.Random(SYNTH_SEED)
+    if args.seed:
+        paths, source = args.seed, "dateien"
+    elif args.synthetic:
+        paths, source = [], "synthetisch"
+    elif os.path.exists(sg.STORE_FILE):
+        paths, source = [sg.STORE_FILE], "store"
+    else:
+        paths, source = [p for p in sg.cache_entries() if sg.cache_readable(p)], "cache"
+
+    seed = load_seed(paths) if paths else []
+    if not seed:
+        source = "synthetisch"
+        seed = synthetic_seed(rnd)
+    print(f"Datenbasis: {source}, {len(seed)} Elemente")
+
+    if args.check:
+        scales = [int(s) for s in args.scales.split(",") if s.strip()]
+        return 0 if run_checks(seed, scales, args.rounds) else 1
+
+    if args.engine == "both":
+        engines = ["python", "numpy"]
+    elif args.engine == "auto":
+        engines = ["numpy" if sg.numpy_enabled() else "python"]
+    else:
+        engines = [args.engine]
+    if "numpy" in engines and sg.numpy is None:
+        print("NumPy fehlt - nur Python-Pfad.")
+        engines = ["python"]
+
+    report = {
+        "format": REPORT_FORMAT,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": getattr(sg.numpy, "__version__", None),
+        "seed": {"source": source, "elements": len(seed),
+                 "files": [os.path.basename(p) for p in paths]},
+        "config": {
+            "full": args.full,
+            "repeat": args.repeat,
+            "search_radius": sg.SEARCH_RADIUS_METERS,
+            "dedup_radius": sg.DEDUP_RADIUS_METERS,
+            "food_options": sg.FOOD_OPTIONS,
+        },
+        "runs": [],
+    }
+
+    use_numpy = sg.USE_NUMPY
+    for scale in [int(s) for s in args.scales.split(",") if s.strip()]:
+        elements = densify(seed, scale, random.Random(scale), full=args.full)
+        for engine in engines:
+            sg.USE_NUMPY = engine == "numpy"
+            counts, stages = bench(elements, max(1, args.repeat),
+                                   memory=not args.no_memory)
+            run = dict(scale=scale, engine=engine, **counts, stages=stages)
+            report["runs"].append(run)
+            print_run(run)
+    sg.USE_NUMPY = use_numpy
+
+    report["max_rss_mb"] = max_rss_mb()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nBericht: {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
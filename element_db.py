@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+Elementbestand in SQLite (Ladestoppfinder).
+
+Haelt die klassifizierten Ladepunkte und Lokale ueber Laeufe hinweg - je
+OSM-Typ/ID mit Version, Zeitstempel, Lage und Einordnung - samt R-Tree
+fuer Umkreisabfragen. sync() gleicht das Ergebnis eines Laufs ab und
+meldet, wo sich etwas geaendert hat; nur dort muessen deduplicate() und
+match_pairs() neu rechnen. Fruehere Fassungen geaenderter und
+verschwundener Elemente landen in history (abschaltbar, prune_history()
+haelt sie kurz), jeder Lauf in runs.
+
+    db = ElementDB("elements.sqlite")
+    dirty = db.sync(chargers, foods, osm_base, complete=True)
+                                           -> [(kind, id_key, lat, lon), ...]
+    db.near(lat, lon, 300, kind="food")                  -> [(dist, element), ...]
+    db.elements(kind="charger", kept=True)               -> Elemente nach (type, id)
+    db.set_matches(keys, matches)
+    db.prune_history("2025-10-01")                        -> geloeschte Fassungen
+
+sync() nimmt Datensaetze mit den Attributen type, id, lat, lon, id_key,
+name, badge, version, timestamp und tags() (scraper_germany.Place);
+Abfragen liefern, was record aus einer Zeile macht - ohne record ein
+Element im Format von "out center" plus clean_info/id_key. Ohne
+R-Tree-Modul in SQLite ist available() False.
+"""
+
+import json
+import math
+import time
+import sqlite3
+
+from spatial_index import haversine, EARTH_RADIUS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS elements (
+    pk          INTEGER PRIMARY KEY,
+    type        TEXT NOT NULL,
+    id          INTEGER NOT NULL,
+    version     INTEGER,
+    timestamp   TEXT,
+    kind        TEXT,
+    id_key      TEXT,
+    clean_info  TEXT,
+    lat         REAL NOT NULL,
+    lon         REAL NOT NULL,
+    tags        TEXT NOT NULL,
+    kept        INTEGER NOT NULL DEFAULT 0,
+    first_seen  TEXT,
+    last_seen   TEXT,
+    removed     TEXT,
+    UNIQUE (type, id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS elements_rtree
+    USING rtree(pk, min_lat, max_lat, min_lon, max_lon);
+CREATE TABLE IF NOT EXISTS history (
+    type        TEXT NOT NULL,
+    id          INTEGER NOT NULL,
+    version     INTEGER,
+    timestamp   TEXT,
+    kind        TEXT,
+    id_key      TEXT,
+    lat         REAL,
+    lon         REAL,
+    tags        TEXT,
+    valid_from  TEXT,
+    valid_to    TEXT,
+    action      TEXT
+);
+CREATE INDEX IF NOT EXISTS history_key ON history (type, id);
+CREATE TABLE IF NOT EXISTS matches (
+    type        TEXT NOT NULL,
+    id          INTEGER NOT NULL,
+    data        TEXT NOT NULL,
+    PRIMARY KEY (type, id)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run         INTEGER PRIMARY KEY,
+    osm_base    TEXT,
+    created     REAL,
+    source      TEXT,
+    elements    INTEGER,
+    added       INTEGER,
+    changed     INTEGER,
+    removed     INTEGER,
+    matches     INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+"""
+
+COLUMNS = ("pk, type, id, version, timestamp, kind, id_key, clean_info, "
+           "lat, lon, tags, kept, first_seen, last_seen, removed")
+
+
+def available():
+    """True, wenn das eingebaute SQLite R-Trees kann."""
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING rtree(id, a, b, c, d)")
+        conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _box(lat, lon, radius):
+    """Suchrechteck um einen Punkt, etwas grosszuegiger als der Radius."""
+    dlat = math.degrees(radius / EARTH_RADIUS) * 1.01 + 1e-6
+    worst = min(abs(lat) + dlat, 89.9)
+    dlon = dlat / math.cos(math.radians(worst))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def as_element(row):
+    """Zeile als Element im Overpass-Format (Standard fuer record)."""
+    el = {"type": row["type"], "id": row["id"]}
+    if row["type"] == "node":
+        el["lat"], el["lon"] = row["lat"], row["lon"]
+    else:
+        el["center"] = {"lat": row["lat"], "lon": row["lon"]}
+    tags = json.loads(row["tags"])
+    if tags:
+        el["tags"] = tags
+    if row["version"] is not None:
+        el["version"] = row["version"]
+    if row["timestamp"] is not None:
+        el["timestamp"] = row["timestamp"]
+    if row["clean_info"] is not None:
+        el["clean_info"] = json.loads(row["clean_info"])
+        el["id_key"] = row["id_key"]
+    return el
+
+
+class ElementDB:
+    def __init__(self, path, record=as_element):
+        self.path = path
+        self.record = record
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --------------------------------------------------------
+    # Zeilen <-> Elemente
+    # --------------------------------------------------------
+
+    @staticmethod
+    def _row(p, kind):
+        return {
+            "type": p.type, "id": p.id, "version": p.version, "timestamp": p.timestamp,
+            "kind": kind, "id_key": p.id_key,
+            "clean_info": _dumps({"name": p.name, "class": p.badge}),
+            "lat": p.lat, "lon": p.lon, "tags": _dumps(p.tags()),
+        }
+
+    # --------------------------------------------------------
+    # Abgleich
+    # --------------------------------------------------------
+
+    def sync(self, chargers, foods, osm_base, complete=False, source=None, history=True):
+        """
+        Uebernimmt die eingeordneten Datensaetze eines Laufs. Mit complete
+        gelten alle nicht mehr gelieferten Elemente als entfernt; ohne
+        history wandern alte Fassungen nicht nach history.
+        Rueckgabe: geaenderte Stellen als (kind, id_key, lat, lon) - alte
+        und neue Lage -, leer, wenn alles gleich geblieben ist.
+        """
+        cur = self.conn.cursor()
+        existing = {(row["type"], row["id"]): row
+                    for row in cur.execute(f"SELECT {COLUMNS} FROM elements")}
+        dirty, touched, seen = [], [], set()
+        added = changed = removed = 0
+        compare = ("version", "kind", "id_key", "clean_info", "lat", "lon", "tags")
+
+        with self.conn:
+            for kind, p in ([("charger", c) for c in chargers]
+                            + [("food", f) for f in foods]):
+                key = (p.type, p.id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                row = self._row(p, kind)
+                if row["lat"] is None:
+                    continue
+                old = existing.get(key)
+                if old is None:
+                    pk = cur.execute(
+                        "INSERT INTO elements (type, id, version, timestamp, kind, id_key, "
+                        "clean_info, lat, lon, tags, first_seen, last_seen) VALUES "
+                        "(:type, :id, :version, :timestamp, :kind, :id_key, :clean_info, "
+                        ":lat, :lon, :tags, :seen, :seen)", dict(row, seen=osm_base)).lastrowid
+                    self._index(cur, pk, row["lat"], row["lon"])
+                    dirty.append((row["kind"], row["id_key"], row["lat"], row["lon"]))
+                    added += 1
+                    continue
+                if old["removed"] is None and all(old[c] == row[c] for c in compare):
+                    touched.append((osm_base, old["pk"]))
+                    continue
+                if old["removed"] is None:
+                    if history:
+                        self._archive(cur, old, osm_base, "modify")
+                    dirty.append((old["kind"], old["id_key"], old["lat"], old["lon"]))
+                    changed += 1
+                else:
+                    added += 1
+                cur.execute(
+                    "UPDATE elements SET version=:version, timestamp=:timestamp, kind=:kind, "
+                    "id_key=:id_key, clean_info=:clean_info, lat=:lat, lon=:lon, tags=:tags, "
+                    "last_seen=:seen, removed=NULL, kept=0 WHERE pk=:pk",
+                    dict(row, seen=osm_base, pk=old["pk"]))
+                cur.execute("DELETE FROM elements_rtree WHERE pk=?", (old["pk"],))
+                self._index(cur, old["pk"], row["lat"], row["lon"])
+                dirty.append((row["kind"], row["id_key"], row["lat"], row["lon"]))
+
+            cur.executemany("UPDATE elements SET last_seen=? WHERE pk=?", touched)
+
+            if complete:
+                for key, old in existing.items():
+                    if key in seen or old["removed"] is not None:
+                        continue
+                    if history:
+                        self._archive(cur, old, osm_base, "delete")
+                    cur.execute("UPDATE elements SET removed=?, kept=0 WHERE pk=?",
+                                (osm_base, old["pk"]))
+                    cur.execute("DELETE FROM elements_rtree WHERE pk=?", (old["pk"],))
+                    dirty.append((old["kind"], old["id_key"], old["lat"], old["lon"]))
+                    removed += 1
+
+            cur.execute(
+                "INSERT INTO runs (osm_base, created, source, elements, added, changed, "
+                "removed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (osm_base, time.time(), source, len(seen), added, changed, removed))
+        self.last_sync = {"added": added, "changed": changed, "removed": removed}
+        return dirty
+
+    @staticmethod
+    def _index(cur, pk, lat, lon):
+        cur.execute("INSERT INTO elements_rtree VALUES (?, ?, ?, ?, ?)",
+                    (pk, lat, lat, lon, lon))
+
+    @staticmethod
+    def _archive(cur, old, valid_to, action):
+        cur.execute(
+            "INSERT INTO history (type, id, version, timestamp, kind, id_key, lat, lon, "
+            "tags, valid_from, valid_to, action) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (old["type"], old["id"], old["version"], old["timestamp"], old["kind"],
+             old["id_key"], old["lat"], old["lon"], old["tags"], old["first_seen"],
+             valid_to, action))
+
+    def prune_history(self, before=None):
+        """
+        Loescht alte Fassungen mit valid_to vor osm_base before, ohne before
+        alle. Rueckgabe: Zahl der geloeschten Zeilen.
+        """
+        with self.conn:
+            if before is None:
+                return self.conn.execute("DELETE FROM history").rowcount
+            return self.conn.execute("DELETE FROM history WHERE valid_to < ?",
+                                     (before,)).rowcount
+
+    def reclassify(self, classify):
+        """
+        Ordnet alle aktuellen Elemente neu ein (classify wie
+        classify_element). Rueckgabe: Zahl der geaenderten Einordnungen.
+        """
+        rows = self.conn.execute(f"SELECT {COLUMNS} FROM elements WHERE removed IS NULL")
+        updates = []
+        for row in rows.fetchall():
+            el = as_element(row)
+            el.pop("clean_info", None)
+            el.pop("id_key", None)
+            kind = classify(el)
+            new = (kind, el.get("id_key"),
+                   _dumps(el["clean_info"]) if "clean_info" in el else None)
+            if new != (row["kind"], row["id_key"], row["clean_info"]):
+                updates.append(new + (row["pk"],))
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE elements SET kind=?, id_key=?, clean_info=? WHERE pk=?", updates)
+        return len(updates)
+
+    # --------------------------------------------------------
+    # Abfragen
+    # --------------------------------------------------------
+
+    def elements(self, kind=None, kept=None, keys=None):
+        """Aktuelle Elemente nach (type, id) sortiert."""
+        sql = f"SELECT {COLUMNS} FROM elements WHERE removed IS NULL"
+        args = []
+        if kind is not None:
+            sql += " AND kind=?"
+            args.append(kind)
+        if kept is not None:
+            sql += " AND kept=?"
+            args.append(int(kept))
+        rows = self.conn.execute(sql + " ORDER BY type, id", args)
+        if keys is None:
+            return [self.record(row) for row in rows]
+        keys = set(keys)
+        return [self.record(row) for row in rows if (row["type"], row["id"]) in keys]
+
+    def near(self, lat, lon, radius, kind=None, id_key=None, kept=None, strict=False):
+        """Aktuelle Elemente im Umkreis als (dist, element), nach Abstand."""
+        s, n, w, e = _box(lat, lon, radius)
+        sql = (f"SELECT {', '.join('e.' + c.strip() for c in COLUMNS.split(','))} "
+               "FROM elements_rtree r JOIN elements e ON e.pk = r.pk "
+               "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?")
+        args = [s, n, w, e]
+        for column, value in (("kind", kind), ("id_key", id_key), ("kept", kept)):
+            if value is not None:
+                sql += f" AND e.{column}=?"
+                args.append(int(value) if column == "kept" else value)
+        found = []
+        for row in self.conn.execute(sql, args):
+            dist = haversine(lat, lon, row["lat"], row["lon"])
+            if dist < radius or (dist == radius and not strict):
+                found.append((dist, row["type"], row["id"], row))
+        found.sort(key=lambda f: f[:3])
+        return [(dist, self.record(row)) for dist, _, _, row in found]
+
+    def set_kept(self, keys, kept):
+        """kept-Flag fuer keys setzen: True fuer alle in kept, sonst False."""
+        kept = set(kept)
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE elements SET kept=? WHERE type=? AND id=?",
+                [(int(key in kept),) + tuple(key) for key in keys])
+
+    def set_matches(self, keys, matches):
+        """
+        Ersetzt die Treffer der Ladepunkte keys durch matches {key: dict}.
+        Treffer von Ladepunkten, die nicht mehr behalten werden, entfallen.
+        """
+        with self.conn:
+            self.conn.executemany("DELETE FROM matches WHERE type=? AND id=?",
+                                  [tuple(key) for key in keys])
+            self.conn.executemany(
+                "INSERT INTO matches (type, id, data) VALUES (?, ?, ?)",
+                [tuple(key) + (_dumps(m),) for key, m in matches.items()])
+            self.conn.execute(
+                "DELETE FROM matches WHERE NOT EXISTS (SELECT 1 FROM elements e "
+                "WHERE e.type = matches.type AND e.id = matches.id AND e.removed IS NULL "
+                "AND e.kind = 'charger' AND e.kept)")
+
+    def matches(self):
+        """Alle Treffer in der Reihenfolge der Ladepunkte."""
+        rows = self.conn.execute("SELECT data FROM matches ORDER BY type, id")
+        return [json.loads(row["data"]) for row in rows]
+
+    def finish_run(self, matches):
+        """Trefferzahl am letzten Lauf vermerken."""
+        with self.conn:
+            self.conn.execute("UPDATE runs SET matches=? WHERE run=(SELECT MAX(run) FROM runs)",
+                              (matches,))
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def runs(self, limit=20):
+        rows = self.conn.execute("SELECT * FROM runs ORDER BY run DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+    def history(self, since=None):
+        """Geaenderte/entfernte Fassungen, optional nur ab osm_base since."""
+        sql = "SELECT * FROM history"
+        args = []
+        if since:
+            sql += " WHERE valid_to >= ?"
+            args.append(since)
+        return [dict(row) for row in self.conn.execute(sql + " ORDER BY valid_to, type, id", args)]
+
+    def counts(self):
+        row = self.conn.execute(
+            "SELECT SUM(removed IS NULL AND kind='charger'), "
+            "SUM(removed IS NULL AND kind='charger' AND kept), "
+            "SUM(removed IS NULL AND kind='food'), SUM(removed IS NOT NULL), "
+            "(SELECT COUNT(*) FROM matches), (SELECT COUNT(*) FROM history) "
+            "FROM elements").fetchone()
+        return dict(zip(("chargers", "kept", "foods", "removed", "matches", "history"),
+                        (v or 0 for v in row)))
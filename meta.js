@@ -1 +0,0 @@
-const standDaten = "August 2026";
\ No newline at end of file
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lokaler Overpass-Ersatz fuer reproduzierbare Testlaeufe ohne Netz.
+
+Beantwortet Queries aus dem Strip-Cache (.cache_overpass) und dem
+Elementbestand (element_store.jsonl.gz):
+  - exakt dieselbe Query wie im Cache -> die aufgezeichnete Antwort
+  - sonst (z.B. halbierte Streifen)   -> alle bekannten Elemente in der bbox
+  - [adiff:]-Query                    -> leerer Diff zum aktuellen Stand
+Den Markenfilter fuer Ladepunkte und das convert der gefilterten Query
+(SERVER_FILTER) bildet er nach; mit --no-convert lehnt er es ab wie ein
+aelterer Server.
+
+Dazu verhaelt er sich wie ein oeffentlicher Server:
+  /api/status     "Rate limit: N", freie Slots bzw. "Slot available after"
+  /api/timestamp  OSM-Stand der Daten
+  Slots           mehr gleichzeitige Queries als --slots -> 429, nach jeder
+                  Query ist der Slot --cooldown Sekunden gesperrt
+  Stoerungen      429 mit Retry-After, 504, langsame Antworten, "runtime
+                  error" im remark, abgeschnittene Antworten, 200 ohne
+                  Elemente (wie osm.ch) - zufaellig mit festen Raten oder als
+                  feste Folge
+
+Aufruf:
+    python3 mock-overpass.py --slots 2 --faults 429=0.1,504=0.05,slow=0.1
+    python3 mock-overpass.py --sequence ok,504,504,ok,429   # wiederholt sich
+
+Der Mock liest alles beim Start ein. Den Scraper dann mit leerem Cache
+dagegen laufen lassen, sonst fragt er gar nicht erst:
+    OVERPASS_ENDPOINTS=http://127.0.0.1:8555/api/interpreter \\
+    OVERPASS_CACHE_DIR=/tmp/mock-leer python3 scraper_germany.py
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import datetime
+import threading
+import collections
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import scraper_germany as sg
+
+PORT = 8555
+FAULT_KINDS = ["ok", "429", "504", "slow", "remark", "truncate", "empty"]
+CHUNK_SIZE = 64 * 1024
+
+BBOX_RE = re.compile(r"\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)")
+# Serverfilter und convert aus sg.build_query() - nur diese Formen.
+FILTER_RE = re.compile(r'nwr\.ladepunkte\["([^"]+)"~"([^"]+)",i\]')
+CONVERT_RE = re.compile(r'"([^"]+)"=t\["[^"]+"\]')
+
+
+# ============================================================
+# DATEN
+# ============================================================
+
+class Recording:
+    """Aufgezeichnete Antworten je Query plus Elementpool fuer bbox-Abfragen."""
+
+    def __init__(self, paths):
+        self.by_query = {}
+        self.pool = {}
+        self.osm_base = None
+        for path in paths:
+            self._load(path)
+        self.pool = list(self.pool.values())
+
+    def _load(self, path):
+        header = sg.cache_header(path)
+        if header is None:
+            return
+        try:
+            elements = list(sg.cache_elements(path))
+        except (OSError, ValueError, EOFError):
+            print(f"  {path} unlesbar, uebersprungen")
+            return
+        for el in elements:
+            self.pool[(el.get("type"), el.get("id"))] = el
+        if header.get("query"):
+            self.by_query[header["query"]] = elements
+        if header.get("osm_base") and (self.osm_base is None
+                                       or header["osm_base"] > self.osm_base):
+            self.osm_base = header["osm_base"]
+
+    def answer(self, query):
+        """Elemente fuer eine Query; bbox-Filter, wenn sie nicht aufgezeichnet ist."""
+        if query in self.by_query:
+            return self.by_query[query], "aufgezeichnet"
+        m = BBOX_RE.search(query)
+        if not m:
+            return [], "leer"
+        s, w, n, e = map(float, m.groups())
+        found = []
+        for el in self.pool:
+            lat, lon = sg.get_coords(el)
+            if lat is not None and s <= lat <= n and w <= lon <= e:
+                found.append(el)
+        return found, "bbox"
+
+
+def server_filter(elements, query):
+    """Ladepunkte wie Overpass nach den Regex-Filtern der Query auslesen."""
+    filters = [(key, re.compile(regex, re.I)) for key, regex in FILTER_RE.findall(query)]
+    if not filters:
+        return elements
+    return [el for el in elements
+            if el.get("tags", {}).get("amenity") != "charging_station"
+            or any(rx.search(el["tags"].get(key, "")) for key, rx in filters)]
+
+
+def convert(elements, query):
+    """Ausgabe von "convert osm ... ; out geom" nachbilden."""
+    keys = CONVERT_RE.findall(query)
+    converted = []
+    for el in elements:
+        lat, lon = sg.get_coords(el)
+        tags = el.get("tags", {})
+        item = {"type": "osm", "id": el["id"],
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "tags": {"@type": el["type"]}}
+        if "version()" in query:
+            item["tags"]["@version"] = str(el.get("version", ""))
+            item["tags"]["@timestamp"] = el.get("timestamp", "")
+        # Overpass setzt auch fehlende Tags, dann mit leerem Wert.
+        item["tags"].update((key, tags.get(key, "")) for key in keys)
+        converted.append(item)
+    return converted
+
+
+# ============================================================
+# SLOTS UND STOERUNGEN
+# ============================================================
+
+class Slots:
+    """
+    Wie Overpass: je Client-IP N Slots. Ein Slot ist belegt, solange eine
+    Query laeuft, und danach noch cooldown Sekunden.
+    """
+
+    def __init__(self, limit, cooldown):
+        self.limit = limit
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.free_at = collections.defaultdict(lambda: [0.0] * max(limit, 1))
+
+    def acquire(self, client):
+        """Slot-Nummer oder (None, Sekunden bis zum naechsten freien Slot)."""
+        if self.limit == 0:
+            return 0, 0
+        now = time.time()
+        with self.lock:
+            slots = self.free_at[client]
+            for i, t in enumerate(slots):
+                if t <= now:
+                    slots[i] = math.inf
+                    return i, 0
+            # Laufen alle Slots noch, ist das Ende unbekannt - dann eben
+            # die Cooldown-Zeit als Schaetzung.
+            soonest = min(slots)
+            wait = soonest - now if soonest < math.inf else self.cooldown
+            return None, max(1, math.ceil(wait))
+
+    def release(self, client, slot):
+        if self.limit == 0:
+            return
+        with self.lock:
+            self.free_at[client][slot] = time.time() + self.cooldown
+
+    def status(self, client):
+        now = time.time()
+        lines = [f"Rate limit: {self.limit}"]
+        if self.limit == 0:
+            return lines + ["0 slots available now."]
+        with self.lock:
+            slots = list(self.free_at[client])
+        free = sum(1 for t in slots if t <= now)
+        if free:
+            lines.append(f"{free} slots available now.")
+        for t in sorted(slots):
+            if now < t < math.inf:
+                stamp = datetime.datetime.fromtimestamp(t, datetime.timezone.utc)
+                lines.append(f"Slot available after: {stamp:%Y-%m-%dT%H:%M:%SZ}, "
+                             f"in {math.ceil(t - now)} seconds.")
+        return lines
+
+
+class Schedule:
+    """Welche Stoerung die naechste Query trifft - feste Folge oder Raten."""
+
+    def __init__(self, rates=None, sequence=None, seed=1):
+        self.rates = rates or {}
+        self.sequence = sequence
+        self.rnd = random.Random(seed)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            n = self.count
+            self.count += 1
+            if self.sequence:
+                return self.sequence[n % len(self.sequence)]
+            roll = self.rnd.random()
+        for kind, rate in self.rates.items():
+            if roll < rate:
+                return kind
+            roll -= rate
+        return "ok"
+
+
+def parse_faults(text):
+    rates = {}
+    for part in filter(None, (p.strip() for p in (text or "").split(","))):
+        kind, _, rate = part.partition("=")
+        if kind not in FAULT_KINDS or kind == "ok":
+            raise argparse.ArgumentTypeError(f"unbekannte Stoerung: {kind}")
+        rates[kind] = float(rate)
+    if sum(rates.values()) > 1:
+        raise argparse.ArgumentTypeError("Raten zusammen ueber 1")
+    return rates
+
+
+def parse_sequence(text):
+    seq = [p.strip() for p in text.split(",") if p.strip()]
+    for kind in seq:
+        if kind not in FAULT_KINDS:
+            raise argparse.ArgumentTypeError(f"unbekannte Stoerung: {kind}")
+    return seq
+
+
+# ============================================================
+# SERVER
+# ============================================================
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, recording, slots, schedule, args):
+        super().__init__(address, Handler)
+        self.recording = recording
+        self.slots = slots
+        self.schedule = schedule
+        self.args = args
+        self.stats = collections.Counter()
+        self.print_lock = threading.Lock()
+
+    def log(self, msg):
+        with self.print_lock:
+            print(f"{datetime.datetime.now():%H:%M:%S} {msg}", flush=True)
+
+    def handle_error(self, request, client_address):
+        # Clients, die Keep-Alive-Verbindungen einfach schliessen, sind
+        # normal und kein Grund fuer einen Traceback.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "mock-overpass/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # --- Routing ---
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.endswith("/status"):
+            return self.send_status()
+        if url.path.endswith("/timestamp"):
+            return self.send_text(200, (self.osm_base() + "\n"))
+        if url.path.endswith("/interpreter"):
+            query = urllib.parse.parse_qs(url.query).get("data", [""])[0]
+            return self.interpret(query)
+        self.send_text(404, "not found\n")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", "replace")
+        query = urllib.parse.parse_qs(body).get("data", [""])[0]
+        self.interpret(query)
+
+    # --- Antworten ---
+
+    def osm_base(self):
+        return (self.server.args.osm_base or self.server.recording.osm_base
+                or "2026-01-01T00:00:00Z")
+
+    def send_text(self, code, text, headers=None, content_type="text/plain"):
+        data = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_status(self):
+        client = self.client_address[0]
+        lines = [f"Connected as: {abs(hash(client)) % 10**9}",
+                 f"Current time: {datetime.datetime.now(datetime.timezone.utc):%Y-%m-%dT%H:%M:%SZ}",
+                 "Announced endpoint: none"]
+        lines += self.server.slots.status(client)
+        lines.append("Currently running queries (pid, space limit, time limit, start time):")
+        self.send_text(200, "\n".join(lines) + "\n")
+
+    def send_stream(self, data, content_type, truncate=False):
+        """
+        In Bloecken schreiben; --trickle bremst wie eine langsame Leitung.
+        truncate kuendigt die volle Laenge an und trennt nach der Haelfte -
+        wie ein Server, der mitten in der Antwort abbricht.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if truncate:
+            data = data[:len(data) // 2]
+            self.close_connection = True
+        for i in range(0, len(data), CHUNK_SIZE):
+            self.wfile.write(data[i:i + CHUNK_SIZE])
+            if self.server.args.trickle:
+                time.sleep(self.server.args.trickle)
+
+    def interpret(self, query):
+        srv, args = self.server, self.server.args
+        client = self.client_address[0]
+        t0 = time.time()
+        label = "adiff" if "[adiff:" in query else (
+            ",".join(BBOX_RE.search(query).groups()) if BBOX_RE.search(query) else "?")
+
+        if "User-Agent" not in self.headers:
+            srv.stats["406"] += 1
+            srv.log(f"{label} -> 406 (ohne User-Agent)")
+            return self.send_text(406, "Not Acceptable\n")
+
+        if args.no_convert and "convert " in query:
+            srv.stats["400"] += 1
+            srv.log(f"{label} -> 400 (convert abgelehnt)")
+            return self.send_text(
+                400, "Error: line 1: parse error: Unknown type \"convert\"\n")
+
+        slot, wait = srv.slots.acquire(client)
+        if slot is None:
+            srv.stats["429"] += 1
+            srv.log(f"{label} -> 429 (kein Slot, Retry-After {wait})")
+            return self.send_text(429, "Too Many Requests\n", {"Retry-After": str(wait)})
+
+        try:
+            kind = srv.schedule.next()
+            time.sleep(args.latency)
+            if kind == "429":
+                srv.stats["429"] += 1
+                srv.log(f"{label} -> 429 (geplant, Retry-After {args.retry_after})")
+                return self.send_text(429, "Too Many Requests\n",
+                                      {"Retry-After": str(args.retry_after)})
+            if kind == "504":
+                time.sleep(args.abort_after)
+                srv.stats["504"] += 1
+                srv.log(f"{label} -> 504 (geplant)")
+                return self.send_text(
+                    504, "<html><body><p>The server is probably too busy to "
+                    "handle your request.</p></body></html>\n",
+                    content_type="text/html")
+            if kind == "slow":
+                time.sleep(args.slow)
+
+            if "[adiff:" in query:
+                body = (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                        f'<osm version="0.6" generator="mock-overpass">\n'
+                        f'<meta osm_base="{self.osm_base()}"/>\n</osm>\n')
+                srv.stats["200"] += 1
+                srv.log(f"{label} -> 200 (leerer Diff)")
+                return self.send_stream(body.encode("utf-8"), "application/osm3s+xml",
+                                        truncate=kind == "truncate")
+
+            elements, source = srv.recording.answer(query)
+            elements = server_filter(elements, query)
+            if "convert " in query:
+                elements = convert(elements, query)
+            if kind == "empty":
+                elements = []
+            payload = {
+                "version": 0.6,
+                "generator": "mock-overpass",
+                "osm3s": {"timestamp_osm_base": self.osm_base(),
+                          "copyright": "Daten aus lokalem Cache"},
+                "elements": elements,
+            }
+            if kind == "remark":
+                payload["remark"] = ("runtime error: Query timed out in \"query\" "
+                                     "at line 3 after 300 seconds.")
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_stream(data, "application/json", truncate=kind == "truncate")
+            srv.stats["200" if kind in ("ok", "slow") else kind] += 1
+            srv.log(f"{label} -> 200 {kind} ({len(elements)} Elemente, {source}, "
+                    f"{time.time() - t0:.1f}s)")
+        except (BrokenPipeError, ConnectionResetError):
+            srv.stats["abgebrochen"] += 1
+            srv.log(f"{label} -> Client hat abgebrochen")
+        finally:
+            srv.slots.release(client, slot)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Lokaler Overpass-Ersatz aus dem Strip-Cache.")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--cache", nargs="*", metavar="DATEI",
+                        help="Cache-/Store-Dateien (Standard: CACHE_DIR und STORE_FILE)")
+    parser.add_argument("--slots", type=int, default=2,
+                        help="Rate limit je Client, 0 = unbegrenzt (Standard 2)")
+    parser.add_argument("--cooldown", type=float, default=0,
+                        help="Sperrzeit eines Slots nach jeder Query in Sekunden")
+    parser.add_argument("--faults", type=parse_faults, default={},
+                        help="Raten, z.B. 429=0.1,504=0.05,slow=0.1,remark=0.02,"
+                             "truncate=0.01,empty=0.05")
+    parser.add_argument("--sequence", type=parse_sequence,
+                        help="feste Folge statt Raten, z.B. ok,504,504,429")
+    parser.add_argument("--seed", type=int, default=1, help="Zufallsstart fuer --faults")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Grundlaufzeit jeder Query in Sekunden")
+    parser.add_argument("--slow", type=float, default=20.0,
+                        help="Zusatzzeit fuer 'slow' in Sekunden")
+    parser.add_argument("--abort-after", type=float, default=0.0,
+                        help="Laufzeit bis zum 504 in Sekunden")
+    parser.add_argument("--retry-after", type=int, default=5,
+                        help="Retry-After bei geplantem 429")
+    parser.add_argument("--trickle", type=float, default=0.0,
+                        help="Pause je 64-KB-Block beim Senden")
+    parser.add_argument("--osm-base", help="OSM-Stand, der gemeldet wird")
+    parser.add_argument("--no-convert", action="store_true",
+                        help="gefilterte Query mit 400 ablehnen (alter Server)")
+    args = parser.parse_args()
+
+    paths = args.cache if args.cache is not None else (
+        [p for p in sg.cache_entries() if sg.cache_readable(p)] + [sg.STORE_FILE])
+    recording = Recording(paths)
+    print(f"Aufzeichnung: {len(recording.by_query)} Queries, "
+          f"{len(recording.pool)} Elemente, Stand {recording.osm_base or '-'}")
+
+    schedule = Schedule(args.faults, args.sequence, args.seed)
+    server = MockServer((args.host, args.port), recording,
+                        Slots(args.slots, args.cooldown), schedule, args)
+    print(f"Lauscht auf http://{args.host}:{args.port}/api/interpreter "
+          f"(Slots: {args.slots or 'unbegrenzt'}, Cooldown: {args.cooldown:g}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("\nAntworten: " + ", ".join(f"{k}: {v}" for k, v in
+                                          sorted(server.stats.items())))
+
+
+if __name__ == "__main__":
+    main()
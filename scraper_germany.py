@@ -20,26 +20,120 @@ Weitere Erkenntnisse aus dem Test, die hier umgesetzt sind:
   - private.coffee und kumi.systems liefern mit UA nur ReadTimeouts -> raus
   - osm.ch antwortet 200 mit 0 Elementen -> gefaehrlich, raus
   - overpass-api.de ist die einzige verlaessliche Quelle
+
+Ergaenzungen seit v3:
+  - Streifen werden parallel geladen, so viele wie die Server Slots melden
+    (fetch_strips). Die feste Pause zwischen den Streifen entfaellt.
+  - Antworten werden gestreamt und beim Lesen klassifiziert; nur relevante
+    Elemente bleiben im Speicher (iter_elements, STREAM_RESPONSES).
+  - Cache: komprimiert, je Query-Hash eine Datei mit Kopfzeile (Endpoint,
+    OSM-Stand, Anzahl). Ansehen/aufraeumen: scraper_germany.py cache ls|prune
+  - Auf Wunsch inkrementell (INCREMENTAL): nach einem vollstaendigen Lauf
+    liegt der Elementbestand in element_store.jsonl.gz, danach reicht ein
+    [adiff:] seit dessen OSM-Stand.
+  - deduplicate/match_pairs suchen ueber spatial_index.SpatialIndex, dessen
+    Zellgroesse aus den Radien folgt. Mit NumPy werden alle Abstaende
+    gebuendelt gerechnet; Python bleibt als Rueckfall (USE_NUMPY).
+  - Je Ladepunkt bis zu FOOD_OPTIONS Lokale (je Marke das naechste) unter
+    "foods"; der Filter in index.html prueft alle.
+  - Bricht Overpass einen Streifen ab (504), wird er halbiert statt
+    wiederholt. Die Tiefe landet in strip_splits.json fuer den naechsten Lauf.
+  - Die Stichwort-Tabellen werden beim Import einmal zu flachen Regellisten
+    in Prioritaetsreihenfolge kompiliert (compile_classifier).
+  - Endpoints und Cache-Verzeichnis lassen sich per Umgebung umbiegen
+    (OVERPASS_ENDPOINTS, OVERPASS_CACHE_DIR), z.B. auf mock-overpass.py.
+  - Je Endpoint ein eigener Verbindungspool (session_for) und ein
+    SlotMonitor, der /api/status im Hintergrund abfragt; die Worker warten
+    auf dessen Stand statt vor jedem POST selbst nachzufragen.
+  - Statt reihum zu rotieren, bewertet EndpointHealth jeden Server nach
+    Latenz, Durchsatz, Fehlern und leeren Antworten (endpoint_health.json);
+    der Dispatcher gibt jeden Streifen dem Server mit der kuerzesten
+    erwarteten Zeit.
+  - Auf Wunsch: haengt ein Streifen laenger als das p90 seiner bisherigen
+    Laufzeiten, laedt ihn ein zweiter Server parallel; die erste Antwort
+    gewinnt, die andere Anfrage wird abgebrochen (HEDGE_REQUESTS).
+  - Auf Wunsch werden Ladepunkte schon auf dem Server nach Marke gefiltert,
+    und nur die ausgewerteten Tags kommen zurueck (SERVER_FILTER, QUERY_TAGS).
+    Optional nur Ladepunkte mit Lokal im Umkreis (AROUND_FILTER).
+  - Alternativ zu Overpass ein lokaler OSM-Extrakt (PBF_FILE, pyosmium),
+    z.B. germany-latest.osm.pbf - ohne Netz und Rate-Limits.
+  - classify() behaelt statt der Overpass-Elemente nur kompakte
+    Place-Datensaetze (Lage, Marke, Name, QUERY_TAGS als Tupel); der
+    Speicher waechst mit den relevanten Objekten, nicht mit dem Download.
+  - Auf Wunsch ist data.json spaltenweise und minifiziert, das Popup-HTML
+    entsteht dann erst in index.html (OUTPUT_FORMAT).
+  - Auf Wunsch dieselben Treffer als Kacheln in tiles/; die Karte laedt
+    dann nur die sichtbaren (OUTPUT_TILES).
+  - Auf Wunsch Daten und Kacheln mit Inhalts-Hash im Namen
+    (data.<hash>.json), dazu manifest.json mit Hash, Zahlen, Zeitpunkt und
+    OSM-Stand (OUTPUT_HASHED). Die Seite fragt dann nur das Manifest neu
+    an, alles andere bleibt im Cache.
+  - Auf Wunsch ordnen mehrere Prozesse die Streifen ein
+    (CLASSIFY_PROCESSES), z.B. fuer Cache-Wiederholungen und PBF-Importe.
+  - Auf Wunsch liegen Einordnung, Entdopplung und Treffer mit Version,
+    Zeitstempel und Verlauf (DB_HISTORY_DAYS) in elements.sqlite
+    (USE_ELEMENT_DB, ELEMENT_DB); neu gerechnet wird nur rund um
+    Geaendertes. Abfragen: scraper_germany.py db stats|history|near|rebuild
 """
 
 import os
+import re
 import sys
 import json
+import gzip
+import codecs
 import math
 import time
+import queue
 import random
+import socket
 import hashlib
 import datetime
+import threading
+import argparse
+import collections
+import multiprocessing
+import concurrent.futures
+from xml.etree import ElementTree
 
 import requests
+import urllib3
 
-# LibreSSL-Warnung von urllib3 unter macOS/Python 3.9 unterdruecken.
-# Sie ist harmlos, macht die Logs aber unlesbar.
+import element_db
+from spatial_index import SpatialIndex
+
+# zstd packt die Cache-Dateien kleiner und schneller als gzip, ist aber
+# optional. Ohne das Paket wird gzip verwendet.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# NumPy beschleunigt die Abstandsberechnung in deduplicate/match_pairs,
+# ist aber ebenfalls optional - ohne laeuft die reine Python-Variante.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# brotli fuer die vorkomprimierte Kopie data.json.br - ohne Paket gibt es
+# nur data.json.gz.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# pyosmium liest einen lokalen OSM-Extrakt (PBF_FILE) statt Overpass.
+# Nur dafuer noetig, daher ebenfalls optional.
 try:
-    import urllib3
-    urllib3.disable_warnings()
+    import osmium
+    import osmium.filter
 except ImportError:
-    pass
+    osmium = None
+
+# LibreSSL-Warnung von urllib3 unter macOS/Python 3.9 unterdruecken.
+# Sie ist harmlos, macht die Logs aber unlesbar.
+urllib3.disable_warnings()
 
 # ============================================================
 # KONFIGURATION
@@ -54,9 +148,89 @@ LON_START, LON_END = 5.5, 15.5
 STRIP_HEIGHT = 0.6
 
 SEARCH_RADIUS_METERS = 300
+# So viele Lokale (je Marke das naechste) bekommt ein Ladepunkt mit.
+FOOD_OPTIONS = 3
+DEDUP_RADIUS_METERS = 30
+
+# Abstaende je Rasterzelle gebuendelt mit NumPy rechnen (falls installiert).
+USE_NUMPY = True
 OUTPUT_FILENAME = "data.json"
+
+# "compact": data.json spaltenweise und ohne Leerraum - nur Lage, Anbieter,
+# Name und die Lokale (Marke, Name, Abstand); Badge und Popup baut
+# index.html selbst. "full": wie frueher je Treffer ein Objekt mit
+# fertigem HTML. Dazu auf Wunsch vorkomprimierte Kopien (.gz, mit brotli
+# auch .br) fuer Server mit gzip_static/brotli_static. Vorerst bleibt es
+# bei "full" ohne Kopien - andere Leser von data.json erwarten das alte
+# Format; index.html versteht beide.
+OUTPUT_FORMAT = "full"
+OUTPUT_COMPRESSED = False
+COORD_DECIMALS = 6          # ~0.1 m
+
+# Zusaetzlich je Kachel (Slippy-Map-Schema, Zoom TILE_ZOOM) eine Datei im
+# kompakten Format unter TILE_DIR; die belegten Kacheln stehen im
+# Manifest. index.html laedt dann nur, was im Kartenausschnitt liegt.
+# z8 = ca. 1.4 Grad Laenge je Kachel, Deutschland sind gut 50 Kacheln.
+# Vorerst aus; ohne Kacheln laedt die Karte wie bisher alles auf einmal.
+# Nur mit OUTPUT_HASHED - die Kacheln stehen im Manifest.
+OUTPUT_TILES = False
+TILE_DIR = "tiles"
+TILE_ZOOM = 8
+
+# Veroeffentlicht wird unter Inhalts-Hash: data.<hash>.json und
+# tiles/<zoom>-<x>-<y>.<hash>.json aendern sich nie und duerfen beliebig
+# lange im Browser/CDN liegen. MANIFEST_FILE (klein, wird immer neu
+# geprueft) nennt die aktuellen Namen. Dateien des vorigen Manifests
+# bleiben einen Lauf lang liegen, fuer Seiten, die es noch offen haben.
+# data.json unter festem Namen bleibt fuer Werkzeuge und alte Seiten.
+# Vorerst aus: nur data.json, Manifest und Hash-Dateien frueherer Laeufe
+# werden entfernt - index.html faellt dann auf data.json zurueck.
+OUTPUT_HASHED = False
+MANIFEST_FILE = "manifest.json"
+HASH_LENGTH = 12
+
+# Streifen-Cache fuer Wiederholungen kurz hintereinander (Abbruch,
+# Testlaeufe am selben Tag). Die monatliche Action behaelt ihn nicht:
+# Nach einem Monat ist kein Eintrag mehr frisch, und der OSM-Stand der
+# Server ist laengst ein anderer.
 CACHE_DIR = ".cache_overpass"
 CACHE_TTL_HOURS = 20
+CACHE_FORMAT = 2
+
+# Inkrementeller Modus: Der letzte vollstaendige Lauf hinterlaesst alle
+# relevanten Elemente samt OSM-Stand in STORE_FILE. Danach genuegt eine
+# [adiff:]-Query fuer die Aenderungen seitdem. Ist der Stand zu alt oder
+# haben sich Query/Schluesselwoerter geaendert, gibt es wieder einen
+# vollen Scan. Vorerst aus: jeder Lauf scannt voll wie bisher. Beim
+# Einschalten committet die Action STORE_FILE schon mit.
+INCREMENTAL = False
+STORE_FILE = "element_store.jsonl.gz"
+STORE_MAX_AGE_DAYS = 92
+
+# Klassifizierte Elemente, Treffer und Verlauf ueber die Laeufe hinweg in
+# SQLite mit R-Tree (element_db.py). deduplicate/match_pairs rechnen nur
+# rund um geaenderte Elemente neu; ab DB_FULL_REFRESH_SHARE geaenderten
+# Elementen lohnt der volle Durchlauf. DB_FORMAT erhoehen, wenn sich das
+# Format der Treffer aendert. Abfragen: scraper_germany.py db ...
+# Alte Fassungen bleiben DB_HISTORY_DAYS Tage (nach OSM-Stand) in der
+# Tabelle history, 0 = kein Verlauf. Die Datei ist reiner Arbeitsstand:
+# Fehlt sie, baut der naechste Lauf sie aus dem Ergebnis neu auf (nur der
+# Verlauf ist dann weg) - in der Action gehoert sie daher in den
+# Actions-Cache, nicht ins Repository. Vorerst aus: ohne Datenbank
+# rechnet main() alles im Speicher wie bisher.
+USE_ELEMENT_DB = False
+ELEMENT_DB = "elements.sqlite"
+DB_FORMAT = 1
+DB_FULL_REFRESH_SHARE = 0.2
+DB_HISTORY_DAYS = 365
+
+# Einordnung in eigenen Prozessen statt im Hauptprozess: 0 = aus, -1 =
+# alle Kerne. Cache-Treffer liest der Worker selbst (Entpacken, JSON,
+# classify), neue Streifen und PBF-Bloecke zu je CLASSIFY_BATCH Objekten
+# gehen als Liste hin; zurueck kommen nur Ladepunkte und Lokale. Lohnt
+# bei grossen Gebieten, auf einem GitHub-Runner mit 2 Kernen kaum.
+CLASSIFY_PROCESSES = int(os.environ.get("CLASSIFY_PROCESSES", "0"))
+CLASSIFY_BATCH = 20000
 
 # Mindestanteil erfolgreicher Streifen, damit data.json ersetzt wird.
 MIN_SUCCESS_RATIO = 0.90
@@ -67,6 +241,23 @@ OVERPASS_ENDPOINTS = [
     "https://overpass.osm.rambler.ru/cgi/interpreter",
 ]
 
+# Fuer Testlaeufe gegen mock-overpass.py, z.B.
+#   OVERPASS_ENDPOINTS="http://127.0.0.1:8555/api/interpreter" \
+#   OVERPASS_CACHE_DIR=/tmp/leer python scraper_germany.py
+if os.environ.get("OVERPASS_ENDPOINTS"):
+    OVERPASS_ENDPOINTS = os.environ["OVERPASS_ENDPOINTS"].split()
+CACHE_DIR = os.environ.get("OVERPASS_CACHE_DIR", CACHE_DIR)
+
+# Statt Overpass einen lokalen OSM-Extrakt lesen, z.B. germany-latest.osm.pbf
+# von Geofabrik oder vorab verkleinert mit
+#   osmium tags-filter germany-latest.osm.pbf nwr/amenity nwr/shop -o poi.osm.pbf
+# Braucht pyosmium. Auch per "python scraper_germany.py pbf DATEI".
+PBF_FILE = os.environ.get("OSM_PBF_FILE")
+PBF_THREADS = 0             # Threads zum Entpacken der Bloecke, 0 = alle Kerne
+# Knotenspeicher fuer Wegmittelpunkte. Fuer ganz Deutschland mit wenig RAM
+# z.B. "sparse_file_array,/tmp/knoten.bin".
+PBF_LOCATIONS = "flex_mem"
+
 # Pflichtangabe. Ohne UA: 406 (overpass-api.de) bzw. 429 (nginx-Instanzen).
 USER_AGENT = (
     "ladestoppfinder/3.0 (monatlicher OSM-Datenabgleich; "
@@ -77,7 +268,66 @@ QUERY_TIMEOUT = 300         # Overpass-seitig - grosse Streifen brauchen Zeit
 HTTP_TIMEOUT = (20, 360)    # (connect, read) - muss ueber QUERY_TIMEOUT liegen
 MAX_RETRIES = 5
 MAX_PAUSE = 120.0
-PAUSE_BETWEEN_STRIPS = 8.0  # bewusst grosszuegig, es sind ja nur ~14 Requests
+
+# Streifen, die Overpass wegen Groesse abbricht (504, Client-Timeout,
+# "runtime error"), werden halbiert statt stur wiederholt. Die erreichte
+# Tiefe je Streifen wird in SPLIT_FILE gemerkt, damit dichte Gebiete wie
+# Rhein-Ruhr beim naechsten Lauf gleich in kleineren Teilen starten.
+SPLIT_AFTER_ABORTS = 2
+MAX_SPLIT_DEPTH = 4
+SPLIT_FILE = "strip_splits.json"
+
+# Antworten stueckweise lesen und sofort klassifizieren, statt den ganzen
+# Streifen als Liste im Speicher zu halten. Im Cache landen dann nur die
+# relevanten Elemente.
+STREAM_RESPONSES = True
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Parallele Requests je Endpoint. Massgeblich ist, was /api/status als
+# "Rate limit" meldet - das hier ist nur die Obergrenze bzw. der Wert fuer
+# Server ohne Statusseite.
+MAX_SLOTS_PER_ENDPOINT = 4
+DEFAULT_SLOTS = 1
+# Waehrend fetch_strips() laeuft, fragt je Endpoint ein Hintergrund-Thread
+# /api/status in diesem Abstand ab (und sofort nach jedem Request). Die
+# Worker warten dann auf dessen Stand statt vor jedem POST selbst zu fragen.
+STATUS_POLL_SECONDS = 5.0
+
+# Endpoint-Bewertung: Latenz, Durchsatz, Fehler und verdaechtig leere
+# Antworten je Server, ueber Laeufe hinweg in HEALTH_FILE gemerkt. Ein
+# Streifen geht an den Server mit der kuerzesten erwarteten Zeit bis zur
+# brauchbaren Antwort; abgegeben wird er erst, wenn ein anderer Server
+# (samt Wartezeit auf einen freien Worker) um HEALTH_MARGIN schneller waere.
+HEALTH_FILE = "endpoint_health.json"
+HEALTH_PRIOR_SECONDS = 60.0
+HEALTH_MARGIN = 0.8
+
+# Nachzuegler absichern: Ist ein Streifen nach seiner bisherigen
+# p90-Laufzeit (mindestens HEDGE_MIN_SECONDS) nicht da, geht dieselbe
+# Query zusaetzlich an einen anderen Server. Die erste brauchbare Antwort
+# gewinnt, die andere wird abgebrochen. Vorerst aus - jede
+# Parallel-Anfrage belegt auf einem fremden Server einen Slot.
+HEDGE_REQUESTS = False
+HEDGE_MIN_SECONDS = 20.0
+
+# Ladepunkte schon auf dem Server nach Marke filtern (brand/operator/
+# network/name gegen ALLOWED_CHARGERS) und nur die Tags aus QUERY_TAGS
+# zurueckgeben lassen. Das spart Laufzeit auf dem Server, Transfer und
+# 504er. False = die allgemeine Query mit allen Ladepunkten und Tags; auf
+# die faellt auch jeder Server zurueck, der die gefilterte Query ablehnt.
+# Vorerst aus, einschalten mit OVERPASS_SERVER_FILTER=1.
+SERVER_FILTER = os.environ.get("OVERPASS_SERVER_FILTER", "0") == "1"
+QUERY_TAGS = ("name", "brand", "operator", "network", "amenity", "shop", "addr:city")
+
+# Umkreis-Modus (nur mit SERVER_FILTER): Overpass liefert nur Ladepunkte,
+# die ein Lokal im Umkreis haben, und nur diese Lokale; match_pairs()
+# verfeinert dann lokal. Der Zuschlag auf SEARCH_RADIUS_METERS deckt ab,
+# dass around auf Geometrien statt Mittelpunkten misst und deduplicate()
+# auch Nachbarn ohne eigenes Lokal braucht. Ohne den vollen Bestand an
+# Ladepunkten gibt es keinen inkrementellen Lauf. Vergleich mit dem
+# Streifen-Modus: bench-around.py.
+AROUND_FILTER = False
+AROUND_MARGIN_METERS = 100
 
 FOOD_REGEX = (
     "McDonald|Burger King|Lounge|World|Hub|Tegut|Rewe|Porsche|Audi|"
@@ -117,10 +367,84 @@ LOUNGE_KEYWORDS = [
     "rewe ready", "rewe to go", "tegut",
 ]
 
+# ============================================================
+# KLASSIFIZIERUNG (vorkompiliert)
+# ============================================================
+
+def compile_classifier():
+    """
+    Fasst LOUNGE_KEYWORDS, ALLOWED_FOOD und ALLOWED_CHARGERS zu flachen
+    Regeltabellen (stichwort, (config, id_key)) in Prioritaetsreihenfolge
+    zusammen - Umbenennungen wie kentucky -> kfc stecken schon im Ergebnis.
+    Nach Aenderungen an den Tabellen zur Laufzeit erneut aufrufen.
+
+    Dazu passend CHARGER_REGEX/CHARGER_NAME_REGEX fuer den Serverfilter in
+    build_query(): dieselben Stichwoerter, ohne Gross-/Kleinschreibung.
+    """
+    global FOOD_RULES, CHARGER_RULES, CHARGER_NAME_RULES
+    global CHARGER_REGEX, CHARGER_NAME_REGEX
+
+    # Lokale: jedes Lounge-Stichwort schlaegt jede Marke, die Marken
+    # untereinander in Tabellenreihenfolge. Der Schluessel "lounge" selbst
+    # zaehlt nicht als Stichwort.
+    lounge = (ALLOWED_FOOD["lounge"], "lounge")
+    FOOD_RULES = tuple(
+        [(kw, lounge) for kw in LOUNGE_KEYWORDS]
+        + [(k, (c, "kfc" if k == "kentucky" else k))
+           for k, c in ALLOWED_FOOD.items() if k != "lounge"])
+
+    # Ladepunkte: brand/operator/network in Tabellenreihenfolge; im Namen
+    # zuerst "supercharger", dann dieselbe Tabelle.
+    CHARGER_RULES = tuple((k, (c, "aral" if k == "pulse" else k))
+                          for k, c in ALLOWED_CHARGERS.items())
+    CHARGER_NAME_RULES = (
+        (("supercharger", (ALLOWED_CHARGERS["tesla"], "tesla")),)
+        + CHARGER_RULES)
+
+    CHARGER_REGEX = "|".join(_ere_escape(k) for k, _ in CHARGER_RULES)
+    CHARGER_NAME_REGEX = "|".join(_ere_escape(k) for k, _ in CHARGER_NAME_RULES)
+
+
+def _ere_escape(text):
+    """Stichwort als Literal in einem Overpass-Regex (POSIX ERE)."""
+    return re.sub(r"([.^$*+?()\[\]{}|\\])", r"\\\\\1", text)
+
+
+# Die Schleife kostet pro Element linear in der Zahl der Stichwoerter.
+# Gemessen (CPython, echte name/brand-Texte, ~4000 Elemente):
+#   Stichwoerter    16     32     64    128    256   1024
+#   Schleife      0.9us  1.4us  2.1us  4.0us  7.4us  29us
+#   ein Regex     0.9us  0.9us  1.0us  1.3us  1.8us   5us
+# ("ein Regex" = alle Stichwoerter als eine Alternation ohne Gruppen,
+# findall, dann niedrigster Rang; mit benannten Gruppen ist er bei jeder
+# Groesse 1.5-2x langsamer als die Schleife.) Gleichstand also bei ~16
+# Stichwoertern pro Tabelle - FOOD_RULES liegt heute genau dort. Waechst
+# eine Tabelle ueber ~32, lohnt der kombinierte Automat; dann aber
+# Ueberlappungen beachten (findall liefert keine ueberlappenden Treffer,
+# die Prioritaet muss trotzdem stimmen) und mit bench-pipeline.py --check
+# gegen diese Schleife pruefen.
+def first_hit(rules, text):
+    """Ergebnis der ersten Regel, deren Stichwort in text vorkommt."""
+    for kw, hit in rules:
+        if kw in text:
+            return hit
+    return None
+
+
+compile_classifier()
+
 # ============================================================
 # HTTP-LAYER
 # ============================================================
 
+class QueryTooLarge(Exception):
+    """Overpass bricht die Query wiederholt ab - Ausschnitt verkleinern."""
+
+
+# Ein Stueck Arbeit fuer fetch_strips(). strip ist die bbox des
+# urspruenglichen Streifens, bbox das (ggf. geteilte) Stueck davon.
+Job = collections.namedtuple("Job", "label bbox strip depth")
+
 SESSION = requests.Session()
 SESSION.headers.update({
     "User-Agent": USER_AGENT,
@@ -128,162 +452,1228 @@ SESSION.headers.update({
     "Accept-Encoding": "gzip, deflate",
 })
 
-_endpoint_index = 0
+# Je Endpoint eine eigene Session mit so vielen Keep-Alive-Verbindungen,
+# wie dort Worker laufen koennen. SESSION bleibt die Vorlage (Header).
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Laufende SlotMonitor je Endpoint (nur waehrend fetch_strips()).
+_monitors = {}
+
 _stats = {"requests": 0, "retries": 0, "rate_limited": 0,
-          "timeouts": 0, "cache_hits": 0}
+          "timeouts": 0, "cache_hits": 0, "hedged": 0, "hedge_wins": 0,
+          "pbf_objects": 0}
+_stats_lock = threading.Lock()
+_print_lock = threading.Lock()
+
+# Pro Worker-Thread das Label des gerade geladenen Streifens, damit sich
+# die Logzeilen paralleler Requests auseinanderhalten lassen.
+_local = threading.local()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _log(msg):
+    """
+    Im Hauptthread wird wie bisher fortlaufend in eine Zeile geschrieben,
+    in Worker-Threads bekommt jede Meldung eine eigene Zeile mit Label.
+    """
+    label = getattr(_local, "label", None)
+    with _print_lock:
+        if label is None:
+            print(msg, end="", flush=True)
+        else:
+            print(f"  [{label}]{msg}", flush=True)
+
+
+def _print(msg):
+    """Ganze Zeile ausgeben, ohne mit laufenden Worker-Meldungen zu kollidieren."""
+    with _print_lock:
+        print(msg, flush=True)
 
 
 def current_endpoint():
-    return OVERPASS_ENDPOINTS[_endpoint_index % len(OVERPASS_ENDPOINTS)]
+    """Der im Moment am besten bewertete Endpoint (siehe EndpointHealth)."""
+    return HEALTH.best(OVERPASS_ENDPOINTS)
+
+
+# Verbindung der laufenden Query je Thread. Ist ein Rennen entschieden,
+# schliesst Race.end() damit die Verbindung des Verlierers sofort - sonst
+# haelt der bis zu HTTP_TIMEOUT Worker und Server-Slot, waehrend er noch
+# auf die Kopfzeilen wartet. Eingetragen wird nur zwischen _track(True)
+# und _track(False) (overpass_query mit cancel), nicht etwa die
+# Status-Abfragen der SlotMonitor.
+_inflight = {}
+_inflight_lock = threading.Lock()
+_tracking = threading.local()
+
+
+def _track(on):
+    """Verbindungen dieses Threads ab jetzt fuer abort_request() merken - oder nicht mehr."""
+    _tracking.on = on
+    if not on:
+        with _inflight_lock:
+            _inflight.pop(threading.get_ident(), None)
+
+
+def _register(conn):
+    if getattr(_tracking, "on", False):
+        with _inflight_lock:
+            _inflight[threading.get_ident()] = conn
+
 
+class _TrackedHTTPConnection(urllib3.connection.HTTPConnection):
+    def request(self, *args, **kwargs):
+        _register(self)
+        return super().request(*args, **kwargs)
 
-def rotate_endpoint():
-    global _endpoint_index
-    _endpoint_index += 1
 
+class _TrackedHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def request(self, *args, **kwargs):
+        _register(self)
+        return super().request(*args, **kwargs)
 
-def reset_endpoint():
-    global _endpoint_index
-    _endpoint_index = 0
 
+class _TrackedHTTPPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
 
-def wait_for_slot(max_wait=180):
+
+class _TrackedHTTPSPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class TrackingAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter, dessen Verbindungen sich nach _track(True) in _inflight eintragen."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPPool, "https": _TrackedHTTPSPool}
+
+
+def abort_request(ident):
+    """Verbindung der Query, die Thread ident gerade macht, hart schliessen."""
+    with _inflight_lock:
+        conn = _inflight.get(ident)
+    sock = getattr(conn, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def session_for(endpoint):
+    """Session mit eigenem Verbindungspool fuer diesen Endpoint."""
+    with _sessions_lock:
+        session = _sessions.get(endpoint)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(SESSION.headers)
+            adapter = TrackingAdapter(
+                pool_connections=1, pool_maxsize=MAX_SLOTS_PER_ENDPOINT + 1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[endpoint] = session
+        return session
+
+
+def status_url(endpoint):
+    return endpoint.rsplit("/", 1)[0] + "/status"
+
+
+def fetch_status(endpoint):
+    """Rohtext von /api/status oder None, wenn der Server keinen liefert."""
+    try:
+        r = session_for(endpoint).get(status_url(endpoint), timeout=(10, 25))
+    except requests.RequestException:
+        return None
+    if r.status_code != 200:
+        return None
+    return r.text
+
+
+def parse_status(text):
     """
-    Wartet, bis overpass-api.de einen freien Slot meldet.
+    (slots, wait) aus dem Text von /api/status. slots: erlaubte parallele
+    Requests ("Rate limit: N", 0 = unbegrenzt) oder None. wait: 0 bei
+    freiem Slot, sonst Sekunden bis zum naechsten, None ohne Angabe.
+    """
+    slots, waits = None, []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("Rate limit:") and slots is None:
+            try:
+                limit = int(line.split(":", 1)[1])
+            except ValueError:
+                continue
+            slots = MAX_SLOTS_PER_ENDPOINT if limit == 0 else max(
+                1, min(limit, MAX_SLOTS_PER_ENDPOINT))
+        elif "slots available now" in line:
+            waits.append(0)
+        elif line.startswith("Slot available after:") and ", in " in line:
+            try:
+                waits.append(int(line.split(", in ")[1].split(" ")[0]))
+            except (ValueError, IndexError):
+                pass
+    return slots, (min(waits) if waits else None)
+
+
+def endpoint_slots(endpoint):
+    """
+    Anzahl paralleler Requests, die der Server unserer IP zugesteht
+    ("Rate limit: N" auf der Statusseite, 0 bedeutet unbegrenzt).
+    """
+    monitor = _monitors.get(endpoint)
+    if monitor is not None:
+        return monitor.slots
+    text = fetch_status(endpoint)
+    slots = parse_status(text)[0] if text is not None else None
+    return slots or DEFAULT_SLOTS
+
+
+class SlotMonitor(threading.Thread):
+    """
+    Fragt /api/status eines Endpoints im Hintergrund ab und merkt sich, ab
+    wann wieder ein Slot frei ist. Die Worker warten darauf, statt vor
+    jedem POST selbst zu fragen - Statusabfrage und laufende Queries
+    ueberlappen sich so.
+    """
+
+    def __init__(self, endpoint):
+        super().__init__(daemon=True)
+        self.endpoint = endpoint
+        self.cond = threading.Condition()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.known = False
+        self.ready_at = 0.0
+        self.slots = DEFAULT_SLOTS
+        self.poll()
+
+    def poll(self):
+        text = fetch_status(self.endpoint)
+        slots, wait = parse_status(text) if text is not None else (None, None)
+        with self.cond:
+            self.known = wait is not None
+            if slots:
+                self.slots = slots
+            if wait is not None:
+                # Wie bisher 3s Reserve, wenn der Server eine Wartezeit nennt.
+                self.ready_at = time.time() + (wait + 3 if wait else 0)
+            self.cond.notify_all()
+
+    def poke(self):
+        """Nach einem Request sofort neu fragen - die Slots haben sich geaendert."""
+        self.wake.set()
+
+    def run(self):
+        while not self.stopped:
+            self.wake.wait(STATUS_POLL_SECONDS)
+            self.wake.clear()
+            if not self.stopped:
+                self.poll()
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+
+    def wait(self, max_wait):
+        """Wie wait_for_slot(): False, wenn der Status unbekannt ist."""
+        deadline = time.time() + max_wait
+        announced = False
+        with self.cond:
+            while self.known:
+                now = time.time()
+                until = min(self.ready_at, deadline)
+                if until <= now:
+                    return True
+                if not announced and until - now >= 1:
+                    _log(f" [Slot in {until - now:.0f}s]")
+                    announced = True
+                self.cond.wait(until - now)
+            return False
+
+
+def wait_for_slot(endpoint=None, max_wait=180):
+    """
+    Wartet, bis der Endpoint einen freien Slot meldet.
     Bei nur ~14 Requests ist das billig und verhindert 429 zuverlaessig.
+    Laeuft fuer den Endpoint ein SlotMonitor, gilt dessen Stand.
     Rueckgabe False, wenn der Status nicht ermittelbar war.
     """
-    endpoint = current_endpoint()
-    if "overpass-api.de" not in endpoint:
+    endpoint = endpoint or current_endpoint()
+    monitor = _monitors.get(endpoint)
+    if monitor is not None:
+        return monitor.wait(max_wait)
+    text = fetch_status(endpoint)
+    if text is None:
         return False
-    try:
-        r = SESSION.get("https://overpass-api.de/api/status", timeout=(10, 25))
-        if r.status_code != 200:
-            return False
-        waits = []
-        for line in r.text.splitlines():
-            line = line.strip()
-            if "slots available now" in line:
-                return True
-            if line.startswith("Slot available after:") and ", in " in line:
-                try:
-                    waits.append(int(line.split(", in ")[1].split(" ")[0]))
-                except (ValueError, IndexError):
-                    pass
-        if waits:
-            secs = max(0, min(min(waits) + 3, max_wait))
-            if secs:
-                print(f" [Slot in {secs}s]", end="", flush=True)
-                time.sleep(secs)
-            return True
-    except requests.RequestException:
+    wait = parse_status(text)[1]
+    if wait is None:
         return False
-    return False
+    secs = max(0, min(wait + 3, max_wait)) if wait else 0
+    if secs:
+        _log(f" [Slot in {secs}s]")
+        time.sleep(secs)
+    return True
 
 
-def overpass_query(query):
+class EndpointHealth:
+    """
+    Laufzeitstatistik je Endpoint: gleitende Mittel fuer Latenz und
+    Elemente pro Sekunde, Zaehler fuer Erfolge, Fehler und verdaechtig
+    leere Antworten (200 mit 0 Elementen fuer einen ganzen Streifen - der
+    osm.ch-Fall). Dazu je bbox die Groesse der letzten Antwort, damit
+    dichte Streifen nach Durchsatz statt nach mittlerer Latenz geschaetzt
+    werden.
+    """
+
+    ALPHA = 0.3
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.sizes = {}
+        self.latencies = {}
+        self.recent = collections.deque(maxlen=50)
+
+    def _entry(self, endpoint):
+        return self.endpoints.setdefault(endpoint, {
+            "latency": None, "eps": None, "ok": 0, "errors": 0, "empty": 0})
+
+    def _mix(self, old, value):
+        return value if old is None else old + self.ALPHA * (value - old)
+
+    def record(self, endpoint, outcome, elapsed=None, total=0, bbox=None):
+        """
+        outcome: "ok", "empty", "abort" (504/Timeout/runtime error - die
+        Laufzeit zaehlt mit) oder "error" (429, andere HTTP-/Netzfehler).
+        """
+        with self.lock:
+            e = self._entry(endpoint)
+            if outcome == "ok":
+                e["ok"] += 1
+                e["latency"] = self._mix(e["latency"], elapsed)
+                if total and elapsed:
+                    e["eps"] = self._mix(e["eps"], total / elapsed)
+                self.recent.append(elapsed)
+                if bbox:
+                    self.sizes[bbox] = total
+                    self.latencies[bbox] = (self.latencies.get(bbox, []) + [elapsed])[-10:]
+            elif outcome == "empty":
+                e["empty"] += 1
+            else:
+                e["errors"] += 1
+                if outcome == "abort" and elapsed:
+                    e["latency"] = self._mix(e["latency"], elapsed)
+
+    def expected(self, endpoint, bbox=None):
+        """Erwartete Sekunden bis zu einer brauchbaren Antwort."""
+        with self.lock:
+            e = self.endpoints.get(endpoint) or self._entry(endpoint)
+            size = self.sizes.get(bbox)
+            if size and e["eps"]:
+                base = size / e["eps"]
+            else:
+                base = e["latency"] or HEALTH_PRIOR_SECONDS
+            # Erfolgswahrscheinlichkeit mit Laplace-Glaettung; leere
+            # Antworten wiegen dreifach, sie waeren unbemerkt Datenverlust.
+            ok = e["ok"]
+            p = (ok + 1) / (ok + e["errors"] + 3 * e["empty"] + 2)
+            return base / p
+
+    def best(self, endpoints, bbox=None):
+        return min(endpoints, key=lambda ep: self.expected(ep, bbox))
+
+    def hedge_after(self, bbox):
+        """
+        p90 der bisherigen Laufzeiten dieses Streifens (ab 3 Messungen),
+        sonst der letzten Antworten ueberhaupt; None ohne Messwerte.
+        """
+        with self.lock:
+            samples = self.latencies.get(bbox, [])
+            if len(samples) < 3:
+                samples = list(self.recent)
+        if len(samples) < 3:
+            return None
+        samples = sorted(samples)
+        p90 = samples[min(len(samples) - 1, int(0.9 * len(samples)))]
+        return max(HEDGE_MIN_SECONDS, p90)
+
+    def load(self, path):
+        """Stand des letzten Laufs; Zaehler halbiert, damit Altes verblasst."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            for endpoint, e in data.get("endpoints", {}).items():
+                entry = self._entry(endpoint)
+                entry.update(latency=e.get("latency"), eps=e.get("eps"))
+                for key in ("ok", "errors", "empty"):
+                    entry[key] = e.get(key, 0) / 2
+            self.sizes.update(data.get("sizes", {}))
+            self.latencies.update(data.get("latencies", {}))
+            for samples in self.latencies.values():
+                self.recent.extend(samples[-1:])
+
+    def save(self, path):
+        with self.lock:
+            data = {"endpoints": self.endpoints,
+                    "sizes": dict(sorted(self.sizes.items())),
+                    "latencies": {k: [round(t, 1) for t in v]
+                                  for k, v in sorted(self.latencies.items())}}
+            tmp = path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+
+    def report(self):
+        lines = []
+        for endpoint in OVERPASS_ENDPOINTS:
+            e = self.endpoints.get(endpoint)
+            if not e:
+                continue
+            host = endpoint.split("//")[-1].split("/")[0]
+            latency = f"{e['latency']:.0f}s" if e["latency"] else "-"
+            eps = f"{e['eps']:.0f}/s" if e["eps"] else "-"
+            lines.append(f"  {host}: Latenz {latency}, {eps}, ok {e['ok']:g}, "
+                         f"Fehler {e['errors']:g}, leer {e['empty']:g} "
+                         f"-> erwartet {self.expected(endpoint):.0f}s")
+        return lines
+
+
+HEALTH = EndpointHealth()
+
+
+def iter_elements(chunks, info=None):
+    """
+    Liest das "elements"-Array einer Overpass-Antwort Element fuer Element
+    aus einem Strom von Byte-Bloecken, ohne die ganze Antwort zu puffern.
+    Was vor dem Array steht (u.a. "osm3s"), landet in info["head"], was
+    danach kommt (z.B. "remark"), in info["tail"].
+    ValueError bei abgeschnittener oder kaputter Antwort.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, state = "", 0, "head"
+    head, tail = "", []
+
+    for chunk in chunks:
+        buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+        while state != "tail":
+            if state == "head":
+                # Der Kopf ist klein, er bleibt komplett im Puffer.
+                i = buf.find('"elements"')
+                if i < 0:
+                    break
+                j = buf.find("[", i)
+                if j < 0:
+                    break
+                head = buf[:i]
+                pos, state = j + 1, "items"
+                continue
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                pos, state = pos + 1, "tail"
+                break
+            try:
+                el, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Objekt noch unvollstaendig - auf den naechsten Block warten.
+                break
+            pos = end
+            yield el
+        if state == "tail":
+            tail.append(buf[pos:])
+            buf, pos = "", 0
+
+    if state != "tail":
+        raise ValueError("Antwort unvollstaendig")
+    if info is not None:
+        info["head"] = head
+        info["tail"] = "".join(tail)
+
+
+def osm_base_of(text):
+    """timestamp_osm_base aus (einem Teil) einer Overpass-Antwort."""
+    m = re.search(r'"timestamp_osm_base"\s*:\s*"([^"]+)"', text)
+    return m.group(1) if m else None
+
+
+def _pause(secs, cancel=None):
+    """time.sleep(), das bei gesetztem cancel sofort zurueckkehrt."""
+    if cancel is None:
+        time.sleep(secs)
+    else:
+        cancel.wait(secs)
+
+
+def _abort(meta, aborts):
+    """Abbruch wegen Laufzeit/Groesse mitzaehlen, auch in meta["aborts"]."""
+    if meta is not None:
+        meta["aborts"] = aborts + 1
+    return aborts + 1
+
+
+def overpass_query(query, endpoint=None, split_after=None, keep=None, meta=None,
+                   reader=None, expect_data=False, cancel=None):
     """
     Fuehrt eine Query aus. Rueckgabe: Elementliste oder None bei Endfehler.
+    Mit festem endpoint (Scheduler) wird nicht rotiert - ueber die
+    Verteilung auf die Server entscheidet dann fetch_strips().
+    Mit split_after wird nach so vielen Abbruechen wegen Laufzeit
+    QueryTooLarge geworfen, statt dieselbe Query weiter zu wiederholen.
+    Mit keep wird die Antwort gestreamt und nur Elemente behalten, fuer
+    die keep(el) wahr ist. Ein als meta uebergebenes dict bekommt Endpoint
+    und timestamp_osm_base der erfolgreichen Antwort.
+    Fuer andere Ausgabeformate liest reader(r) die gestreamte Antwort und
+    liefert (elements, remark, osm_base); ValueError bei kaputter Antwort.
+    Mit expect_data gilt eine Antwort ohne Elemente als Fehler des Servers.
+    meta["aborts"] zaehlt die Abbrueche wegen Laufzeit/Groesse (504,
+    Client-Timeout, runtime error) - nur danach lohnt eine Teilung.
+    Jeder Versuch fliesst in HEALTH ein. Wird das Event cancel gesetzt
+    (die Parallel-Anfrage war schneller), kommt so bald wie moeglich None.
     """
+    bbox = (meta or {}).get("bbox")
     delay = 15.0
+    aborts = 0
 
     for attempt in range(1, MAX_RETRIES + 1):
-        wait_for_slot()
-        endpoint = current_endpoint()
+        if cancel is not None and cancel.is_set():
+            return None
+        target = endpoint or current_endpoint()
+        wait_for_slot(target)
 
+        r = None
         try:
-            _stats["requests"] += 1
+            _count("requests")
+            _track(cancel is not None)
             t0 = time.time()
-            r = SESSION.post(endpoint, data={"data": query}, timeout=HTTP_TIMEOUT)
-            elapsed = time.time() - t0
+            r = session_for(target).post(
+                target, data={"data": query}, timeout=HTTP_TIMEOUT,
+                stream=keep is not None or reader is not None)
 
             if r.status_code == 200:
                 try:
-                    elements = r.json().get("elements", [])
+                    if reader is not None:
+                        elements, remark, osm_base = reader(r)
+                        total = len(elements)
+                    elif keep is None:
+                        payload = r.json()
+                        elements = [restore_element(el)
+                                    for el in payload.get("elements", [])]
+                        remark, total = payload.get("remark", ""), len(elements)
+                        osm_base = payload.get("osm3s", {}).get("timestamp_osm_base")
+                    else:
+                        info, total, elements = {}, 0, []
+                        for el in iter_elements(
+                                r.iter_content(STREAM_CHUNK_SIZE), info):
+                            if cancel is not None and cancel.is_set():
+                                return None
+                            total += 1
+                            el = restore_element(el)
+                            if keep(el):
+                                elements.append(el)
+                        remark = info["tail"]
+                        osm_base = osm_base_of(info["head"])
                 except ValueError:
-                    print(" [kein JSON]", end="", flush=True)
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    HEALTH.record(target, "error")
+                    _log(" [kein JSON]" if reader is None else " [Antwort unlesbar]")
                 else:
-                    print(f" [{elapsed:.0f}s, {len(elements)} Objekte]",
-                          end="", flush=True)
-                    return elements
+                    elapsed = time.time() - t0
+                    if "runtime error" in remark:
+                        # Timeout/Speicherlimit: die Elemente sind unvollstaendig.
+                        HEALTH.record(target, "abort", elapsed)
+                        _count("timeouts")
+                        aborts = _abort(meta, aborts)
+                        _log(" [runtime error]")
+                        if split_after and aborts >= split_after:
+                            raise QueryTooLarge(remark)
+                    elif expect_data and not total:
+                        # 200 mit 0 Elementen fuer einen ganzen Streifen gibt
+                        # es in Deutschland nicht - der Server verschluckt Daten.
+                        HEALTH.record(target, "empty")
+                        _log(" [0 Elemente - verdaechtig]")
+                        if endpoint is not None:
+                            return None
+                    else:
+                        HEALTH.record(target, "ok", elapsed, total, bbox)
+                        if meta is not None:
+                            meta.update(endpoint=target, osm_base=osm_base)
+                        if keep is None:
+                            _log(f" [{elapsed:.0f}s, {total} Objekte]")
+                        else:
+                            _log(f" [{elapsed:.0f}s, {total} Objekte, "
+                                 f"{len(elements)} relevant]")
+                        return elements
 
             elif r.status_code == 406:
                 # Nur ohne User-Agent moeglich - Konfigurationsfehler.
-                print(" [406: User-Agent fehlt]", end="", flush=True)
+                HEALTH.record(target, "error")
+                _log(" [406: User-Agent fehlt]")
+                return None
+
+            elif r.status_code == 400:
+                # Syntaxfehler - etwa ein aelterer Server ohne convert.
+                # Wiederholen bringt nichts; run_job() weicht auf die
+                # allgemeine Query aus.
+                HEALTH.record(target, "error")
+                _log(" [400: Query abgelehnt]")
+                if meta is not None:
+                    meta["rejected"] = True
                 return None
 
             elif r.status_code == 429:
-                _stats["rate_limited"] += 1
+                HEALTH.record(target, "error")
+                _count("rate_limited")
                 ra = r.headers.get("Retry-After")
                 sleep_for = (min(float(ra) + 3, MAX_PAUSE)
                              if ra and ra.isdigit() else min(delay, MAX_PAUSE))
-                print(f" [429, warte {sleep_for:.0f}s]", end="", flush=True)
-                time.sleep(sleep_for + random.uniform(0, 3))
+                _log(f" [429, warte {sleep_for:.0f}s]")
+                _pause(sleep_for + random.uniform(0, 3), cancel)
                 delay *= 2
-                _stats["retries"] += 1
+                _count("retries")
                 continue
 
             elif r.status_code in (502, 503, 504):
-                # 504 = Overpass hat die Query serverseitig abgebrochen.
-                # Nicht sofort Server wechseln - meist hilft Geduld.
-                _stats["timeouts"] += 1
-                print(f" [{r.status_code}, warte {delay:.0f}s]", end="", flush=True)
-                time.sleep(min(delay, MAX_PAUSE))
+                # 504 = Overpass hat die Query serverseitig abgebrochen. Ohne
+                # festen endpoint geht der naechste Versuch an den dann am
+                # besten bewerteten Server - bei guter Vorgeschichte bleibt
+                # das derselbe, meist hilft Geduld.
+                HEALTH.record(target, "abort" if r.status_code == 504 else "error",
+                              time.time() - t0)
+                _count("timeouts")
+                if r.status_code == 504:
+                    aborts = _abort(meta, aborts)
+                    if split_after and aborts >= split_after:
+                        raise QueryTooLarge("504")
+                _log(f" [{r.status_code}, warte {delay:.0f}s]")
+                _pause(min(delay, MAX_PAUSE), cancel)
                 delay *= 2
-                if attempt >= 3:
-                    rotate_endpoint()
-                _stats["retries"] += 1
+                _count("retries")
                 continue
 
             else:
-                print(f" [HTTP {r.status_code}]", end="", flush=True)
+                HEALTH.record(target, "error")
+                _log(f" [HTTP {r.status_code}]")
 
         except requests.Timeout:
-            _stats["timeouts"] += 1
-            print(" [Client-Timeout]", end="", flush=True)
+            if cancel is not None and cancel.is_set():
+                return None
+            HEALTH.record(target, "abort", time.time() - t0)
+            _count("timeouts")
+            _log(" [Client-Timeout]")
+            aborts = _abort(meta, aborts)
+            if split_after and aborts >= split_after:
+                raise QueryTooLarge("Client-Timeout")
         except requests.RequestException as exc:
-            print(f" [{type(exc).__name__}]", end="", flush=True)
-
-        _stats["retries"] += 1
-        time.sleep(min(delay, MAX_PAUSE) + random.uniform(0, 5))
+            if cancel is not None and cancel.is_set():
+                # Verbindung von Race.end() geschlossen - kein Serverfehler.
+                return None
+            HEALTH.record(target, "error")
+            _log(f" [{type(exc).__name__}]")
+        finally:
+            if r is not None:
+                r.close()
+            _track(False)
+
+        _count("retries")
+        _pause(min(delay, MAX_PAUSE) + random.uniform(0, 5), cancel)
         delay *= 2
 
     return None
 
 
+def split_bbox(bbox):
+    """Halbiert eine bbox "s,w,n,e" entlang ihrer (in km) laengeren Seite."""
+    south, west, north, east = (float(v) for v in bbox.split(","))
+    height = north - south
+    width = (east - west) * math.cos(math.radians((south + north) / 2))
+    if width >= height:
+        mid = round((west + east) / 2, 4)
+        parts = [(south, west, north, mid), (south, mid, north, east)]
+    else:
+        mid = round((south + north) / 2, 4)
+        parts = [(south, west, mid, east), (mid, west, north, east)]
+    return [",".join(f"{v:g}" for v in p) for p in parts]
+
+
+def split_job(job):
+    return [job._replace(label=f"{job.label}.{i}", bbox=bbox, depth=job.depth + 1)
+            for i, bbox in enumerate(split_bbox(job.bbox), 1)]
+
+
+def load_splits():
+    try:
+        with open(SPLIT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_splits(splits):
+    # Tiefe wird nur erhoeht, nie automatisch zurueckgenommen - ein zu fein
+    # geteilter Streifen kostet ein paar Requests, ein zu grober einen 504.
+    tmp = SPLIT_FILE + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(splits.items())), f, indent=2)
+        os.replace(tmp, SPLIT_FILE)
+    except OSError:
+        pass
+
+
+class Race:
+    """
+    Ein Streifen, der gerade laeuft - ggf. parallel auf zwei Servern.
+    Die erste brauchbare Antwort (Elemente oder Teilung) beendet das
+    Rennen, setzt cancel fuer den anderen und schliesst dessen Verbindung
+    (abort_request); ein Fehlschlag zaehlt erst, wenn keiner mehr laeuft.
+    Erzeugt und betreten wird ein Rennen im Thread des jeweiligen Workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancel = threading.Event()
+        self.active = 1
+        self.closed = False
+        self.timer = None
+        self.threads = {threading.get_ident()}
+
+    def join(self):
+        with self.lock:
+            if self.closed:
+                return False
+            self.active += 1
+            self.threads.add(threading.get_ident())
+            return True
+
+    def end(self, result):
+        """True, wenn der Aufrufer das Ergebnis melden soll."""
+        with self.lock:
+            self.active -= 1
+            self.threads.discard(threading.get_ident())
+            if self.closed:
+                return False
+            if result is None and self.active:
+                return False
+            self.closed = True
+            losers = list(self.threads)
+        self.cancel.set()
+        for ident in losers:
+            abort_request(ident)
+        if self.timer is not None:
+            self.timer.cancel()
+        return True
+
+
+class Dispatcher:
+    """
+    Warteschlange fuer fetch_strips(), die nach erwarteter Fertigstellung
+    verteilt: Ein freier Worker nimmt den naechsten Streifen nur, wenn kein
+    anderer Server ihn - inklusive Wartezeit, bis dort ein Worker frei wird -
+    um HEALTH_MARGIN frueher liefern duerfte. Sonst wartet er kurz und
+    prueft erneut; ein angeschlagener Mirror bekommt so nur noch Arbeit,
+    wenn die guten Server ausgelastet sind.
+    Parallel-Anfragen fuer Nachzuegler (hedge) haben Vorrang und gehen nur
+    an einen anderen Server als den, der den Streifen schon laedt.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = collections.deque(jobs)
+        self.hedges = collections.deque()
+        self.cond = threading.Condition()
+        self.workers = collections.Counter()
+        self.busy = {}
+
+    def join(self, endpoint):
+        with self.cond:
+            self.workers[endpoint] += 1
+
+    def leave(self, endpoint):
+        with self.cond:
+            self.workers[endpoint] -= 1
+            self.cond.notify_all()
+
+    def put(self, job):
+        with self.cond:
+            self.jobs.append(job)
+            self.cond.notify_all()
+
+    def _eta(self, endpoint, now):
+        """Sekunden, bis bei endpoint ein Worker frei sein duerfte."""
+        running = [(started, expected) for (ep, _), (started, expected)
+                   in self.busy.items() if ep == endpoint]
+        if len(running) < self.workers[endpoint]:
+            return 0.0
+        # Ueberfaellige Requests: je laenger drueber, desto spaeter frei.
+        return min(abs(expected - (now - started)) for started, expected in running)
+
+    def _take_hedge(self, endpoint):
+        for item in list(self.hedges):
+            job, origin, race = item
+            if race.closed:
+                self.hedges.remove(item)
+            elif origin != endpoint and race.join():
+                self.hedges.remove(item)
+                return job, race
+        return None, None
+
+    def take(self, endpoint, worker):
+        """
+        Naechster (job, race) fuer diesen Worker; race ist nur bei einer
+        Parallel-Anfrage gesetzt. (None, None), wenn nichts mehr kommen kann.
+        """
+        with self.cond:
+            while True:
+                now = time.time()
+                job, race = self._take_hedge(endpoint)
+                if job is not None:
+                    self.busy[(endpoint, worker)] = (now, HEALTH.expected(endpoint, job.bbox))
+                    return job, race
+                if self.jobs:
+                    job = self.jobs[0]
+                    mine = HEALTH.expected(endpoint, job.bbox)
+                    rival = min((self._eta(other, now) + HEALTH.expected(other, job.bbox)
+                                 for other, n in self.workers.items()
+                                 if other != endpoint and n > 0), default=None)
+                    if rival is None or rival >= mine * HEALTH_MARGIN:
+                        self.jobs.popleft()
+                        self.busy[(endpoint, worker)] = (now, mine)
+                        return job, None
+                    self.cond.wait(min(max(rival, 1.0), 10.0))
+                elif self.busy:
+                    # Laufende Streifen koennen noch Teile oder
+                    # Parallel-Anfragen nachliefern.
+                    self.cond.wait(5.0)
+                else:
+                    return None, None
+
+    def watch(self, job, endpoint, race):
+        """Parallel-Anfrage planen, falls der Streifen zum Nachzuegler wird."""
+        if not HEDGE_REQUESTS or len(OVERPASS_ENDPOINTS) < 2:
+            return
+        delay = HEALTH.hedge_after(job.bbox)
+        if delay is None:
+            return
+        race.timer = threading.Timer(delay, self._hedge, (job, endpoint, race))
+        race.timer.daemon = True
+        race.timer.start()
+
+    def _hedge(self, job, endpoint, race):
+        with self.cond:
+            if race.closed or not any(n > 0 for other, n in self.workers.items()
+                                      if other != endpoint):
+                return
+            self.hedges.append((job, endpoint, race))
+            self.cond.notify_all()
+
+    def finish(self, endpoint, worker):
+        with self.cond:
+            self.busy.pop((endpoint, worker), None)
+            self.cond.notify_all()
+
+    def drain(self):
+        with self.cond:
+            jobs, self.jobs = list(self.jobs), collections.deque()
+            return jobs
+
+
+def fetch_strips(jobs):
+    """
+    Laedt Streifen parallel ueber alle OVERPASS_ENDPOINTS.
+
+    jobs ist eine Liste von Job. Je Endpoint laufen so viele Worker, wie
+    der Server Slots meldet; welcher Server den naechsten Streifen bekommt,
+    entscheidet der Dispatcher nach HEALTH. Haengt ein Streifen laenger
+    als ueblich, laedt ihn ein zweiter Server parallel (HEDGE_REQUESTS).
+    Bricht Overpass einen Streifen wiederholt ab, wird er halbiert und die
+    Haelften kommen zurueck in die Warteschlange.
+    Ergebnisse kommen als (job, elements, meta) in Ankunftsreihenfolge
+    zurueck, damit der Aufrufer sofort auswerten kann. elements ist None
+    bei Endfehler, meta enthaelt Endpoint und OSM-Stand der Antwort.
+    """
+    todo = Dispatcher(jobs)
+    done = queue.Queue()
+
+    def worker(endpoint, monitor, me):
+        failures = 0
+        try:
+            # Ein toter Mirror soll nicht die halbe Warteschlange leerfressen.
+            while failures < 2:
+                job, race = todo.take(endpoint, me)
+                if job is None:
+                    return
+                hedge = race is not None
+                if hedge:
+                    _count("hedged")
+                else:
+                    race = Race()
+                    todo.watch(job, endpoint, race)
+                try:
+                    result, meta = run_job(job, endpoint, race.cancel,
+                                           label=job.label + ("+" if hedge else ""))
+                except Exception as exc:
+                    # Unerwartete Antwortform o.ae.: der Streifen gilt als
+                    # fehlgeschlagen, der Worker macht weiter.
+                    _log(f" [{type(exc).__name__}: {exc}]")
+                    result, meta = None, {}
+                finally:
+                    monitor.poke()
+                    todo.finish(endpoint, me)
+                cancelled = result is None and race.cancel.is_set()
+                if race.end(result):
+                    if hedge and result is not None:
+                        _count("hedge_wins")
+                    # Erst melden, dann einreihen - sonst koennte ein Teil
+                    # fertig sein, bevor _collect() von der Teilung weiss.
+                    done.put((job, result, meta))
+                    if result and isinstance(result[0], Job):
+                        for child in result:
+                            todo.put(child)
+                if cancelled:
+                    _log(" [abgebrochen - anderer Server war schneller]")
+                elif result is None:
+                    failures += 1
+                else:
+                    failures = 0
+        finally:
+            todo.leave(endpoint)
+
+    threads = []
+    for endpoint in OVERPASS_ENDPOINTS:
+        monitor = _monitors[endpoint] = SlotMonitor(endpoint)
+        monitor.start()
+        for _ in range(monitor.slots):
+            if len(threads) >= len(jobs):
+                break
+            todo.join(endpoint)
+            threads.append(threading.Thread(
+                target=worker, args=(endpoint, monitor, len(threads)), daemon=True))
+    _print(f"Worker: {len(threads)} fuer {len(jobs)} Streifen")
+    for t in threads:
+        t.start()
+    try:
+        yield from _collect(jobs, todo, done, threads)
+    finally:
+        # Erst wenn alle Worker weg sind, sind auch ihre Server-Slots frei -
+        # ein zweiter Anlauf darf nicht zusaetzlich dazukommen.
+        todo.drain()
+        for t in threads:
+            t.join()
+        for endpoint in OVERPASS_ENDPOINTS:
+            monitor = _monitors.pop(endpoint, None)
+            if monitor is not None:
+                monitor.stop()
+
+
+# Server, die die gefilterte Query abgelehnt haben (HTTP 400), bekommen
+# fuer den Rest des Laufs die allgemeine.
+_generic_endpoints = set()
+
+
+def run_job(job, endpoint, cancel=None, label=None):
+    """
+    Einen Streifen laden. Rueckgabe (elements, meta); elements ist None bei
+    Endfehler oder Abbruch, bzw. die Liste der Teil-Jobs, wenn Overpass ihn
+    zu gross fand.
+    """
+    _local.label = label or job.label
+    split_after = SPLIT_AFTER_ABORTS if job.depth < MAX_SPLIT_DEPTH else None
+    generic = True if endpoint in _generic_endpoints else None
+    try:
+        while True:
+            query, meta = build_query(job.bbox, generic=generic), {"bbox": job.bbox}
+            elements = overpass_query(
+                query, endpoint=endpoint, split_after=split_after,
+                keep=classify_element if STREAM_RESPONSES else None, meta=meta,
+                expect_data=job.depth == 0 and not AROUND_FILTER, cancel=cancel)
+            if elements is not None or not meta.get("rejected") or generic:
+                break
+            _log(" [weiter mit allgemeiner Query]")
+            _generic_endpoints.add(endpoint)
+            generic = True
+    except QueryTooLarge:
+        if cancel is not None and cancel.is_set():
+            return None, meta
+        children = split_job(job)
+        _log(f" [zu gross -> {len(children)} Teile]")
+        return children, meta
+    if elements is not None:
+        # Auch nach der allgemeinen Query unter dem Schluessel, nach dem der
+        # naechste Lauf sucht - sonst bliebe der Eintrag ungelesen.
+        cache_write(query, elements, meta, filtered=STREAM_RESPONSES,
+                    key=build_query(job.bbox))
+    return elements, meta
+
+
+def _collect(jobs, todo, done, threads):
+    """Ergebnisse der Worker einsammeln, siehe fetch_strips()."""
+    pending = collections.Counter(jobs)
+    while pending:
+        try:
+            job, result, meta = done.get(timeout=1.0)
+        except queue.Empty:
+            pass
+        else:
+            pending -= collections.Counter([job])
+            if result and isinstance(result[0], Job):
+                pending.update(result)
+            else:
+                yield job, result, meta
+            continue
+        if any(t.is_alive() for t in threads) or not done.empty():
+            continue
+        # Alle Worker haben aufgegeben - der Rest, ob noch in der
+        # Warteschlange oder von keinem mehr gemeldet, geht in den zweiten
+        # Anlauf.
+        todo.drain()
+        for job in list(pending.elements()):
+            yield job, None, {}
+        return
+
+
 # ============================================================
 # CACHE
 # ============================================================
 
-def cache_path(key_str):
-    key = hashlib.md5(f"{key_str}|{FOOD_REGEX}".encode("utf-8")).hexdigest()
-    return os.path.join(CACHE_DIR, f"{key}.json")
+# Eine Datei je Query, benannt nach dem Hash des Query-Texts. Aendert sich
+# build_query() (Regex, Timeout, Ausgabe), passt automatisch kein alter
+# Eintrag mehr. Inhalt: eine Kopfzeile mit Metadaten, dann ein Element pro
+# Zeile, komprimiert mit zstd (falls installiert) oder gzip.
+#
+#   {"format": 2, "query": ..., "bbox": ..., "endpoint": ...,
+#    "osm_base": ..., "count": ..., "created": ..., "filtered": ...,
+#    "classifier": ...}
+#
+# Gespeichert werden die Elemente so, wie Overpass sie liefert (ohne
+# clean_info/id_key). Gefilterte Eintraege (nur relevante Elemente)
+# haengen aber von den Zuordnungstabellen ab; "classifier" haelt deren
+# Fingerabdruck fest, bei Abweichung gilt der Eintrag als veraltet.
 
+_osm_base_now = {}
 
-def cache_read(key_str):
-    path = cache_path(key_str)
-    if not os.path.exists(path):
-        return None
-    if (time.time() - os.path.getmtime(path)) / 3600 > CACHE_TTL_HOURS:
+
+def _cache_open(path, mode):
+    if path.endswith(".zst"):
+        return zstandard.open(path, mode, encoding="utf-8")
+    return gzip.open(path, mode, encoding="utf-8")
+
+
+def cache_key(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def classifier_fingerprint():
+    """Aendert sich, sobald die Zuordnungstabellen andere Elemente behalten."""
+    basis = json.dumps([ALLOWED_CHARGERS, ALLOWED_FOOD, LOUNGE_KEYWORDS], sort_keys=True)
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_current(header):
+    """Ungefiltert immer, gefiltert nur mit denselben Zuordnungstabellen."""
+    return not header.get("filtered") or header.get("classifier") == classifier_fingerprint()
+
+
+def cache_path(query):
+    """Vorhandene Datei zur Query, sonst der Pfad fuer einen neuen Eintrag."""
+    base = os.path.join(CACHE_DIR, cache_key(query))
+    for ext in (".jsonl.zst", ".jsonl.gz"):
+        if os.path.exists(base + ext):
+            return base + ext
+    return base + (".jsonl.zst" if zstandard else ".jsonl.gz")
+
+
+def cache_entries():
+    """Alle Cache-Dateien, auch solche im alten unkomprimierten Format."""
+    try:
+        names = sorted(os.listdir(CACHE_DIR))
+    except OSError:
+        return []
+    return [os.path.join(CACHE_DIR, n) for n in names
+            if n.endswith((".jsonl.gz", ".jsonl.zst", ".json"))]
+
+
+def cache_readable(path):
+    return not path.endswith(".zst") or zstandard is not None
+
+
+def cache_header(path):
+    """Nur die Kopfzeile lesen - reicht fuer Ablauf, Anzeige und Aufraeumen."""
+    if not path.endswith((".gz", ".zst")) or not cache_readable(path):
         return None
     try:
+        with _cache_open(path, "rt") as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError, EOFError):
+        return None
+    return header if header.get("format") == CACHE_FORMAT else None
+
+
+def cache_elements(path):
+    """
+    Die Elemente einer Cache- oder Store-Datei nach der Kopfzeile, eines
+    nach dem anderen; auch aeltere unkomprimierte .json-Eintraege.
+    OSError, ValueError oder EOFError, wenn die Datei nicht lesbar ist.
+    """
+    if not cache_readable(path):
+        raise OSError(f"{path}: zstandard fehlt")
+    if path.endswith(".json"):
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        _stats["cache_hits"] += 1
-        return data
-    except (OSError, ValueError):
+        yield from data if isinstance(data, list) else data.get("elements", [])
+        return
+    with _cache_open(path, "rt") as f:
+        f.readline()
+        for line in f:
+            yield json.loads(line)
+
+
+def current_osm_base(endpoint):
+    """Datenstand des Servers laut /api/timestamp, je Lauf nur einmal gefragt."""
+    if endpoint not in _osm_base_now:
+        stamp = None
+        try:
+            r = session_for(endpoint).get(
+                endpoint.rsplit("/", 1)[0] + "/timestamp", timeout=(10, 25))
+            if r.status_code == 200 and r.text.strip()[:2] == "20":
+                stamp = r.text.strip()
+        except requests.RequestException:
+            pass
+        _osm_base_now[endpoint] = stamp
+    return _osm_base_now[endpoint]
+
+
+def cache_fresh(header):
+    """
+    Jung genug nach CACHE_TTL_HOURS - oder aelter, aber der Server steht
+    noch auf demselben OSM-Datenstand, dann waere ein Abruf identisch.
+    """
+    if (time.time() - header.get("created", 0)) / 3600 <= CACHE_TTL_HOURS:
+        return True
+    osm_base = header.get("osm_base")
+    return bool(osm_base and header.get("endpoint")
+                and current_osm_base(header["endpoint"]) == osm_base)
+
+
+def cache_lookup(query):
+    """(Pfad, Kopfzeile) eines frischen Eintrags zur Query oder None."""
+    path = cache_path(query)
+    header = cache_header(path)
+    if header is None or not cache_current(header) or not cache_fresh(header):
         return None
+    return path, header
 
 
-def cache_write(key_str, elements):
+def cache_write(query, elements, meta=None, filtered=False, key=None):
+    """
+    Antwort auf query ablegen. key ist die Query, unter der cache_lookup()
+    den Eintrag sucht, falls gesendet eine andere wurde (Standard: query).
+    """
     os.makedirs(CACHE_DIR, exist_ok=True)
+    meta = meta or {}
+    header = {
+        "format": CACHE_FORMAT,
+        "query": query,
+        "bbox": meta.get("bbox"),
+        "endpoint": meta.get("endpoint"),
+        "osm_base": meta.get("osm_base"),
+        "count": len(elements),
+        "created": time.time(),
+        "filtered": filtered,
+        "classifier": classifier_fingerprint() if filtered else None,
+    }
+    path = cache_path(key or query)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
     try:
-        with open(cache_path(key_str), "w", encoding="utf-8") as f:
-            json.dump(elements, f, ensure_ascii=False)
+        with _cache_open(tmp, "wt") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for el in elements:
+                raw = {k: v for k, v in el.items() if k not in ("clean_info", "id_key")}
+                f.write(json.dumps(raw, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
     except OSError:
         pass
 
 
+def cache_cli(argv):
+    """python scraper_germany.py cache {ls,show,prune} - Cache ansehen/aufraeumen."""
+    parser = argparse.ArgumentParser(prog="scraper_germany.py cache")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("ls", help="Eintraege mit Metadaten auflisten")
+    show = sub.add_parser("show", help="Kopfzeile eines Eintrags zeigen")
+    show.add_argument("key", help="Hash oder Anfang davon")
+    prune = sub.add_parser("prune", help="abgelaufene/fremde Eintraege loeschen")
+    prune.add_argument("--older-than", type=float, metavar="STUNDEN",
+                       help="alles aelter als das loeschen (Standard: "
+                            "altes Format, unlesbare Dateien und gefilterte "
+                            "mit anderen Zuordnungstabellen)")
+    prune.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    entries = cache_entries()
+    if args.cmd == "ls":
+        total = 0
+        for path in entries:
+            size = os.path.getsize(path)
+            total += size
+            header = cache_header(path)
+            name = os.path.basename(path)[:12]
+            if header is None:
+                print(f"{name}  {size / 1024:8.1f} KB  (altes Format/unlesbar)")
+                continue
+            age = (time.time() - header["created"]) / 3600
+            print(f"{name}  {size / 1024:8.1f} KB  {age:6.1f}h  "
+                  f"{header['count']:6d} El.  {header.get('osm_base') or '-':20s}  "
+                  f"{header.get('bbox') or '-'}")
+        print(f"{len(entries)} Eintraege, {total / 1024 / 1024:.1f} MB")
+        return 0
+
+    if args.cmd == "show":
+        hits = [p for p in entries if os.path.basename(p).startswith(args.key)]
+        if len(hits) != 1:
+            print(f"{len(hits)} Treffer fuer {args.key}")
+            return 1
+        print(json.dumps(cache_header(hits[0]), ensure_ascii=False, indent=2))
+        return 0
+
+    removed = 0
+    for path in entries:
+        header = cache_header(path)
+        if not cache_readable(path):
+            # zstd-Eintrag, aber hier ohne zstandard - nicht anfassen.
+            drop = False
+        elif header is None or not cache_current(header):
+            drop = True
+        elif args.older_than is not None:
+            drop = (time.time() - header["created"]) / 3600 > args.older_than
+        else:
+            drop = False
+        if drop:
+            removed += 1
+            print(("wuerde loeschen: " if args.dry_run else "loesche: ")
+                  + os.path.basename(path))
+            if not args.dry_run:
+                os.remove(path)
+    print(f"{removed} von {len(entries)} Eintraegen entfernt")
+    return 0
+
+
 # ============================================================
 # HILFSFUNKTIONEN
 # ============================================================
@@ -296,171 +1686,431 @@ def get_coords(element):
     return None, None
 
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
-         + math.cos(phi1) * math.cos(phi2)
-         * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+def numpy_enabled():
+    return USE_NUMPY and numpy is not None
 
 
-def build_query(bbox_str):
-    return f"""[out:json][timeout:{QUERY_TIMEOUT}];
+def grow_bbox(bbox_str, meters):
+    """bbox "s,w,n,e" um meters in jede Richtung vergroessern."""
+    south, west, north, east = (float(v) for v in bbox_str.split(","))
+    dlat = math.degrees(meters / 6371000)
+    dlon = dlat / math.cos(math.radians(min(max(abs(south), abs(north)) + dlat, 89.9)))
+    return (f"{south - dlat:.5f},{west - dlon:.5f},"
+            f"{north + dlat:.5f},{east + dlon:.5f}")
+
+
+def build_query(bbox_str, settings=None, generic=None, trim=True, around=None):
+    """
+    Query fuer einen Ausschnitt. generic=True ist die allgemeine Variante
+    mit allen Ladepunkten (Standard: nicht SERVER_FILTER). Sonst filtert
+    schon der Server nach Marke, mit around (Standard: AROUND_FILTER)
+    zusaetzlich nach Lokalen im Umkreis, und gibt - falls trim - nur
+    QUERY_TAGS zurueck; die gekuerzten Elemente bringt restore_element()
+    wieder in die gewohnte Form. Augmented Diffs koennen nicht gekuerzt
+    werden.
+    """
+    settings = settings or f"[out:json][timeout:{QUERY_TIMEOUT}]"
+    if generic is None:
+        generic = not SERVER_FILTER
+    if around is None:
+        around = AROUND_FILTER
+    radius = SEARCH_RADIUS_METERS + AROUND_MARGIN_METERS
+    # Im Umkreis-Modus zaehlen auch Lokale knapp jenseits des Streifens.
+    food_bbox = grow_bbox(bbox_str, radius) if around and not generic else bbox_str
+    food = f"""  nwr["amenity"~"^(fast_food|restaurant|cafe|lounge|vending_machine)$"]["name"~"{FOOD_REGEX}",i]({food_bbox});
+  nwr["shop"~"^(kiosk|convenience)$"]["name"~"{FOOD_REGEX}",i]({food_bbox});"""
+    if generic:
+        return f"""{settings};
 (
   nwr["amenity"="charging_station"]({bbox_str});
-  nwr["amenity"~"^(fast_food|restaurant|cafe|lounge|vending_machine)$"]["name"~"{FOOD_REGEX}",i]({bbox_str});
-  nwr["shop"~"^(kiosk|convenience)$"]["name"~"{FOOD_REGEX}",i]({bbox_str});
+{food}
 );
 out center qt;"""
 
+    # Alle Ladepunkte einmal holen, dann je Feld filtern - wie in
+    # classify_element() zaehlt ein Treffer in brand, operator oder
+    # network, im Namen zusaetzlich "supercharger".
+    chargers = f"""nwr["amenity"="charging_station"]({bbox_str})->.ladepunkte;
+(
+  nwr.ladepunkte["brand"~"{CHARGER_REGEX}",i];
+  nwr.ladepunkte["operator"~"{CHARGER_REGEX}",i];
+  nwr.ladepunkte["network"~"{CHARGER_REGEX}",i];
+  nwr.ladepunkte["name"~"{CHARGER_NAME_REGEX}",i];"""
+    if around:
+        query = f"""{settings};
+{chargers}
+)->.marken;
+(
+{food}
+)->.lokale;
+nwr.marken(around.lokale:{radius})->.nah;
+nwr.lokale(around.nah:{radius})->.essen;
+(.nah; .essen;);
+"""
+    else:
+        query = f"""{settings};
+{chargers}
+{food}
+);
+"""
+    if not trim:
+        return query + "out center qt;"
+    tags = "".join(f', "{key}"=t["{key}"]' for key in QUERY_TAGS)
+    return query + f"""convert osm ::id=id(), ::geom=center(geom()), "@type"=type(), "@version"=version(), "@timestamp"=timestamp(){tags};
+out geom qt;"""
+
+
+OSM_TYPES = ("node", "way", "relation")
+
+
+def restore_element(el):
+    """
+    Ein per convert gekuerztes Element wieder im Format von "out center":
+    Typ aus "@type", Knoten mit lat/lon, Wege und Relationen mit center,
+    dazu version/timestamp (fuer ELEMENT_DB). Leere Tags (Schluessel ohne
+    Wert im Original) fallen weg. Normale Elemente kommen unveraendert
+    zurueck.
+    """
+    if el.get("type") in OSM_TYPES:
+        return el
+    tags = {k: v for k, v in el.get("tags", {}).items() if v}
+    kind = tags.pop("@type", el.get("type"))
+    version, timestamp = tags.pop("@version", None), tags.pop("@timestamp", None)
+    restored = {"type": kind, "id": el.get("id")}
+    geometry = el.get("geometry") or {}
+    if geometry.get("type") == "Point":
+        lon, lat = geometry["coordinates"][:2]
+    else:
+        lat, lon = get_coords(el)
+    if lat is not None:
+        if kind == "node":
+            restored["lat"], restored["lon"] = lat, lon
+        else:
+            restored["center"] = {"lat": lat, "lon": lon}
+    if tags:
+        restored["tags"] = tags
+    if version and version.isdigit():
+        restored["version"] = int(version)
+    if timestamp:
+        restored["timestamp"] = timestamp
+    return restored
+
 
 # ============================================================
 # AUSWERTUNG (Logik identisch zur Ursprungsversion)
 # ============================================================
 
+def classify_element(el):
+    """
+    Ordnet ein einzelnes Element ein und ergaenzt clean_info/id_key.
+    Rueckgabe "charger", "food" oder None fuer irrelevante Elemente.
+    """
+    tags = el.get("tags", {})
+    name = tags.get("name", "Unbekannt")
+
+    strong_search = " ".join([
+        tags.get("brand", ""), tags.get("operator", ""), tags.get("network", "")
+    ]).lower()
+    weak_search = (name or "").lower()
+    full_search = (weak_search + " " + strong_search).strip()
+
+    is_poi = (
+        tags.get("amenity") in
+        {"fast_food", "restaurant", "cafe", "lounge", "vending_machine"}
+        or tags.get("shop") in {"kiosk", "convenience"}
+    )
+
+    if is_poi:
+        hit = first_hit(FOOD_RULES, full_search)
+        if hit:
+            el["clean_info"], el["id_key"] = hit
+            return "food"
+
+    elif tags.get("amenity") == "charging_station":
+        hit = (first_hit(CHARGER_RULES, strong_search)
+               or first_hit(CHARGER_NAME_RULES, weak_search))
+        if not hit:
+            return None
+        config, fid = hit
+
+        display_name = name
+        if "Unbekannt" in display_name:
+            display_name = (tags.get("brand") or tags.get("operator")
+                            or config["name"])
+            city = tags.get("addr:city")
+            if city:
+                display_name = f"{display_name} ({city})"
+
+        el["clean_info"] = dict(config, name=display_name)
+        el["id_key"] = fid
+        return "charger"
+
+    return None
+
+
+class Place:
+    """
+    Eingeordneter Ladepunkt bzw. eingeordnetes Lokal. Statt des ganzen
+    Overpass-Elements nur, was Auswertung, Bestand und Datenbank brauchen:
+    Lage, OSM-Typ/ID, Marke (id_key), Anzeigename und Badge aus
+    clean_info, dazu die Werte der QUERY_TAGS als Tupel - genug, um neu
+    einzuordnen. classify() laesst das Rohelement sofort fallen.
+    """
+    __slots__ = ("type", "id", "lat", "lon", "id_key", "name", "badge",
+                 "values", "version", "timestamp")
+
+    def __init__(self, kind, osm_id, lat, lon, id_key, name, badge, values,
+                 version=None, timestamp=None):
+        self.type, self.id, self.lat, self.lon = kind, osm_id, lat, lon
+        self.id_key, self.name, self.badge = id_key, name, badge
+        self.values, self.version, self.timestamp = values, version, timestamp
+
+    @classmethod
+    def of(cls, el):
+        """Aus einem Element, das classify_element() schon eingeordnet hat."""
+        lat, lon = get_coords(el)
+        info = el["clean_info"]
+        return cls(el["type"], el["id"], lat, lon, el["id_key"], info["name"], info["class"],
+                   tuple(map(el.get("tags", {}).get, QUERY_TAGS)),
+                   el.get("version"), el.get("timestamp"))
+
+    @classmethod
+    def from_row(cls, row):
+        """Aus einer Zeile von element_db."""
+        tags = json.loads(row["tags"])
+        info = json.loads(row["clean_info"]) if row["clean_info"] else {}
+        return cls(row["type"], row["id"], row["lat"], row["lon"], row["id_key"],
+                   info.get("name"), info.get("class"),
+                   tuple(tags.get(key) for key in QUERY_TAGS),
+                   row["version"], row["timestamp"])
+
+    def tags(self):
+        return {key: v for key, v in zip(QUERY_TAGS, self.values) if v is not None}
+
+    def tag(self, key, default=None):
+        value = self.values[_TAG_INDEX[key]]
+        return default if value is None else value
+
+    def element(self):
+        """Wieder als Element im Format von "out center" (ohne clean_info)."""
+        el = {"type": self.type, "id": self.id}
+        if self.type == "node":
+            el["lat"], el["lon"] = self.lat, self.lon
+        else:
+            el["center"] = {"lat": self.lat, "lon": self.lon}
+        tags = self.tags()
+        if tags:
+            el["tags"] = tags
+        if self.version is not None:
+            el["version"] = self.version
+        if self.timestamp is not None:
+            el["timestamp"] = self.timestamp
+        return el
+
+
+_TAG_INDEX = {key: i for i, key in enumerate(QUERY_TAGS)}
+
+
 def classify(elements, chargers, restaurants):
-    """Sortiert Elemente in die uebergebenen Listen ein."""
+    """Sortiert Elemente als Place in die uebergebenen Listen ein."""
     for el in elements:
-        tags = el.get("tags", {})
-        name = tags.get("name", "Unbekannt")
-
-        strong_search = " ".join([
-            tags.get("brand", ""), tags.get("operator", ""), tags.get("network", "")
-        ]).lower()
-        weak_search = (name or "").lower()
-        full_search = (weak_search + " " + strong_search).strip()
-
-        is_poi = (
-            tags.get("amenity") in
-            ["fast_food", "restaurant", "cafe", "lounge", "vending_machine"]
-            or tags.get("shop") in ["kiosk", "convenience"]
-        )
-
-        if is_poi:
-            config = fid = None
-
-            for kw in LOUNGE_KEYWORDS:
-                if kw in full_search:
-                    config, fid = ALLOWED_FOOD["lounge"], "lounge"
-                    break
+        kind = classify_element(el)
+        if kind == "charger":
+            chargers.append(Place.of(el))
+        elif kind == "food":
+            restaurants.append(Place.of(el))
 
-            if not config:
-                for k, c in ALLOWED_FOOD.items():
-                    if k != "lounge" and k in full_search:
-                        config, fid = c, k
-                        if k == "kentucky":
-                            fid = "kfc"
-                        break
-
-            if config:
-                el["clean_info"] = config
-                el["id_key"] = fid
-                restaurants.append(el)
-
-        elif tags.get("amenity") == "charging_station":
-            config = fid = None
-
-            for k, c in ALLOWED_CHARGERS.items():
-                if k in strong_search:
-                    config, fid = c, ("aral" if k == "pulse" else k)
-                    break
 
-            if not config:
-                if "supercharger" in weak_search:
-                    config, fid = ALLOWED_CHARGERS["tesla"], "tesla"
-                else:
-                    for k, c in ALLOWED_CHARGERS.items():
-                        if k in weak_search:
-                            config, fid = c, ("aral" if k == "pulse" else k)
-                            break
+def classify_batch(elements):
+    """classify() fuer einen Streifen/Block, Rueckgabe (Ladepunkte, Lokale)."""
+    chargers, restaurants = [], []
+    classify(elements, chargers, restaurants)
+    return chargers, restaurants
 
-            if not config:
-                continue
 
-            display_name = name
-            if "Unbekannt" in display_name:
-                display_name = (tags.get("brand") or tags.get("operator")
-                                or config["name"])
-                city = tags.get("addr:city")
-                if city:
-                    display_name = f"{display_name} ({city})"
+def classify_file(path, count):
+    """
+    Eine Cache-Datei lesen und einordnen, ohne die Elemente erst als Liste
+    zu sammeln. Rueckgabe wie classify_batch() oder None, wenn die Datei
+    nicht lesbar ist oder nicht count Elemente enthaelt.
+    """
+    chargers, restaurants = [], []
+    total = 0
+    try:
+        for el in cache_elements(path):
+            total += 1
+            classify((el,), chargers, restaurants)
+    except (OSError, ValueError, EOFError):
+        return None
+    return (chargers, restaurants) if total == count else None
+
 
-            el["clean_info"] = dict(config, name=display_name)
-            el["id_key"] = fid
-            chargers.append(el)
+def classify_pool():
+    """ProcessPoolExecutor fuer die Einordnung oder None (CLASSIFY_PROCESSES)."""
+    if not CLASSIFY_PROCESSES:
+        return None
+    workers = os.cpu_count() if CLASSIFY_PROCESSES < 0 else CLASSIFY_PROCESSES
+    # spawn statt fork: Im Hauptprozess laufen schon Threads (SlotMonitor,
+    # Downloads), ein fork koennte deren Locks gesperrt mitnehmen.
+    return concurrent.futures.ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _coord_arrays(places):
+    """Places mit Koordinaten sowie deren lat/lon als Listen."""
+    kept, lats, lons = [], [], []
+    for p in places:
+        if p.lat is not None:
+            kept.append(p)
+            lats.append(p.lat)
+            lons.append(p.lon)
+    return kept, lats, lons
 
 
 def deduplicate(chargers):
     """
-    Entfernt Ladepunkte desselben Anbieters innerhalb von 30 m.
-    Gitter-basiert statt paarweise - bei bundesweiten Daten waere der
-    urspruengliche O(n^2)-Vergleich sonst nicht mehr handhabbar.
+    Entfernt Ladepunkte desselben Anbieters innerhalb von
+    DEDUP_RADIUS_METERS. Ein Punkt bleibt, wenn kein frueher behaltener
+    Punkt desselben Anbieters naeher liegt. Ueber SpatialIndex statt
+    paarweise - bei bundesweiten Daten waere O(n^2) nicht handhabbar.
     """
+    points, lats, lons = _coord_arrays(chargers)
+    if not points:
+        return []
+    if numpy_enabled():
+        return _deduplicate_numpy(points, lats, lons)
+
+    ref_lat = sum(lats) / len(lats)
     seen = {}
     result = []
-    # ~0.0005 Grad entsprechen rund 40 m Breitengrad-Abstand.
-    for el in chargers:
-        lat, lon = get_coords(el)
-        if lat is None:
-            continue
-        cell = (el["id_key"], round(lat / 0.0005), round(lon / 0.0008))
-        neighbours = []
-        for dy in (-1, 0, 1):
-            for dx in (-1, 0, 1):
-                neighbours.extend(seen.get((cell[0], cell[1] + dy, cell[2] + dx), []))
-
-        if any(calculate_distance(lat, lon, o[0], o[1]) < 30 for o in neighbours):
+    for el, lat, lon in zip(points, lats, lons):
+        index = seen.get(el.id_key)
+        if index is None:
+            index = seen[el.id_key] = SpatialIndex(DEDUP_RADIUS_METERS, ref_lat)
+        elif index.any_within(lat, lon, DEDUP_RADIUS_METERS, strict=True):
             continue
-
-        seen.setdefault(cell, []).append((lat, lon))
+        index.add(lat, lon, el)
         result.append(el)
     return result
 
 
-def match_pairs(chargers, restaurants):
+def _deduplicate_numpy(points, lats, lons):
     """
-    Ordnet jedem Ladepunkt das naechstgelegene passende Lokal zu.
-    Restaurants werden vorab in ein Raster einsortiert, damit nicht jeder
-    Ladepunkt gegen alle Lokale geprueft werden muss.
+    Wie deduplicate(), aber alle Abstaende in einem Rutsch. Zuerst werden
+    die Konflikte mit frueheren Ladepunkten desselben Anbieters gesammelt,
+    danach entscheidet ein Durchlauf in Eingabereihenfolge, wer bleibt -
+    das Ergebnis ist identisch zur Python-Variante.
     """
-    grid = {}
-    for r in restaurants:
-        lat, lon = get_coords(r)
-        if lat is None:
-            continue
-        grid.setdefault((round(lat / 0.01), round(lon / 0.015)), []).append((lat, lon, r))
+    index = SpatialIndex.build(lats, lons, range(len(points)), DEDUP_RADIUS_METERS)
+    q, t, _ = index.pairs_within(lats, lons, DEDUP_RADIUS_METERS, strict=True)
+    codes = {}
+    provider = numpy.array([codes.setdefault(el.id_key, len(codes)) for el in points])
+    conflict = (t < q) & (provider[q] == provider[t])
+
+    # Nur Punkte mit Konflikten brauchen den sequenziellen Durchlauf.
+    earlier = {}
+    for i, j in zip(q[conflict].tolist(), t[conflict].tolist()):
+        earlier.setdefault(i, []).append(j)
+    kept = [True] * len(points)
+    for i in sorted(earlier):
+        kept[i] = not any(kept[j] for j in earlier[i])
+    return [el for el, k in zip(points, kept) if k]
+
+
+def nearest_food(chargers, restaurants, k=None):
+    """
+    Fuer jeden Ladepunkt die naechstgelegenen Lokale innerhalb von
+    SEARCH_RADIUS_METERS, je Marke (id_key) nur das naechste, hoechstens
+    k Marken (Standard FOOD_OPTIONS).
+    Rueckgabe: Liste (charger, lat, lon, [(food, dist), ...]) in
+    Eingabereihenfolge, Lokale nach Abstand, nur Ladepunkte mit Treffer.
+    Bei gleichem Abstand gewinnt das in restaurants zuerst stehende Lokal.
+    """
+    k = k or FOOD_OPTIONS
+    points, c_lats, c_lons = _coord_arrays(chargers)
+    foods, r_lats, r_lons = _coord_arrays(restaurants)
+    if not points or not foods:
+        return []
+    index = SpatialIndex.build(r_lats, r_lons, foods, SEARCH_RADIUS_METERS)
+
+    if numpy_enabled():
+        return _nearest_food_numpy(points, c_lats, c_lons, foods, index, k)
+
+    found = []
+    for c, c_lat, c_lon in zip(points, c_lats, c_lons):
+        options, brands = [], set()
+        for dist, food in index.within(c_lat, c_lon, SEARCH_RADIUS_METERS):
+            if food.id_key not in brands:
+                brands.add(food.id_key)
+                options.append((food, dist))
+                if len(options) == k:
+                    break
+        if options:
+            found.append((c, c_lat, c_lon, options))
+    return found
 
-    matches = []
-    for c in chargers:
-        c_lat, c_lon = get_coords(c)
-        if c_lat is None:
-            continue
 
-        cy, cx = round(c_lat / 0.01), round(c_lon / 0.015)
-        best_food, closest = None, float("inf")
+def _nearest_food_numpy(points, c_lats, c_lons, foods, index, k):
+    """nearest_food() mit einem einzigen pairs_within() fuer alle Ladepunkte."""
+    q, t, dist = index.pairs_within(c_lats, c_lons, SEARCH_RADIUS_METERS)
 
-        for dy in (-1, 0, 1):
-            for dx in (-1, 0, 1):
-                for r_lat, r_lon, r in grid.get((cy + dy, cx + dx), []):
-                    dist = calculate_distance(c_lat, c_lon, r_lat, r_lon)
-                    if dist <= SEARCH_RADIUS_METERS and dist < closest:
-                        closest, best_food = dist, r
+    # Je (Ladepunkt, Marke) nur das erste - also naechste - Paar behalten.
+    # Der stabile Sort erhaelt die Abstandsreihenfolge innerhalb der Gruppe.
+    codes = {}
+    brand = numpy.array([codes.setdefault(f.id_key, len(codes)) for f in foods])
+    group = q * max(len(codes), 1) + brand[t]
+    order = numpy.argsort(group, kind="stable")
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = group[order][1:] != group[order][:-1]
+    keep = numpy.sort(order[first])
+    q, t, dist = q[keep], t[keep], dist[keep]
 
-        if not best_food:
-            continue
+    # Davon die ersten k je Ladepunkt.
+    starts = numpy.flatnonzero(numpy.r_[True, q[1:] != q[:-1]])
+    rank = numpy.arange(len(q)) - numpy.repeat(starts, numpy.diff(numpy.r_[starts, len(q)]))
+    keep = rank < k
+    q, t, dist = q[keep].tolist(), t[keep].tolist(), dist[keep].tolist()
 
-        food_name = best_food.get("tags", {}).get(
-            "name", best_food["clean_info"]["name"])
-        charger_name = c["clean_info"]["name"]
+    found = []
+    for i, j, d in zip(q, t, dist):
+        if not found or found[-1][0] is not points[i]:
+            found.append((points[i], c_lats[i], c_lons[i], []))
+        found[-1][3].append((foods[j], d))
+    return found
+
+
+def food_name_of(food):
+    return food.tag("name", food.name)
+
+
+def match_pairs(chargers, restaurants):
+    """
+    Ordnet jedem Ladepunkt die naechstgelegenen passenden Lokale zu
+    (siehe nearest_food). Die Felder auf oberster Ebene beschreiben wie
+    bisher das naechste Lokal, "foods" listet alle Optionen.
+    """
+    matches = []
+    for c, c_lat, c_lon, options in nearest_food(chargers, restaurants):
+        best_food, closest = options[0]
+        food_name = food_name_of(best_food)
+        charger_name = c.name
+
+        more = ""
+        if len(options) > 1:
+            more = (
+                f"<div style='font-size:0.85em; color:#666; margin-top:4px;'>"
+                f"Außerdem: "
+                + ", ".join(f"{food_name_of(f)} ({int(d)}m)" for f, d in options[1:])
+                + "</div>"
+            )
 
         matches.append({
             "lat": c_lat,
             "lon": c_lon,
-            "charger_id": c["id_key"],
-            "food_id": best_food["id_key"].replace(" ", "-"),
+            "charger_id": c.id_key,
+            "food_id": best_food.id_key.replace(" ", "-"),
             "title": charger_name,
-            "badge_class": c["clean_info"]["class"],
+            "badge_class": c.badge,
             "note": f"{int(closest)}m zu {food_name}",
             "popup_name": charger_name,
             "description": (
@@ -471,14 +2121,707 @@ def match_pairs(chargers, restaurants):
                 f"<span style='font-weight:600;'>{food_name}</span></div>"
                 f"<div style='font-size:0.85em; color:#666; margin-top:2px;'>"
                 f"Entfernung: {int(closest)}m</div>"
+                f"{more}"
             ),
-            "unique_id": f"{c.get('type')}{c.get('id')}_"
-                         f"{best_food.get('type')}{best_food.get('id')}",
+            "foods": [
+                {"food_id": f.id_key.replace(" ", "-"), "name": food_name_of(f),
+                 "dist": int(d)}
+                for f, d in options
+            ],
+            "unique_id": f"{c.type}{c.id}_{best_food.type}{best_food.id}",
         })
 
     return matches
 
 
+# ============================================================
+# AUSGABE
+# ============================================================
+
+def compact_output(matches):
+    """
+    Treffer spaltenweise: je Feld eine Liste, die Lokale je Ladepunkt als
+    [food_id, Name, Abstand], das naechste zuerst. Alles Weitere (Badge,
+    Hinweis, Popup) leitet index.html daraus ab.
+    """
+    return {
+        "format": "compact-1",
+        "lat": [round(m["lat"], COORD_DECIMALS) for m in matches],
+        "lon": [round(m["lon"], COORD_DECIMALS) for m in matches],
+        "charger_id": [m["charger_id"] for m in matches],
+        "title": [m["title"] for m in matches],
+        "foods": [[[f["food_id"], f["name"], f["dist"]] for f in m["foods"]]
+                  for m in matches],
+    }
+
+
+def output_text(matches, fmt=None):
+    """data.json als Text im OUTPUT_FORMAT."""
+    if (fmt or OUTPUT_FORMAT) == "compact":
+        return json.dumps(compact_output(matches), ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(matches, ensure_ascii=False, indent=2)
+
+
+def _write_file(path, payload):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def content_hash(payload):
+    return hashlib.sha256(payload).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(path, digest):
+    """data.json -> data.<digest>.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def tile_of(lat, lon, zoom=None):
+    """(x, y) der Slippy-Map-Kachel, in der der Punkt liegt."""
+    n = 2 ** (zoom or TILE_ZOOM)
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def write_tiles(matches, keep=()):
+    """
+    Treffer je Kachel als TILE_DIR/<zoom>-<x>-<y>.<hash>.json im kompakten
+    Format. Andere .json in TILE_DIR werden geloescht, ausser den Namen
+    in keep. Rueckgabe ([x, y, Anzahl, Hash] je Kachel, Bytes).
+    """
+    tiles = {}
+    for m in matches:
+        tiles.setdefault(tile_of(m["lat"], m["lon"]), []).append(m)
+    os.makedirs(TILE_DIR, exist_ok=True)
+    entries, names, total = [], set(keep), 0
+    for (x, y), members in sorted(tiles.items()):
+        payload = output_text(members, "compact").encode("utf-8")
+        digest = content_hash(payload)
+        name = f"{TILE_ZOOM}-{x}-{y}.{digest}.json"
+        if not os.path.exists(os.path.join(TILE_DIR, name)):
+            _write_file(os.path.join(TILE_DIR, name), payload)
+        entries.append([x, y, len(members), digest])
+        names.add(name)
+        total += len(payload)
+    for name in os.listdir(TILE_DIR):
+        if name.endswith(".json") and name not in names:
+            os.remove(os.path.join(TILE_DIR, name))
+    return entries, total
+
+
+def load_manifest():
+    """Das zuletzt geschriebene MANIFEST_FILE oder None."""
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def drop_manifest(manifest):
+    """MANIFEST_FILE und die darin genannten Kacheln loeschen."""
+    tiles = (manifest or {}).get("tiles") or {}
+    for x, y, _, digest in tiles.get("tiles", []):
+        path = os.path.join(tiles.get("dir", TILE_DIR),
+                            f"{tiles.get('zoom')}-{x}-{y}.{digest}.json")
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(MANIFEST_FILE):
+        os.remove(MANIFEST_FILE)
+
+
+def write_output(matches, osm_base=None):
+    """
+    Schreibt OUTPUT_FILENAME, mit OUTPUT_HASHED dieselben Daten auch unter
+    Inhalts-Hash, mit OUTPUT_TILES die Kacheln und zuletzt MANIFEST_FILE;
+    mit OUTPUT_COMPRESSED samt .gz/.br. Aeltere Hash-Dateien werden
+    aufgeraeumt, ohne OUTPUT_HASHED auch Manifest und Kacheln eines
+    frueheren Laufs. Rueckgabe: Groessen je Datei (Kacheln zusammen) in Bytes.
+    """
+    previous = load_manifest() or {}
+    data = output_text(matches).encode("utf-8")
+    digest = content_hash(data)
+    name = hashed_name(OUTPUT_FILENAME, digest) if OUTPUT_HASHED else OUTPUT_FILENAME
+    files = {OUTPUT_FILENAME: data, name: data}
+    if OUTPUT_COMPRESSED:
+        # mtime=0, damit gleiche Daten auch eine gleiche Datei ergeben.
+        files[name + ".gz"] = gzip.compress(data, 9, mtime=0)
+        if brotli is not None:
+            files[name + ".br"] = brotli.compress(data, quality=11)
+    for path, payload in files.items():
+        _write_file(path, payload)
+    sizes = {path: len(payload) for path, payload in files.items()}
+
+    if not OUTPUT_HASHED:
+        # Ein liegengebliebenes Manifest hielte index.html auf altem Stand.
+        drop_manifest(previous)
+        previous = {}
+    else:
+        manifest = {
+            "format": "manifest-1",
+            "hash": digest,
+            "generated_at": datetime.datetime.now(
+                datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "osm_base": osm_base,
+            "counts": {
+                "matches": len(matches),
+                "chargers": dict(sorted(collections.Counter(
+                    m["charger_id"] for m in matches).items())),
+            },
+            "data": name,
+        }
+        if OUTPUT_TILES:
+            old_tiles = previous.get("tiles") or {}
+            keep = [f"{old_tiles.get('zoom')}-{x}-{y}.{h}.json"
+                    for x, y, _, h in old_tiles.get("tiles", [])]
+            entries, sizes[TILE_DIR + "/"] = write_tiles(matches, keep)
+            manifest["tiles"] = {"dir": TILE_DIR, "zoom": TILE_ZOOM, "tiles": entries}
+        payload = json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        _write_file(MANIFEST_FILE, payload)
+        sizes[MANIFEST_FILE] = len(payload)
+
+    # data.<hash>.json[.gz|.br] ausser dem aktuellen und dem vorigen Stand,
+    # dazu die frueheren ungehashten data.json.gz/.br.
+    folder, base = os.path.split(OUTPUT_FILENAME)
+    root, ext = os.path.splitext(base)
+    pattern = re.compile(re.escape(root) + r"(\.[0-9a-f]{%d})?" % HASH_LENGTH
+                         + re.escape(ext) + r"(\.gz|\.br)?$")
+    keep = {os.path.basename(p) for p in files} | {base}
+    if previous.get("data"):
+        old = os.path.basename(previous["data"])
+        keep |= {old, old + ".gz", old + ".br"}
+    for entry in os.listdir(folder or "."):
+        if pattern.match(entry) and entry not in keep:
+            os.remove(os.path.join(folder, entry))
+    return sizes
+
+
+def load_output(path=None):
+    """
+    Treffer aus einer data.json beider Formate als Liste von dicts mit
+    mindestens lat, lon, charger_id, title und foods.
+    """
+    with open(path or OUTPUT_FILENAME, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+    return [{"lat": lat, "lon": lon, "charger_id": cid, "title": title,
+             "foods": [{"food_id": fid, "name": name, "dist": dist}
+                       for fid, name, dist in foods]}
+            for lat, lon, cid, title, foods in zip(
+                data["lat"], data["lon"], data["charger_id"], data["title"], data["foods"])]
+
+
+# ============================================================
+# INKREMENTELLER MODUS
+# ============================================================
+
+def area_bbox():
+    return f"{LAT_START},{LON_START},{LAT_END},{LON_END}"
+
+
+def store_fingerprint():
+    """Aendert sich, sobald Query oder Zuordnungstabellen andere Elemente liefern."""
+    basis = json.dumps([build_query("{bbox}", around=False), ALLOWED_CHARGERS, ALLOWED_FOOD,
+                        LOUNGE_KEYWORDS], sort_keys=True)
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+
+def load_store():
+    """
+    Elementbestand des letzten vollstaendigen Laufs als
+    {"osm_base": ..., "elements": {(type, id): element}} oder None, wenn
+    keiner da ist oder er nicht mehr zur aktuellen Konfiguration passt.
+    """
+    header = cache_header(STORE_FILE) if os.path.exists(STORE_FILE) else None
+    if header is None or header.get("fingerprint") != store_fingerprint():
+        return None
+    if (time.time() - header.get("created", 0)) / 86400 > STORE_MAX_AGE_DAYS:
+        return None
+    elements = {}
+    try:
+        for el in cache_elements(STORE_FILE):
+            elements[(el["type"], el["id"])] = el
+    except (OSError, ValueError, EOFError, KeyError):
+        return None
+    if len(elements) != header.get("count"):
+        return None
+    return {"osm_base": header["osm_base"], "created": header["created"],
+            "elements": elements}
+
+
+def save_store(places, osm_base, created=None):
+    """
+    Schreibt den Bestand als Elemente ohne die abgeleiteten Felder.
+    created bleibt bei inkrementellen Laeufen das Datum des letzten vollen
+    Scans, damit STORE_MAX_AGE_DAYS regelmaessig einen Neuabgleich erzwingt.
+    """
+    unique = {}
+    for p in places:
+        unique[(p.type, p.id)] = p.element()
+    header = {
+        "format": CACHE_FORMAT,
+        "fingerprint": store_fingerprint(),
+        "osm_base": osm_base,
+        "count": len(unique),
+        "created": created or time.time(),
+    }
+    tmp = STORE_FILE + ".tmp"
+    try:
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for key in sorted(unique):
+                f.write(json.dumps(unique[key], ensure_ascii=False) + "\n")
+        os.replace(tmp, STORE_FILE)
+    except OSError:
+        pass
+
+
+def build_diff_query(since):
+    return build_query(area_bbox(),
+                       f'[out:xml][timeout:{QUERY_TIMEOUT}][adiff:"{since}"]',
+                       trim=False, around=False)
+
+
+def _xml_element(node):
+    """<node>/<way>/<relation> aus einem Augmented Diff im Format von out:json."""
+    el = {"type": node.tag, "id": int(node.get("id"))}
+    if node.get("lat") is not None:
+        el["lat"], el["lon"] = float(node.get("lat")), float(node.get("lon"))
+    center = node.find("center")
+    if center is not None:
+        el["center"] = {"lat": float(center.get("lat")),
+                        "lon": float(center.get("lon"))}
+    tags = {t.get("k"): t.get("v") for t in node.findall("tag")}
+    if tags:
+        el["tags"] = tags
+    if node.get("version"):
+        el["version"] = int(node.get("version"))
+    if node.get("timestamp"):
+        el["timestamp"] = node.get("timestamp")
+    return el
+
+
+def read_adiff(r):
+    """
+    reader fuer overpass_query(): liest einen Augmented Diff gestreamt.
+    Jedes Element traegt zusaetzlich "action" (create/modify/delete).
+    """
+    r.raw.decode_content = True
+    changes, remark, osm_base = [], "", None
+    try:
+        for _, node in ElementTree.iterparse(r.raw):
+            if node.tag == "meta":
+                osm_base = node.get("osm_base")
+            elif node.tag == "remark":
+                remark = node.text or ""
+            elif node.tag == "action":
+                kind = node.get("type")
+                if kind == "create":
+                    source = node
+                elif kind == "delete":
+                    source = node.find("old")
+                else:
+                    source = node.find("new")
+                if source is not None and len(source):
+                    el = _xml_element(source[0])
+                    el["action"] = kind
+                    changes.append(el)
+                node.clear()
+    except ElementTree.ParseError as exc:
+        raise ValueError(str(exc))
+    return changes, remark, osm_base
+
+
+def apply_changes(elements, changes):
+    """
+    Fuehrt einen Augmented Diff in den Bestand ein. Geaenderte Elemente
+    werden neu klassifiziert - wer dabei herausfaellt, fliegt raus.
+    Rueckgabe: (neu/geaendert, entfernt).
+    """
+    upserted = removed = 0
+    for el in changes:
+        key = (el["type"], el["id"])
+        if el.pop("action") != "delete" and classify_element(el):
+            elements[key] = el
+            upserted += 1
+        elif elements.pop(key, None) is not None:
+            removed += 1
+    return upserted, removed
+
+
+def scan_incremental(store):
+    """
+    Holt nur die Aenderungen seit dem Stand von store.
+    Rueckgabe wie scan_strips() oder None, wenn ein voller Scan noetig ist.
+    """
+    print(f"Inkrementell seit {store['osm_base']} "
+          f"({len(store['elements'])} Elemente im Bestand) ...", end="", flush=True)
+    meta = {}
+    changes = overpass_query(build_diff_query(store["osm_base"]),
+                             reader=read_adiff, meta=meta)
+    if changes is None or not meta.get("osm_base"):
+        print(" -> fehlgeschlagen, voller Scan")
+        return None
+    upserted, removed = apply_changes(store["elements"], changes)
+    print(f" -> {upserted} neu/geaendert, {removed} entfernt")
+
+    chargers, restaurants = [], []
+    classify(store["elements"].values(), chargers, restaurants)
+    return chargers, restaurants, [], meta["osm_base"]
+
+
+# ============================================================
+# PBF-IMPORT
+# ============================================================
+
+def _pbf_tags(tags, food_name):
+    """
+    Dieselbe Vorauswahl wie build_query() - Ladepunkte, Lokale nur mit
+    passendem Namen. Rueckgabe die QUERY_TAGS des Objekts oder None.
+    """
+    amenity, shop = tags.get("amenity"), tags.get("shop")
+    if amenity != "charging_station":
+        if (amenity not in ("fast_food", "restaurant", "cafe", "lounge", "vending_machine")
+                and shop not in ("kiosk", "convenience")):
+            return None
+        if not food_name.search(tags.get("name", "")):
+            return None
+    return {key: tags[key] for key in QUERY_TAGS if key in tags}
+
+
+def _bounds(points):
+    """(sued, west, nord, ost) einer Punktliste oder None."""
+    if not points:
+        return None
+    lats = [lat for lat, _ in points]
+    lons = [lon for _, lon in points]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def _pbf_meta(obj):
+    """version/timestamp eines Objekts, soweit der Extrakt sie enthaelt."""
+    meta = {}
+    if obj.version:
+        meta["version"] = obj.version
+    if obj.timestamp and obj.timestamp.year > 1970:
+        meta["timestamp"] = obj.timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return meta
+
+
+def _pbf_element(kind, osm_id, tags, box, meta=None):
+    """Element wie aus "out center"; None ausserhalb des Gebiets."""
+    if box is None:
+        return None
+    lat, lon = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+    if not (LAT_START <= lat <= LAT_END and LON_START <= lon <= LON_END):
+        return None
+    el = {"type": kind, "id": osm_id}
+    if kind == "node":
+        el["lat"], el["lon"] = lat, lon
+    else:
+        el["center"] = {"lat": lat, "lon": lon}
+    if tags:
+        el["tags"] = tags
+    if meta:
+        el.update(meta)
+    return el
+
+
+def read_pbf(path, info=None):
+    """
+    Liefert die Objekte, die build_query() fuer das Gebiet holen wuerde,
+    aus einem OSM-Extrakt - im Format von "out center", Wege mit dem
+    Mittelpunkt ihrer Bounding Box. pyosmium entpackt die Bloecke parallel
+    und laesst nur Objekte mit amenity/shop bis nach Python durch.
+    Relationen brauchen fuer ihren Mittelpunkt einen zweiten Lauf ueber
+    ihre Mitglieder; den gibt es nur, wenn welche gefunden wurden.
+    info bekommt den Replikationsstand der Datei als "osm_base".
+    """
+    pool = osmium.io.ThreadPool(PBF_THREADS)
+    food_name = re.compile(FOOD_REGEX, re.I)
+    processor = (osmium.FileProcessor(path, thread_pool=pool)
+                 .with_locations(PBF_LOCATIONS)
+                 .with_filter(osmium.filter.KeyFilter("amenity", "shop")))
+    if info is not None:
+        info["osm_base"] = processor.header.get("osmosis_replication_timestamp") or None
+
+    relations = []
+    for obj in processor:
+        tags = _pbf_tags(obj.tags, food_name)
+        if tags is None:
+            continue
+        if obj.is_node():
+            box = _bounds([(obj.lat, obj.lon)] if obj.location.valid() else [])
+            el = _pbf_element("node", obj.id, tags, box, _pbf_meta(obj))
+        elif obj.is_way():
+            box = _bounds([(n.lat, n.lon) for n in obj.nodes if n.location.valid()])
+            el = _pbf_element("way", obj.id, tags, box, _pbf_meta(obj))
+        else:
+            relations.append((obj.id, tags, [(m.type, m.ref) for m in obj.members],
+                              _pbf_meta(obj)))
+            continue
+        if el is not None:
+            yield el
+
+    if not relations:
+        return
+    # Wie Overpass: Mittelpunkt ueber alle Knoten- und Wege-Mitglieder,
+    # Unterrelationen zaehlen nicht.
+    wanted = {"n": set(), "w": set()}
+    for _, _, members, _ in relations:
+        for kind, ref in members:
+            if kind in wanted:
+                wanted[kind].add(ref)
+    boxes = {}
+    members = (osmium.FileProcessor(path, osmium.osm.NODE | osmium.osm.WAY, thread_pool=pool)
+               .with_locations(PBF_LOCATIONS)
+               .with_filter(osmium.filter.IdFilter(wanted["n"]).enable_for(osmium.osm.NODE))
+               .with_filter(osmium.filter.IdFilter(wanted["w"]).enable_for(osmium.osm.WAY)))
+    for obj in members:
+        if obj.is_node():
+            if obj.location.valid():
+                boxes[("n", obj.id)] = (obj.lat, obj.lon, obj.lat, obj.lon)
+        else:
+            box = _bounds([(n.lat, n.lon) for n in obj.nodes if n.location.valid()])
+            if box is not None:
+                boxes[("w", obj.id)] = box
+    for osm_id, tags, refs, meta in relations:
+        found = [boxes[ref] for ref in refs if ref in boxes]
+        box = (_bounds([corner for b in found for corner in ((b[0], b[1]), (b[2], b[3]))])
+               if found else None)
+        el = _pbf_element("relation", osm_id, tags, box, meta)
+        if el is not None:
+            yield el
+
+
+def scan_pbf(path):
+    """
+    Wie scan_strips(), aber aus einem lokalen OSM-Extrakt statt Overpass.
+    None, wenn pyosmium fehlt oder die Datei nicht lesbar ist.
+    """
+    if osmium is None:
+        print("pyosmium fehlt (pip install osmium) - PBF-Import nicht moeglich.")
+        return None
+    print(f"Lese {path} ...", end="", flush=True)
+    t0 = time.time()
+    info, total = {}, 0
+    chargers, restaurants = [], []
+    pool = classify_pool()
+    batch, batches = [], []
+    try:
+        for el in read_pbf(path, info):
+            total += 1
+            if pool is None:
+                classify((el,), chargers, restaurants)
+                continue
+            # pyosmium liest weiter, waehrend die Worker einordnen.
+            batch.append(el)
+            if len(batch) == CLASSIFY_BATCH:
+                batches.append(pool.submit(classify_batch, batch))
+                batch = []
+        if batch:
+            batches.append(pool.submit(classify_batch, batch))
+        for future in batches:
+            found_c, found_r = future.result()
+            chargers.extend(found_c)
+            restaurants.extend(found_r)
+    except (OSError, RuntimeError) as exc:
+        print(f" -> fehlgeschlagen ({exc})")
+        return None
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    _count("pbf_objects", total)
+    print(f" [{time.time() - t0:.0f}s, {total} Objekte, Stand {info.get('osm_base') or '?'}]")
+    return chargers, restaurants, [], info.get("osm_base")
+
+
+# ============================================================
+# ELEMENT-DATENBANK
+# ============================================================
+
+def db_fingerprint():
+    """Aendert sich, sobald Einordnung, Radien oder Trefferformat anders ausfallen."""
+    basis = json.dumps([DB_FORMAT, ALLOWED_CHARGERS, ALLOWED_FOOD, LOUNGE_KEYWORDS,
+                        DEDUP_RADIUS_METERS, SEARCH_RADIUS_METERS, FOOD_OPTIONS],
+                       sort_keys=True)
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+
+def _db_key(p):
+    return p.type, p.id
+
+
+def _match_rows(chargers, restaurants):
+    """match_pairs() als {(type, id) des Ladepunkts: Treffer ohne unique_id}."""
+    keys = {f"{c.type}{c.id}": _db_key(c) for c in chargers}
+    rows = {}
+    for m in match_pairs(chargers, restaurants):
+        rows[keys[m.pop("unique_id").split("_", 1)[0]]] = m
+    return rows
+
+
+def db_refresh(db, dirty=None):
+    """
+    Bringt kept-Flags und Treffer in db auf den Stand der Elemente. Ohne
+    dirty voll, sonst nur rund um die Stellen aus ElementDB.sync():
+      - entdoppelt werden alle Ladepunkte, die ueber eine Kette von
+        Nachbarn desselben Anbieters (DEDUP_RADIUS_METERS) mit einer
+        Aenderung verbunden sind - nur fuer sie kann sich etwas aendern;
+      - gepaart werden die davon behaltenen und alle behaltenen Ladepunkte
+        im SEARCH_RADIUS_METERS um geaenderte Lokale.
+    Beides ueber deduplicate()/match_pairs() auf der Teilmenge, in derselben
+    Reihenfolge (type, id) wie der volle Durchlauf - das Ergebnis ist
+    dasselbe. Rueckgabe: Zahl der neu gepaarten Ladepunkte.
+    """
+    if dirty is None:
+        chargers = db.elements(kind="charger")
+        kept = deduplicate(chargers)
+        db.set_kept([_db_key(c) for c in chargers], [_db_key(c) for c in kept])
+        db.set_matches([_db_key(c) for c in chargers],
+                       _match_rows(kept, db.elements(kind="food")))
+        return len(kept)
+
+    # Ein Meter Zugabe gegen Rundung; mehr Kandidaten schaden nicht.
+    slack = 1.0
+    component = set()
+    frontier = [(lat, lon, id_key) for kind, id_key, lat, lon in dirty if kind == "charger"]
+    while frontier:
+        lat, lon, id_key = frontier.pop()
+        for _, c in db.near(lat, lon, DEDUP_RADIUS_METERS + slack,
+                            kind="charger", id_key=id_key):
+            if _db_key(c) not in component:
+                component.add(_db_key(c))
+                frontier.append((c.lat, c.lon, id_key))
+    kept = deduplicate(db.elements(kind="charger", keys=component))
+    db.set_kept(component, [_db_key(c) for c in kept])
+
+    rematch = {_db_key(c) for c in kept}
+    for kind, _, lat, lon in dirty:
+        if kind == "food":
+            rematch.update(_db_key(c) for _, c in db.near(
+                lat, lon, SEARCH_RADIUS_METERS + slack, kind="charger", kept=True))
+    chargers = db.elements(kind="charger", kept=True, keys=rematch)
+    foods = {}
+    for c in chargers:
+        for _, food in db.near(c.lat, c.lon, SEARCH_RADIUS_METERS + slack, kind="food"):
+            foods[_db_key(food)] = food
+    db.set_matches(component | rematch,
+                   _match_rows(chargers, [foods[key] for key in sorted(foods)]))
+    return len(chargers)
+
+
+def history_cutoff(osm_base):
+    """Aeltester OSM-Stand, dessen Fassungen in history bleiben; None = keiner."""
+    if DB_HISTORY_DAYS <= 0:
+        return None
+    try:
+        base = datetime.datetime.strptime(osm_base[:10], "%Y-%m-%d")
+    except ValueError:
+        base = datetime.datetime.now(datetime.timezone.utc)
+    return (base - datetime.timedelta(days=DB_HISTORY_DAYS)).strftime("%Y-%m-%d")
+
+
+def db_update(chargers, restaurants, osm_base, complete, source):
+    """
+    Gleicht einen Lauf mit ELEMENT_DB ab und liefert (behaltene
+    Ladepunkte, Treffer) daraus - oder None ohne Datenbank, dann rechnet
+    main() wie bisher alles im Speicher.
+    """
+    if not USE_ELEMENT_DB or not element_db.available():
+        return None
+    osm_base = osm_base or datetime.datetime.now(
+        datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    t0 = time.time()
+    with element_db.ElementDB(ELEMENT_DB, Place.from_row) as db:
+        full = db.get_meta("fingerprint") != db_fingerprint()
+        dirty = db.sync(chargers, restaurants, osm_base, complete=complete, source=source,
+                        history=DB_HISTORY_DAYS > 0)
+        db.prune_history(history_cutoff(osm_base))
+        if full:
+            db.reclassify(classify_element)
+        counts = db.counts()
+        if full or len(dirty) > DB_FULL_REFRESH_SHARE * (counts["chargers"] + counts["foods"]):
+            db_refresh(db)
+            mode = "voll"
+        else:
+            mode = f"{db_refresh(db, dirty)} Ladepunkte neu gepaart"
+        db.set_meta("fingerprint", db_fingerprint())
+        matches = db.matches()
+        db.finish_run(len(matches))
+        kept = db.counts()["kept"]
+        changes = db.last_sync
+    print(f"{ELEMENT_DB}: {changes['added']} neu, {changes['changed']} geaendert, "
+          f"{changes['removed']} entfernt -> {mode} [{time.time() - t0:.1f}s]")
+    return kept, matches
+
+
+def db_cli(argv):
+    """python scraper_germany.py db {stats,history,near,rebuild} - Datenbank abfragen."""
+    parser = argparse.ArgumentParser(prog="scraper_germany.py db")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="Bestand und letzte Laeufe")
+    history = sub.add_parser("history", help="geaenderte/entfernte Elemente")
+    history.add_argument("since", nargs="?", help="ab diesem OSM-Stand, z.B. 2026-09-01")
+    near = sub.add_parser("near", help="Elemente im Umkreis eines Punkts")
+    near.add_argument("lat", type=float)
+    near.add_argument("lon", type=float)
+    near.add_argument("radius", type=float, nargs="?", default=SEARCH_RADIUS_METERS)
+    sub.add_parser("rebuild", help="neu einordnen, entdoppeln und paaren, "
+                                   f"{OUTPUT_FILENAME} schreiben - ohne Netz")
+    args = parser.parse_args(argv)
+
+    if not element_db.available():
+        print("SQLite ohne R-Tree-Modul - keine Datenbank moeglich.")
+        return 1
+    if not os.path.exists(ELEMENT_DB):
+        print(f"{ELEMENT_DB} fehlt - erst einen Lauf machen.")
+        return 1
+    with element_db.ElementDB(ELEMENT_DB, Place.from_row) as db:
+        if args.cmd == "stats":
+            counts = db.counts()
+            print(f"{counts['chargers']} Ladepunkte ({counts['kept']} nach Entdopplung), "
+                  f"{counts['foods']} Lokale, {counts['matches']} Treffer, "
+                  f"{counts['removed']} entfernt, {counts['history']} alte Fassungen")
+            for run in db.runs():
+                created = datetime.datetime.fromtimestamp(run["created"])
+                print(f"  {created:%Y-%m-%d %H:%M}  {run['osm_base'] or '-':20s}  "
+                      f"{run['source'] or '-':11s}  {run['elements']:6d} El.  "
+                      f"+{run['added']} ~{run['changed']} -{run['removed']}  "
+                      f"{run['matches'] if run['matches'] is not None else '-'} Treffer")
+            return 0
+
+        if args.cmd == "history":
+            rows = db.history(args.since)
+            for row in rows:
+                name = json.loads(row["tags"] or "{}").get("name", "")
+                print(f"{row['valid_to'] or '-':20s}  {row['action']:6s}  "
+                      f"{row['type']}/{row['id']}  v{row['version'] or '?'}  "
+                      f"{row['kind'] or '-':7s}  {name}")
+            print(f"{len(rows)} Eintraege")
+            return 0
+
+        if args.cmd == "near":
+            for dist, p in db.near(args.lat, args.lon, args.radius):
+                print(f"{dist:6.0f} m  {p.type}/{p.id}  {p.id_key or '-':20s}  {p.name or ''}")
+            return 0
+
+        changed = db.reclassify(classify_element)
+        kept = db_refresh(db)
+        db.set_meta("fingerprint", db_fingerprint())
+        matches = db.matches()
+        runs = db.runs(1)
+    write_output(matches, runs[0]["osm_base"] if runs else None)
+    print(f"{changed} neu eingeordnet, {kept} Ladepunkte nach Entdopplung, "
+          f"{len(matches)} Treffer -> {OUTPUT_FILENAME}")
+    return 0
+
+
 # ============================================================
 # HAUPTPROGRAMM
 # ============================================================
@@ -493,59 +2836,141 @@ def build_strips():
     return strips
 
 
-def main():
-    start = time.time()
-    strips = build_strips()
-
-    print("Ladestoppfinder - Deutschland-Scan v3")
-    print(f"Gebiet: {LAT_START}-{LAT_END} N / {LON_START}-{LON_END} E")
-    print(f"Streifen: {len(strips)} (je {STRIP_HEIGHT} Grad hoch)")
-    print(f"Endpoint: {current_endpoint()}\n")
-
+def scan_strips(strips):
+    """
+    Voller Scan ueber alle Streifen.
+    Rueckgabe: (Ladepunkte, Lokale, fehlgeschlagene Jobs, OSM-Stand).
+    Der OSM-Stand ist None, wenn er nicht fuer jeden Streifen bekannt ist.
+    Mit classify_pool() ordnen Worker-Prozesse die Streifen ein; deren
+    Ergebnisse kommen am Ende in Streifenreihenfolge dazu.
+    """
     all_chargers, all_restaurants = [], []
-    failed = []
+    failed, osm_bases = [], []
+    pool = classify_pool()
+    batches = []
+
+    def merge(label, result):
+        chargers, restaurants = result
+        all_chargers.extend(chargers)
+        all_restaurants.extend(restaurants)
+        _print(f"[{label}] -> +{len(chargers)} Ladepunkte, +{len(restaurants)} Lokale")
+
+    def add_strip(label, elements):
+        if pool is None:
+            merge(label, classify_batch(elements))
+        else:
+            batches.append((label, pool.submit(classify_batch, elements)))
 
-    for idx, (lat_min, lon_min, lat_max, lon_max) in enumerate(strips, 1):
-        bbox = f"{lat_min},{lon_min},{lat_max},{lon_max}"
-        print(f"[{idx}/{len(strips)}] Breite {lat_min}-{lat_max} ...",
-              end="", flush=True)
+    splits = load_splits()
+
+    def record(job):
+        if job.depth > splits.get(job.strip, 0):
+            splits[job.strip] = job.depth
 
-        elements = cache_read(bbox)
-        if elements is None:
-            elements = overpass_query(build_query(bbox))
+    def fetch(jobs):
+        lost = []
+        for job, elements, meta in fetch_strips(jobs):
+            record(job)
             if elements is None:
-                failed.append(bbox)
-                print(" -> FEHLGESCHLAGEN")
+                lost.append((job, meta))
+                _print(f"[{job.label}] {job.bbox} -> FEHLGESCHLAGEN")
                 continue
-            cache_write(bbox, elements)
-        else:
-            print(" [Cache]", end="")
-
-        before_c, before_r = len(all_chargers), len(all_restaurants)
-        classify(elements, all_chargers, all_restaurants)
-        print(f" -> +{len(all_chargers) - before_c} Ladepunkte, "
-              f"+{len(all_restaurants) - before_r} Lokale")
-
-        if idx < len(strips):
-            time.sleep(PAUSE_BETWEEN_STRIPS)
-
-    # Zweiter Anlauf
-    if failed:
-        print(f"\nZweiter Anlauf fuer {len(failed)} Streifen ...")
-        reset_endpoint()
-        still_failed = []
-        for bbox in failed:
-            print(f"  {bbox} ...", end="", flush=True)
-            time.sleep(30)
-            elements = overpass_query(build_query(bbox))
-            if elements is None:
-                still_failed.append(bbox)
-                print(" -> erneut fehlgeschlagen")
+            osm_bases.append(meta.get("osm_base"))
+            add_strip(job.label, elements)
+        return lost
+
+    # Streifen, die frueher schon geteilt werden mussten, gleich in
+    # Teilen anfragen. Cache-Treffer sofort auswerten, nur der Rest geht
+    # ins Netz.
+    jobs, cached = [], []
+    for idx, (lat_min, lon_min, lat_max, lon_max) in enumerate(strips, 1):
+        bbox = f"{lat_min},{lon_min},{lat_max},{lon_max}"
+        pieces = [Job(f"{idx}/{len(strips)}", bbox, bbox, 0)]
+        for _ in range(min(splits.get(bbox, 0), MAX_SPLIT_DEPTH)):
+            pieces = [child for job in pieces for child in split_job(job)]
+        for job in pieces:
+            hit = cache_lookup(build_query(job.bbox))
+            if hit is None:
+                jobs.append(job)
                 continue
-            cache_write(bbox, elements)
-            classify(elements, all_chargers, all_restaurants)
-            print(" -> ok")
-        failed = still_failed
+            path, header = hit
+            result = (classify_file(path, header.get("count")) if pool is None
+                      else pool.submit(classify_file, path, header.get("count")))
+            cached.append((job, header, result))
+    for job, header, result in cached:
+        if pool is not None:
+            result = result.result()
+        if result is None:
+            jobs.append(job)
+            continue
+        _count("cache_hits")
+        osm_bases.append(header.get("osm_base"))
+        print(f"[{job.label}] {job.bbox} [Cache]")
+        merge(job.label, result)
+
+    lost = []
+    if jobs:
+        print(f"\nLade {len(jobs)} Streifen parallel ...")
+        lost = fetch(jobs)
+
+    # Zweiter Anlauf: Was an Laufzeit/Groesse gescheitert ist, wird gleich
+    # in kleineren Teilen angefragt. Alles andere (429, leere Antwort,
+    # toter Mirror) bekommt dieselbe Tiefe noch einmal - sonst verdoppelt
+    # ein einmaliger Fehler die Requests fuer den Streifen auf Dauer.
+    if lost:
+        print(f"\nZweiter Anlauf fuer {len(lost)} Streifen ...")
+        time.sleep(30)
+        retry = []
+        for job, meta in lost:
+            if meta.get("aborts") and job.depth < MAX_SPLIT_DEPTH:
+                retry.extend(split_job(job))
+            else:
+                retry.append(job)
+        lost = fetch(retry)
+    failed = [job for job, _ in lost]
+
+    save_splits(splits)
+    if pool is not None:
+        for label, future in batches:
+            merge(label, future.result())
+        pool.shutdown()
+
+    # Fuer den naechsten inkrementellen Lauf zaehlt der aelteste Stand.
+    osm_base = None if None in osm_bases or not osm_bases else min(osm_bases)
+    return all_chargers, all_restaurants, failed, osm_base
+
+
+def main():
+    start = time.time()
+    strips = build_strips()
+
+    print("Ladestoppfinder - Deutschland-Scan v3")
+    print(f"Gebiet: {LAT_START}-{LAT_END} N / {LON_START}-{LON_END} E")
+    if PBF_FILE:
+        print(f"Quelle: {PBF_FILE}\n")
+    else:
+        print(f"Streifen: {len(strips)} (je {STRIP_HEIGHT} Grad hoch)")
+        print(f"Endpoints: {', '.join(OVERPASS_ENDPOINTS)}\n")
+
+    HEALTH.load(HEALTH_FILE)
+    # Im Umkreis-Modus fehlen dem Bestand die Ladepunkte ohne Lokal - ein
+    # neues Lokal daneben wuerde ein Diff nie zu einem Treffer machen.
+    incremental = INCREMENTAL and not AROUND_FILTER
+    if PBF_FILE:
+        # Der Extrakt ersetzt den vollen Scan; sein Stand taugt als Basis
+        # fuer spaetere inkrementelle Laeufe gegen Overpass.
+        store = None
+        result = scan_pbf(PBF_FILE)
+        if result is None:
+            sys.exit(1)
+    else:
+        store = load_store() if incremental else None
+        result = scan_incremental(store) if store else None
+        if result is None:
+            store = None
+            result = scan_strips(strips)
+    all_chargers, all_restaurants, failed, osm_base = result
+    HEALTH.save(HEALTH_FILE)
 
     print(f"\nRohdaten: {len(all_chargers)} Ladepunkte, "
           f"{len(all_restaurants)} Lokale")
@@ -554,34 +2979,50 @@ def main():
     # doppelt geliefert werden. Erst nach OSM-ID entdoppeln, dann raeumlich.
     unique = {}
     for c in all_chargers:
-        unique[(c.get("type"), c.get("id"))] = c
-    all_chargers = deduplicate(list(unique.values()))
-    print(f"Nach Entdopplung: {len(all_chargers)} Ladepunkte")
-
-    matches, seen_ids = [], set()
-    for m in match_pairs(all_chargers, all_restaurants):
-        uid = m.pop("unique_id")
-        if uid not in seen_ids:
-            seen_ids.add(uid)
-            matches.append(m)
+        unique[(c.type, c.id)] = c
+    all_chargers_raw = list(unique.values())
+    source = "pbf" if PBF_FILE else "incremental" if store else "strips"
+    result = db_update(all_chargers_raw, all_restaurants, osm_base,
+                       complete=not failed, source=source)
+    if result is not None:
+        kept, matches = result
+        print(f"Nach Entdopplung: {kept} Ladepunkte")
+    else:
+        all_chargers = deduplicate(all_chargers_raw)
+        print(f"Nach Entdopplung: {len(all_chargers)} Ladepunkte")
+
+        matches, seen_ids = [], set()
+        for m in match_pairs(all_chargers, all_restaurants):
+            uid = m.pop("unique_id")
+            if uid not in seen_ids:
+                seen_ids.add(uid)
+                matches.append(m)
 
     duration = time.time() - start
-    ok_strips = len(strips) - len(failed)
+    ok_strips = len(strips) - len({job.strip for job in failed})
     ratio = ok_strips / len(strips) if strips else 0
 
     print(f"\nFertig in {int(duration // 60)}m {int(duration % 60)}s")
-    print(f"Streifen ok: {ok_strips}/{len(strips)} ({ratio:.0%})")
-    print(f"Requests: {_stats['requests']} | Retries: {_stats['retries']} | "
-          f"429: {_stats['rate_limited']} | Timeouts: {_stats['timeouts']} | "
-          f"Cache: {_stats['cache_hits']}")
+    # Aus dem Extrakt gibt es weder Streifen noch Requests - die Datei wird
+    # ganz gelesen oder der Lauf endet oben schon.
+    if PBF_FILE:
+        print(f"Quelle: {os.path.basename(PBF_FILE)} "
+              f"({_stats['pbf_objects']} Objekte)")
+    else:
+        print(f"Streifen ok: {ok_strips}/{len(strips)} ({ratio:.0%})")
+        print(f"Requests: {_stats['requests']} | Retries: {_stats['retries']} | "
+              f"429: {_stats['rate_limited']} | Timeouts: {_stats['timeouts']} | "
+              f"Cache: {_stats['cache_hits']} | "
+              f"Hedges: {_stats['hedged']} ({_stats['hedge_wins']} gewonnen)")
+        for line in HEALTH.report():
+            print(line)
 
     # --- Speichern ---
     old_count = 0
     if os.path.exists(OUTPUT_FILENAME):
         try:
-            with open(OUTPUT_FILENAME, "r", encoding="utf-8") as f:
-                old_count = len(json.load(f))
-        except (OSError, ValueError):
+            old_count = len(load_output())
+        except (OSError, ValueError, KeyError):
             pass
 
     new_count = len(matches)
@@ -590,7 +3031,7 @@ def main():
     print(f"Alt: {old_count} -> Neu: {new_count} (Diff: {diff:+d})")
 
     abort_reason = None
-    if ratio < MIN_SUCCESS_RATIO:
+    if not PBF_FILE and ratio < MIN_SUCCESS_RATIO:
         abort_reason = f"nur {ratio:.0%} der Streifen erfolgreich"
     elif old_count > 0 and new_count < old_count * 0.5:
         abort_reason = "Ergebnis weniger als halb so gross wie zuvor"
@@ -603,27 +3044,28 @@ def main():
                 f.write(f"stats_msg=Lauf abgebrochen: {abort_reason}\n")
         sys.exit(1)
 
-    tmp = OUTPUT_FILENAME + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(matches, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, OUTPUT_FILENAME)
-    print(f"Gespeichert: {OUTPUT_FILENAME}")
+    sizes = write_output(matches, osm_base)
+    print("Gespeichert: " + ", ".join(
+        f"{path} ({size / 1024:.0f} KB)" for path, size in sizes.items()))
 
-    monate = ["Januar", "Februar", "März", "April", "Mai", "Juni", "Juli",
-              "August", "September", "Oktober", "November", "Dezember"]
-    now = datetime.datetime.now()
-    date_str = f"{monate[now.month - 1]} {now.year}"
-    with open("meta.js", "w", encoding="utf-8") as f:
-        f.write(f'const standDaten = "{date_str}";')
-    print(f"meta.js: {date_str}")
+    # Bestand nur nach vollstaendigem Lauf merken, sonst fehlen dem
+    # naechsten inkrementellen Lauf ganze Streifen.
+    if incremental and not failed and osm_base:
+        save_store(all_chargers_raw + all_restaurants, osm_base,
+                   created=store["created"] if store else None)
+        print(f"{STORE_FILE}: Stand {osm_base}")
 
     if "GITHUB_STEP_SUMMARY" in os.environ:
         with open(os.environ["GITHUB_STEP_SUMMARY"], "a", encoding="utf-8") as f:
             f.write("# Karten-Update\n\n| Kennzahl | Wert |\n|---|---|\n")
             f.write(f"| Vorher | {old_count} |\n| Nachher | {new_count} |\n")
             f.write(f"| Differenz | **{diff:+d}** |\n")
-            f.write(f"| Streifen ok | {ok_strips}/{len(strips)} |\n")
-            f.write(f"| Requests | {_stats['requests']} |\n")
+            if PBF_FILE:
+                f.write(f"| Quelle | {os.path.basename(PBF_FILE)} |\n")
+                f.write(f"| Objekte | {_stats['pbf_objects']} |\n")
+            else:
+                f.write(f"| Streifen ok | {ok_strips}/{len(strips)} |\n")
+                f.write(f"| Requests | {_stats['requests']} |\n")
             f.write(f"| Laufzeit | {int(duration // 60)}m {int(duration % 60)}s |\n")
 
     if "GITHUB_OUTPUT" in os.environ:
@@ -633,4 +3075,10 @@ def main():
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["cache"]:
+        sys.exit(cache_cli(sys.argv[2:]))
+    if sys.argv[1:2] == ["db"]:
+        sys.exit(db_cli(sys.argv[2:]))
+    if sys.argv[1:2] == ["pbf"] and len(sys.argv) == 3:
+        PBF_FILE = sys.argv[2]
     main()
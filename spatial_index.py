@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Raeumlicher Index fuer Punktabfragen im Umkreis (Ladestoppfinder).
+
+Ersetzt die Ad-hoc-Raster in deduplicate() und match_pairs(), deren feste
+Zellgroessen in Grad nur fuer genau einen Radius und nur in Deutschland
+gepasst haben. Hier wird die Zellgroesse aus dem Suchradius abgeleitet,
+und eine Abfrage deckt immer das komplette Rechteck um den Radius ab -
+auch wenn Laengengrade Richtung Norden schmaler werden. Das Ergebnis ist
+damit fuer jeden Radius und jede Breite exakt (Haversine).
+
+    index = SpatialIndex(cell_meters=300)     # oder SpatialIndex.build(...)
+    index.add(lat, lon, item)
+    index.within(lat, lon, 300)      -> [(dist, item), ...] nach Abstand
+    index.nearest(lat, lon, k=3)     -> die k naechsten (dist, item)
+    index.pairs_within(lats, lons, r) -> alle Paare als NumPy-Arrays
+
+Alles ausser pairs_within() kommt ohne NumPy aus.
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS = 6371000
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2)
+         * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return EARTH_RADIUS * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """haversine() elementweise fuer NumPy-Arrays (mit Broadcasting)."""
+    lat1, lon1 = numpy.radians(lat1), numpy.radians(lon1)
+    lat2, lon2 = numpy.radians(lat2), numpy.radians(lon2)
+    a = (numpy.sin((lat2 - lat1) / 2) ** 2
+         + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2)
+    return EARTH_RADIUS * 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
+
+
+def _span(radius):
+    """Radius in Grad Breite."""
+    return math.degrees(radius / EARTH_RADIUS)
+
+
+def _lon_span(radius, lat):
+    """
+    Radius in Grad Laenge an der polnaechsten Stelle des Suchrechtecks -
+    dort ist ein Grad Laenge am kuerzesten, das Rechteck also am breitesten.
+    """
+    worst = min(abs(lat) + _span(radius), 89.9)
+    return math.degrees(radius / (EARTH_RADIUS * math.cos(math.radians(worst))))
+
+
+class SpatialIndex:
+    """
+    Raster in Grad: Zellhoehe = cell_meters, Zellbreite so, dass eine Zelle
+    bei ref_lat etwa quadratisch ist. Abweichungen von ref_lat kosten nur
+    Tempo (mehr Zellen je Abfrage), nie Treffer.
+    """
+
+    def __init__(self, cell_meters, ref_lat=51.0):
+        self.cell_h = _span(cell_meters)
+        self.cell_w = self.cell_h / math.cos(math.radians(min(abs(ref_lat), 80.0)))
+        # Das Raster fuer Einzelabfragen entsteht erst bei Bedarf - wer nur
+        # pairs_within() nutzt, braucht es nie.
+        self._cells = {}
+        self.lats, self.lons, self.items = [], [], []
+        self._sorted = None
+
+    @classmethod
+    def build(cls, lats, lons, items, cell_meters):
+        """Index aus parallelen Listen; ref_lat ist die mittlere Breite."""
+        ref = sum(lats) / len(lats) if len(lats) else 51.0
+        index = cls(cell_meters, ref_lat=ref)
+        index.lats, index.lons, index.items = list(lats), list(lons), list(items)
+        index._cells = None
+        return index
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_h), math.floor(lon / self.cell_w)
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            self._cells = {}
+            for idx, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+                self._cells.setdefault(self._cell(lat, lon), []).append(idx)
+        return self._cells
+
+    def add(self, lat, lon, item):
+        cells = self.cells
+        idx = len(self.items)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.items.append(item)
+        cells.setdefault(self._cell(lat, lon), []).append(idx)
+        self._sorted = None
+        return idx
+
+    def _candidates(self, lat, lon, radius):
+        cells = self.cells
+        dlat, dlon = _span(radius), _lon_span(radius, lat)
+        y0, x0 = self._cell(lat - dlat, lon - dlon)
+        y1, x1 = self._cell(lat + dlat, lon + dlon)
+        found = []
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                hit = cells.get((y, x))
+                if hit:
+                    found.extend(hit)
+        return found
+
+    def within(self, lat, lon, radius, strict=False):
+        """
+        Alle Eintraege im Umkreis als (dist, item), sortiert nach Abstand;
+        bei Gleichstand gewinnt der frueher eingefuegte. strict schliesst
+        Treffer genau auf dem Radius aus.
+        """
+        found = []
+        lats, lons = self.lats, self.lons
+        for idx in self._candidates(lat, lon, radius):
+            dist = haversine(lat, lon, lats[idx], lons[idx])
+            if dist < radius or (dist == radius and not strict):
+                found.append((dist, idx))
+        found.sort()
+        return [(dist, self.items[idx]) for dist, idx in found]
+
+    def any_within(self, lat, lon, radius, strict=False):
+        """Schneller als within(), wenn nur die Existenz zaehlt."""
+        lats, lons = self.lats, self.lons
+        for idx in self._candidates(lat, lon, radius):
+            dist = haversine(lat, lon, lats[idx], lons[idx])
+            if dist < radius or (dist == radius and not strict):
+                return True
+        return False
+
+    def nearest(self, lat, lon, k=1, max_radius=None):
+        """
+        Die k naechsten Eintraege als (dist, item), sortiert wie within();
+        mit max_radius nur solche bis dorthin. Die Suche waechst Zellring
+        um Zellring, bis der abgedeckte Bereich k Treffer sicher enthaelt.
+        Wird das Quadrat der Ringe groesser als das belegte Raster, zaehlt
+        einfach jeder Eintrag - weit verstreute Punkte kosten so hoechstens
+        einen Durchlauf ueber alle.
+        """
+        if k <= 0 or not self.items:
+            return []
+        cells = self.cells
+        lats, lons = self.lats, self.lons
+        cy, cx = self._cell(lat, lon)
+        found, ring = [], 0
+        while (2 * ring + 1) ** 2 <= len(cells):
+            for cell in _ring(cy, cx, ring):
+                for idx in cells.get(cell, ()):
+                    found.append((haversine(lat, lon, lats[idx], lons[idx]), idx))
+            safe = self._covered(lat, lon, cy, cx, ring)
+            if max_radius is not None and safe > max_radius:
+                break
+            if sum(1 for dist, _ in found if dist < safe) >= k:
+                break
+            ring += 1
+        else:
+            found = [(haversine(lat, lon, lats[idx], lons[idx]), idx)
+                     for idx in range(len(self.items))]
+        if max_radius is not None:
+            found = [hit for hit in found if hit[0] <= max_radius]
+        found.sort()
+        return [(dist, self.items[idx]) for dist, idx in found[:k]]
+
+    def _covered(self, lat, lon, cy, cx, ring):
+        """
+        Abstand, unter dem jeder Eintrag in den Ringen 0..ring liegt: der
+        kuerzere Weg aus dem Zellquadrat hinaus, nach Norden/Sueden oder
+        bis zum naechsten Meridian ausserhalb.
+        """
+        north = min(lat - (cy - ring) * self.cell_h, (cy + ring + 1) * self.cell_h - lat)
+        east = min(lon - (cx - ring) * self.cell_w, (cx + ring + 1) * self.cell_w - lon)
+        to_meridian = math.asin(math.cos(math.radians(lat))
+                                * math.sin(math.radians(min(east, 90.0))))
+        return EARTH_RADIUS * min(math.radians(north), to_meridian)
+
+    # --------------------------------------------------------
+    # Gebuendelte Abfragen mit NumPy
+    # --------------------------------------------------------
+
+    def _arrays(self):
+        if self._sorted is None:
+            lat = numpy.array(self.lats, dtype=float)
+            lon = numpy.array(self.lons, dtype=float)
+            rows = numpy.floor(lat / self.cell_h).astype(numpy.int64)
+            cols = numpy.floor(lon / self.cell_w).astype(numpy.int64)
+            keys = _keys(rows, cols)
+            order = numpy.argsort(keys, kind="stable")
+            self._sorted = (lat, lon, keys[order], order)
+        return self._sorted
+
+    def pairs_within(self, lats, lons, radius, strict=False):
+        """
+        Alle Paare (Abfragepunkt q, Eintrag t) im Umkreis auf einmal.
+        Rueckgabe: Arrays (q, t, dist), sortiert nach q, dann Abstand,
+        dann Einfuegereihenfolge - also dieselbe Reihenfolge wie within().
+        """
+        lats = numpy.asarray(lats, dtype=float)
+        lons = numpy.asarray(lons, dtype=float)
+        empty = (numpy.zeros(0, dtype=numpy.int64),) * 2 + (numpy.zeros(0),)
+        if not len(lats) or not self.items:
+            return empty
+        t_lat, t_lon, keys, order = self._arrays()
+
+        # Suchrechteck je Abfragepunkt in Zellen. Die Zahl der Zellen
+        # schwankt mit der Breite, deshalb laufen alle Punkte ueber das
+        # groesste Rechteck und ueberzaehlige Zellen werden ausmaskiert.
+        dlat = _span(radius)
+        worst = numpy.minimum(numpy.abs(lats) + dlat, 89.9)
+        dlon = numpy.degrees(radius / (EARTH_RADIUS * numpy.cos(numpy.radians(worst))))
+        y0 = numpy.floor((lats - dlat) / self.cell_h).astype(numpy.int64)
+        y1 = numpy.floor((lats + dlat) / self.cell_h).astype(numpy.int64)
+        x0 = numpy.floor((lons - dlon) / self.cell_w).astype(numpy.int64)
+        x1 = numpy.floor((lons + dlon) / self.cell_w).astype(numpy.int64)
+
+        # Sortierte Suchschluessel machen searchsorted deutlich schneller;
+        # eine konstante Verschiebung aendert die Reihenfolge nicht.
+        q_order = numpy.argsort(_keys(y0, x0), kind="stable")
+        qs, ts = [], []
+        for oy in range(int((y1 - y0).max()) + 1):
+            for ox in range(int((x1 - x0).max()) + 1):
+                live = q_order[(y0[q_order] + oy <= y1[q_order])
+                               & (x0[q_order] + ox <= x1[q_order])]
+                wanted = _keys(y0[live] + oy, x0[live] + ox)
+                lo = numpy.searchsorted(keys, wanted, "left")
+                counts = numpy.searchsorted(keys, wanted, "right") - lo
+                total = int(counts.sum())
+                if not total:
+                    continue
+                starts = lo - (numpy.cumsum(counts) - counts)
+                pos = numpy.repeat(starts, counts) + numpy.arange(total)
+                qs.append(numpy.repeat(live, counts))
+                ts.append(order[pos])
+        if not qs:
+            return empty
+
+        q, t = numpy.concatenate(qs), numpy.concatenate(ts)
+        dist = haversine_np(lats[q], lons[q], t_lat[t], t_lon[t])
+        inside = dist < radius if strict else dist <= radius
+        q, t, dist = q[inside], t[inside], dist[inside]
+        order = numpy.lexsort((t, dist, q))
+        return q[order], t[order], dist[order]
+
+
+def _ring(cy, cx, ring):
+    """Zellen mit Schachbrett-Abstand ring um (cy, cx)."""
+    if ring == 0:
+        yield cy, cx
+        return
+    for x in range(cx - ring, cx + ring + 1):
+        yield cy - ring, x
+        yield cy + ring, x
+    for y in range(cy - ring + 1, cy + ring):
+        yield y, cx - ring
+        yield y, cx + ring
+
+
+def _keys(rows, cols):
+    """Zeile/Spalte als eine sortierbare int64-Zahl."""
+    return (rows + (1 << 26)) * (1 << 27) + (cols + (1 << 26))
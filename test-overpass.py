@@ -17,6 +17,7 @@ Aufruf:
 Im GitHub-Workflow als eigener Step einhaengen, um die Runner-IP zu testen.
 """
 
+import os
 import time
 import requests
 
@@ -34,6 +35,9 @@ ENDPOINTS = [
     "https://overpass.osm.jp/api/interpreter",
     "https://overpass.osm.ch/api/interpreter",
 ]
+# z.B. gegen mock-overpass.py: OVERPASS_ENDPOINTS=http://127.0.0.1:8555/api/interpreter
+if os.environ.get("OVERPASS_ENDPOINTS"):
+    ENDPOINTS = os.environ["OVERPASS_ENDPOINTS"].split()
 
 USER_AGENT = (
     "ladestoppfinder/2.0 (Diagnose; +https://github.com/b-dx2/ladestoppfinder)"